@@ -1,6 +1,7 @@
 # config/settings.py
 
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -34,13 +35,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # Чтения с реплик БД и закрепление за основной БД после записи (posts.replicas)
+    "posts.replicas.ReplicaMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware", # Важно для сессий
-    # --- ДОБАВЛЕНО (Опционально): Кеширование всей страницы ---
-    # Если хочешь кешировать страницы целиком (требует осторожности с динамическим контентом)
-    # 'django.middleware.cache.UpdateCacheMiddleware',
+    # Кеш страниц целиком - не middleware, а posts.pagecache.AsyncPageCacheMixin в представлениях
+    # (только анонимные запросы, точечный сброс по суррогатным ключам)
     "django.middleware.common.CommonMiddleware",
-    # 'django.middleware.cache.FetchFromCacheMiddleware', # Должен быть после UpdateCacheMiddleware
-    # --- КОНЕЦ ДОБАВЛЕННОГО ---
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware", # Стандартный middleware
     "django.contrib.messages.middleware.MessageMiddleware",
@@ -154,10 +154,67 @@ else:
     EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD", "")
     DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER or 'noreply@yourdomain.com')
 
+# --- Лента подписок (posts.timeline) ---
+FEED_TIMELINE_SIZE = 500 # Сколько последних записей хранится в ленте каждого пользователя
+FEED_FANOUT_MAX_FOLLOWERS = 10000 # Авторы с таким числом подписчиков подмешиваются в ленту при чтении (posts.feed)
+FEED_AUTHOR_CACHE_SIZE = 200 # Сколько последних постов автора держать в кеше для чтения ленты
+FEED_AUTHOR_CACHE_TIMEOUT = 3600 # Время жизни кеша последних постов автора, секунд
+
+# --- Индекс категорий (posts.categories) ---
+CATEGORY_INDEX_TIMEOUT = 3600 # Страховочный TTL; кеш сбрасывается сигналами при изменениях
+
+# --- Кеш отрисованных фрагментов (posts.fragments) ---
+FRAGMENT_CACHE_TIMEOUT = 86400 # Версия в ключе меняется при правке/голосе/комментарии; TTL ограничивает устаревание имени/аватара автора
+
+# --- Кеш страниц для анонимных читателей (posts.pagecache) ---
+PAGE_CACHE_TIMEOUT = 600 # Сброс точечный (по ключам постов, авторов, категорий); TTL - страховка
+
+# --- Полнотекстовый поиск (posts.search) ---
+SEARCH_MAX_RESULTS = 200 # Сколько лучших совпадений из индекса проверяется на видимость и показывается
+SEARCH_MAX_PAGES = 5 # Сколько пачек по SEARCH_MAX_RESULTS из индекса проверяется на видимость за один поиск
+SEARCH_RESULTS_PER_PAGE = 10 # Карточек на страницу результатов (дальше - кнопка "Показать еще")
+
+# --- Админка для больших таблиц (posts.scalable_admin) ---
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000 # С такого числа строк (по статистике СУБД) нефильтрованный список не считается COUNT(*)
+ADMIN_DATE_HIERARCHY_MAX_ROWS = 50000 # Больше строк в выборке - date_hierarchy строится по диапазону MIN/MAX без DISTINCT
+
+# --- Сортировки hot/top_day/top_week (posts.ranking) ---
+RANKING_HOT_DECAY_SECONDS = 45000 # За столько секунд новизна поста весит как десятикратный баланс голосов
+
+# --- Отложенная запись голосов (posts.votebuffer) ---
+VOTE_WRITE_BEHIND = False # True - голоса пишутся в Redis и переносятся в БД воркером flush_votes (нужен кеш django_redis)
+
+# --- Живые обновления поста по SSE (posts.live) ---
+LIVE_HEARTBEAT_SECONDS = 15 # Пинг простаивающего потока, чтобы прокси не закрывали соединение
+LIVE_BUFFER_SIZE = 100 # Неотправленных событий на поток; при переполнении клиент перечитывает комментарии
+LIVE_STREAM_MAX_SECONDS = 600 # Предельная длительность потока (Django 4.2 не замечает разрыв), затем переподключение
+
+# --- Реплики БД для чтения (posts.replicas) ---
+# Локально: DJANGO_DB_REPLICAS="db_replica.sqlite3" - SQLite-копии основной БД, их обновляет copy_sqlite_replicas --loop
+for _number, _name in enumerate(os.environ.get("DJANGO_DB_REPLICAS", "").split(), start=1):
+    DATABASES[f"replica{_number}"] = {**DATABASES["default"], "NAME": BASE_DIR / _name, "TEST": {"MIRROR": "default"}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica")]
+DATABASE_ROUTERS = ["posts.replicas.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = 15 # После записи браузер читает с основной БД столько секунд; больше REPLICA_MAX_LAG_SECONDS
+REPLICA_MAX_LAG_SECONDS = 10 # Реплика с большим отставанием (или недоступная) не используется
+REPLICA_CHECK_INTERVAL = 5 # Как часто процесс перемеряет отставание реплик
+
+# --- Граф подписок в Redis (users.graph) ---
+FOLLOW_GRAPH_TIMEOUT = 86400 # Время жизни множеств подписок/подписчиков; расхождения с БД исправляются перезагрузкой
+
 # --- Настройки сторонних приложений ---
 TAILWIND_APP_NAME = "theme"
 INTERNAL_IPS = ["127.0.0.1", ] # Для debug_toolbar
 NPM_BIN_PATH = r"C:\Program Files\nodejs\npm.cmd" # Если нужно
 DEBUG_TOOLBAR_CONFIG = { # Для debug_toolbar
     'SHOW_TOOLBAR_CALLBACK': lambda request: DEBUG,
-}
\ No newline at end of file
+}
+
+# --- Тесты (manage.py test, pytest): без debug_toolbar и без внешнего Redis ---
+# Ветки django_redis (граф подписок, буфер голосов, брокер SSE) тесты включают сами через fakeredis
+TESTING = sys.argv[1:2] == ["test"] or "PYTEST_VERSION" in os.environ
+if TESTING:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app != "debug_toolbar"]
+    MIDDLEWARE = [middleware for middleware in MIDDLEWARE if not middleware.startswith("debug_toolbar.")]
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]  # Быстрое создание пользователей
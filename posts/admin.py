@@ -2,12 +2,13 @@
 
 from django.contrib import admin
 from django.contrib.contenttypes.admin import GenericTabularInline
-from django.db.models import Count, Q
+from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
 from django.utils.html import format_html
-from django.utils import timezone # Импортируем timezone
 
+from . import categories, search, votes
 from .models import Category, Comment, Post, Vote
+from .scalable_admin import AutocompleteFilter, ScalableAdminMixin
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -15,17 +16,11 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
 
-    @admin.display(description='Кол-во постов', ordering='posts_count')
+    @admin.display(description='Кол-во постов')
     def post_count(self, obj):
-        return obj.posts_count
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        # Считаем опубликованные посты, время которых наступило
-        queryset = queryset.annotate(
-            posts_count=Count('posts', filter=Q(posts__is_published=True, posts__published_at__lte=timezone.now()))
-        )
-        return queryset
+        # Число опубликованных постов - из кешированного индекса категорий, без COUNT по постам
+        category = categories.get_index().by_id.get(obj.pk)
+        return category.num_posts if category else 0
 
 class CommentInline(admin.TabularInline):
     model = Comment
@@ -49,33 +44,37 @@ class VoteInline(GenericTabularInline):
     def has_change_permission(self, request, obj=None): return False
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = (
         'title',
         'author_link',
         'category_link',
         'visibility', # Отображаем видимость
         'is_published',
+        'status',
         'published_at',
         'display_vote_count',
         'comment_count',
     )
     # Добавляем visibility в фильтр
-    list_filter = ('is_published', 'visibility', 'category', 'author', 'created_at', 'published_at')
-    search_fields = ('title', 'content', 'author__username', 'category__name')
+    list_filter = ('is_published', 'status', 'visibility', 'category', ('author', AutocompleteFilter), 'created_at', 'published_at')
+    # Заголовок и текст ищутся по полнотекстовому индексу (get_search_results), без icontains по всей таблице
+    search_fields = ('author__username', 'category__name')
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'published_at'
     ordering = ('-published_at', '-created_at')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'status', 'likes_count', 'dislikes_count', 'comments_count')
     list_select_related = ('author', 'category')
     autocomplete_fields = ['author', 'category']
+    actions = ['rebuild_counters']
 
     # Указываем поля для формы редактирования поста в админке
     # Убираем is_published и published_at, т.к. они теперь управляются формой PostForm
     # (хотя в админке стандартная ModelForm, не PostForm, поэтому можно вернуть для прямого управления)
     fieldsets = (
         (None, {'fields': ('title', 'slug', 'author', 'content', 'category', 'visibility')}), # Добавили visibility
-        ('Статус и время', {'fields': ('is_published', 'published_at', 'created_at')}), # Добавили created_at (readonly)
+        ('Статус и время', {'fields': ('is_published', 'published_at', 'status', 'created_at')}), # Добавили created_at (readonly)
+        ('Счетчики', {'fields': ('likes_count', 'dislikes_count', 'comments_count')}),
     )
     inlines = [CommentInline, VoteInline]
 
@@ -95,33 +94,63 @@ class PostAdmin(admin.ModelAdmin):
 
     @admin.display(description='Голоса (Л/Д)', ordering='likes_count')
     def display_vote_count(self, obj):
-        return f"{getattr(obj, 'likes_count', 0)} / {getattr(obj, 'dislikes_count', 0)}"
+        return f"{obj.likes_count} / {obj.dislikes_count}"
 
     @admin.display(description='Комм.', ordering='comments_count')
     def comment_count(self, obj):
-        return getattr(obj, 'comments_count', 0)
+        return obj.comments_count
 
     # Убираем save_formset, так как автор для инлайн-комментариев не нужен
     # (в админке комментарии может добавлять только админ)
 
+    def save_related(self, request, form, formsets, change):
+        # Инлайны могут добавлять/удалять комментарии (с каскадом ответов) и удалять голоса
+        super().save_related(request, form, formsets, change)
+        # PostVote переписывается, только если инлайн голосов действительно удалил строки
+        if any(formset.model is Vote and formset.deleted_objects for formset in formsets):
+            votes.resync([form.instance.pk])
+        Post.objects.rebuild_counters([form.instance.pk])
+
+    @admin.action(description='Пересчитать счетчики голосов и комментариев')
+    def rebuild_counters(self, request, queryset):
+        updated = Post.objects.rebuild_counters(queryset.values_list('pk', flat=True))
+        self.message_user(request, f"Счетчики пересчитаны для постов: {updated}.")
+
     def get_queryset(self, request):
-        queryset = super().get_queryset(request).select_related('author', 'category')
-        queryset = queryset.annotate(
-            likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-            dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
-            comments_count=Count('comments', distinct=True),
-        )
-        return queryset
+        # Счетчики - колонки Post, поэтому без аннотаций по Vote/Comment
+        return super().get_queryset(request).select_related('author', 'category')
+
+    def get_search_results(self, request, queryset, search_term):
+        matched, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            matched |= queryset.filter(pk__in=search.match_ids(search_term))
+        return matched, may_have_duplicates
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('author_link', 'post_link', 'content_preview', 'created_at', 'parent_link')
-    list_filter = ('created_at', 'author')
+    list_filter = ('created_at', ('author', AutocompleteFilter))
     search_fields = ('content', 'post__title', 'author__username', 'parent__author__username')
     readonly_fields = ('created_at',)
     autocomplete_fields = ['post', 'author', 'parent']
     list_select_related = ('author', 'post', 'parent')
 
+    # --- Синхронизация Post.comments_count при правках из админки ---
+    def save_model(self, request, obj, form, change):
+        old_post_id = Comment.objects.filter(pk=obj.pk).values_list('post_id', flat=True).first() if change else None
+        super().save_model(request, obj, form, change)
+        Post.objects.rebuild_counters({obj.post_id, old_post_id} - {None})
+
+    def delete_model(self, request, obj):
+        post_id = obj.post_id
+        super().delete_model(request, obj)
+        Post.objects.rebuild_counters([post_id])
+
+    def delete_queryset(self, request, queryset):
+        post_ids = set(queryset.values_list('post_id', flat=True))
+        super().delete_queryset(request, queryset)
+        Post.objects.rebuild_counters(post_ids)
+
     @admin.display(description='Автор', ordering='author__username')
     def author_link(self, obj):
         if obj.author:
@@ -151,7 +180,7 @@ class CommentAdmin(admin.ModelAdmin):
         return "-"
 
 @admin.register(Vote)
-class VoteAdmin(admin.ModelAdmin):
+class VoteAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('user_link', 'vote_type', 'content_object_link', 'created_at')
     list_filter = ('vote_type', 'created_at', 'content_type')
     search_fields = ('user__username', 'content_type__model')
@@ -161,6 +190,26 @@ class VoteAdmin(admin.ModelAdmin):
     def has_add_permission(self, request): return False
     def has_change_permission(self, request, obj=None): return False
 
+    def get_queryset(self, request):
+        # Объекты голосов страницы загружаются пачкой на каждый тип (prefetch GenericForeignKey), а не по строке
+        return super().get_queryset(request).prefetch_related('content_object')
+
+    # --- Синхронизация PostVote и счетчиков Post при удалении голосов из админки ---
+    def _voted_post_ids(self, queryset):
+        content_type = ContentType.objects.get_for_model(Post)
+        return set(queryset.filter(content_type=content_type).values_list('object_id', flat=True))
+
+    def delete_model(self, request, obj):
+        post_ids = self._voted_post_ids(Vote.objects.filter(pk=obj.pk))
+        super().delete_model(request, obj)
+        votes.resync(post_ids)
+        Post.objects.rebuild_counters(post_ids)
+
+    def delete_queryset(self, request, queryset):
+        post_ids = self._voted_post_ids(queryset)
+        super().delete_queryset(request, queryset)
+        Post.objects.rebuild_counters(post_ids)
+
     @admin.display(description='Пользователь', ordering='user__username')
     def user_link(self, obj):
         if obj.user:
@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'posts'
-    verbose_name = "Посты, Комментарии, Голоса"
\ No newline at end of file
+    verbose_name = "Посты, Комментарии, Голоса"
+
+    def ready(self):
+        """Подключаем обработчики сигналов (ленты подписчиков и т.п.)."""
+        import posts.signals # noqa: F401
\ No newline at end of file
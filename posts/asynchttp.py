@@ -0,0 +1,70 @@
+# posts/asynchttp.py
+"""
+Помощники асинхронных представлений (ASGI) для Django 4.2.
+
+В 4.2 login_required / require_http_methods и get_object_or_404 синхронные, а request.user -
+ленивый объект, который при первом обращении читает сессию и пользователя из БД (в async-коде это
+SynchronousOnlyOperation). Здесь их асинхронные аналоги: пользователь загружается один раз за
+запрос, без cookie сессии - вовсе без обращения к БД.
+
+Ограничение 4.2: async-методы ORM и кеша (aget, aexists, cache.aget...) внутри выполняют
+синхронный код через sync_to_async, а transaction.atomic доступен только синхронно. Поэтому
+запись в транзакции представления выполняют одним переходом в поток (sync_to_async).
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth import REDIRECT_FIELD_NAME
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed
+from django.shortcuts import resolve_url
+
+
+def _load_user(request):
+    return request.user.is_authenticated
+
+
+async def aget_user(request):
+    """request.user, загруженный без синхронного доступа к БД из event loop."""
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        # Сессия и пользователь читаются из БД; SimpleLazyObject запоминает результат на запрос
+        await sync_to_async(_load_user)(request)
+    return request.user
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    """Асинхронный get_object_or_404 (queryset - менеджер или QuerySet)."""
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"{queryset.model._meta.object_name} не найден.")
+
+
+def require_http_methods(request_method_list):
+    """Асинхронный require_http_methods: 405 для остальных методов."""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in request_method_list:
+                return HttpResponseNotAllowed(request_method_list)
+            return await view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+require_GET = require_http_methods(["GET"])
+require_POST = require_http_methods(["POST"])
+
+
+def login_required(view):
+    """Асинхронный login_required: анонимных отправляет на LOGIN_URL с ?next=."""
+    @wraps(view)
+    async def inner(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), resolve_url(settings.LOGIN_URL), REDIRECT_FIELD_NAME)
+        return await view(request, *args, **kwargs)
+    return inner
@@ -0,0 +1,59 @@
+# posts/audience.py
+"""
+Проверка видимости постов для одного зрителя в памяти (та же логика, что в движке
+PostManager.get_visible_posts_for_user). Подписки зрителя загружаются одним запросом и только
+если встретился пост "для подписчиков"; объект живет на запросе (for_request), поэтому
+любое число проверок за запрос стоит не больше одного запроса.
+"""
+
+from django.utils.functional import cached_property
+
+from users.models import Profile
+
+
+class Audience:
+    def __init__(self, user):
+        self.user = user
+        self.user_id = user.pk if user is not None and user.is_authenticated else None
+
+    def _following_queryset(self):
+        Follow = Profile.following.through
+        return Follow.objects.filter(from_profile__user_id=self.user_id).values_list('to_profile__user_id', flat=True)
+
+    @cached_property
+    def following_ids(self):
+        """user_id авторов, на которых подписан зритель."""
+        if self.user_id is None:
+            return frozenset()
+        return frozenset(self._following_queryset())
+
+    def can_view(self, post):
+        # Автор видит свои посты в любом статусе; сравниваем author_id, не загружая автора
+        if self.user_id is not None and post.author_id == self.user_id:
+            return True
+        if post.status != post.STATUS_PUBLISHED:
+            return False
+        if post.visibility == post.VISIBILITY_PUBLIC:
+            return True
+        if post.visibility == post.VISIBILITY_FOLLOWERS:
+            return post.author_id in self.following_ids
+        return False
+
+    async def acan_view(self, post):
+        """can_view для async-представлений: подписки, если нужны, читаются асинхронным запросом."""
+        if (post.visibility == post.VISIBILITY_FOLLOWERS and self.user_id is not None
+                and 'following_ids' not in self.__dict__):
+            self.__dict__['following_ids'] = frozenset([pk async for pk in self._following_queryset()])
+        return self.can_view(post)
+
+    def filter_visible(self, posts):
+        """Посты, которые зритель может открыть, в исходном порядке."""
+        return [post for post in posts if self.can_view(post)]
+
+
+def for_request(request):
+    """Audience текущего пользователя, одна на запрос."""
+    audience = getattr(request, '_audience', None)
+    if audience is None:
+        audience = request._audience = Audience(request.user)
+    return audience
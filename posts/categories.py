@@ -0,0 +1,52 @@
+# posts/categories.py
+"""
+Кешированный индекс категорий: все категории (id, slug, name) с числом опубликованных постов
+(num_posts). Один запрос на построение, дальше - чтение из кеша; сбрасывается сигналами
+(публикация/снятие, смена категории, удаление поста, правка категорий - см. posts.signals).
+Контекст-процессор отдает индекс лениво, поэтому фрагменты без категорий не платят ничего.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, Q
+
+from . import pagecache
+from .models import Category, Post
+
+CACHE_KEY = 'categories:index'
+
+
+class CategoryIndex:
+    def __init__(self, categories):
+        self.categories = categories  # Category с атрибутом num_posts, по имени
+        self.by_slug = {category.slug: category for category in categories}
+        self.by_id = {category.pk: category for category in categories}
+
+    def active(self):
+        """Категории, в которых есть опубликованные посты."""
+        return [category for category in self.categories if category.num_posts]
+
+    def choices(self):
+        return [(category.pk, category.name) for category in self.categories]
+
+
+def build():
+    # Общий кеш на CATEGORY_INDEX_TIMEOUT строится с default: с реплики попали бы данные до сброса (posts.replicas)
+    categories = Category.objects.using(DEFAULT_DB_ALIAS).annotate(
+        num_posts=Count('posts', filter=Q(posts__status=Post.STATUS_PUBLISHED))
+    ).order_by('name')
+    return CategoryIndex(list(categories))
+
+
+def get_index():
+    index = cache.get(CACHE_KEY)
+    if index is None:
+        index = build()
+        cache.set(CACHE_KEY, index, getattr(settings, 'CATEGORY_INDEX_TIMEOUT', 3600))
+    return index
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
+    pagecache.purge(pagecache.CATEGORIES)  # Сайдбар закешированных страниц
@@ -0,0 +1,87 @@
+# posts/comments.py
+"""
+Ветки комментариев поста. Страница - это до THREADS_PER_PAGE веток (корневых комментариев или
+прямых ответов на комментарий) после keyset-курсора по path, и у каждой ветки - до THREAD_REPLIES
+ответов в порядке обхода дерева. Ответы всех веток страницы читаются одним запросом
+(ROW_NUMBER() в пределах ветки) и связываются в Python за O(n); шаблоны обходят comment.children.
+
+Недогруженные узлы получают more_replies (сколько прямых ответов не показано, по replies_count)
+и replies_query (курсор и число показанных ответов) - продолжение подгружает views.comment_replies.
+"""
+
+from urllib.parse import urlencode
+
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber, Substr
+
+from .models import Comment
+from .pagination import CursorPaginator
+
+THREADS_PER_PAGE = 10
+THREAD_REPLIES = 5
+COMMENT_CURSOR_ORDERING = ('path',)
+
+
+def assemble(comments):
+    """Проставляет каждому комментарию список children и возвращает корни - узлы без родителя в comments."""
+    comments = list(comments)
+    by_id = {comment.pk: comment for comment in comments}
+    roots = []
+    for comment in comments:
+        comment.children = []
+    for comment in comments:
+        parent = by_id.get(comment.parent_id)
+        if parent is not None:
+            parent.children.append(comment)
+        else:
+            roots.append(comment)
+    return roots
+
+
+def more_query(cursor, shown):
+    """Query string кнопки догрузки: курсор (None - с начала) и сколько элементов уже показано."""
+    return urlencode({'shown': shown, **({'cursor': cursor} if cursor else {})})
+
+
+def _mark_more(comments, paginator):
+    for comment in comments:
+        comment.more_replies = max(comment.replies_count - len(comment.children), 0)
+        cursor = paginator.encode_cursor(comment.children[-1], 'n') if comment.children else None
+        comment.replies_query = more_query(cursor, len(comment.children))
+        _mark_more(comment.children, paginator)
+
+
+def attach_replies(heads, limit=THREAD_REPLIES):
+    """
+    Подгружает каждой ветке из heads до limit ответов одним запросом. heads - соседние узлы одной
+    глубины в порядке path, поэтому их поддеревья лежат в одном диапазоне индекса (post, path).
+    """
+    heads = list(heads)
+    replies = []
+    if heads:
+        first, last = heads[0], heads[-1]
+        replies = Comment.objects.filter(
+            post_id=first.post_id, depth__gt=first.depth,
+            path__gt=first.path, path__lt=Comment.path_upper_bound(last.path),
+        ).annotate(
+            position=Window(RowNumber(), partition_by=[Substr('path', 1, len(first.path))], order_by=F('path').asc())
+        ).filter(position__lte=limit).select_related('author__profile').order_by('path')
+    assemble([*heads, *replies])
+    _mark_more(heads, CursorPaginator(Comment.objects.none(), limit, ordering=COMMENT_CURSOR_ORDERING))
+    return heads
+
+
+def load_threads(post_id, parent=None, token=None, per_page=THREADS_PER_PAGE):
+    """
+    Страница веток: корневые комментарии поста (или прямые ответы на parent) после курсора token.
+    Возвращает CursorPage; InvalidCursor - если токен не разобрать.
+    """
+    heads = Comment.objects.filter(post_id=post_id, parent=parent).select_related('author__profile')
+    page = CursorPaginator(heads, per_page, ordering=COMMENT_CURSOR_ORDERING).page(token)
+    attach_replies(page.object_list)
+    return page
+
+
+def load_subtree(comment):
+    """Комментарий с ограниченной подгрузкой ответов (например, для перерисовки после редактирования)."""
+    return attach_replies([comment])[0]
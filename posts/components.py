@@ -5,7 +5,7 @@ from django_components import component
 # --- КОМПОНЕНТ ДЛЯ КОММЕНТАРИЯ ---
 @component.register("comment_item_component") # НОВОЕ ИМЯ РЕГИСТРАЦИИ
 class CommentItem(component.Component):
-    """Компонент для отображения одного комментария и его ответов."""
+    """Компонент для отображения одного комментария и его ответов (comment.children из posts.comments)."""
     # Укажите правильный путь к вашему HTML шаблону комментария
     template_name = "posts/components/comment_item/comment_item.html" # Пример пути
 
@@ -0,0 +1,86 @@
+# posts/conditional.py
+"""
+Условные GET (ETag / Last-Modified) без отрисовки страницы.
+
+Валидаторы собираются из сохраненных отметок времени и версий - updated_at (правка),
+counters_updated_at (голоса и комментарии, включая их правку), счетчики профиля, версия сайдбара
+категорий - из строк, которые представление все равно загружает (пост, страница списка), и 304
+отдается до шаблона и остальных запросов.
+
+Страница зависит от зрителя (видимость постов, шапка, CSRF-токен в формах), поэтому в ETag
+входят id и имя пользователя и хеш CSRF-секрета; собственный голос зрителя меняет счетчики поста,
+а значит и counters_updated_at. Пока у запроса есть непоказанные сообщения, валидаторы не выдаются.
+
+Last-Modified - только для анонимов и только там, где дата описывает всю страницу (пост). Дата не
+знает зрителя (копия вошедшего совпала бы по If-Modified-Since после выхода) и не видит строк,
+ушедших со страницы (удаленный или скрытый пост не сдвигает максимум), поэтому списки, лента и
+профиль отдают только ETag, в который входит сам состав страницы.
+"""
+
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import categories, pagecache
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def last_modified(*stamps):
+    """Unix-время самой поздней из отметок (None пропускаются) или None."""
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return int(max(stamps).timestamp()) if stamps else None
+
+
+def viewer_parts(request):
+    user = request.user
+    if not user.is_authenticated:
+        return (None,)
+    # После повторного входа CSRF-секрет другой: токены в формах старой копии страницы недействительны
+    csrf_secret = hashlib.md5(request.META.get('CSRF_COOKIE', '').encode()).hexdigest()
+    return (user.pk, user.username, csrf_secret)
+
+
+def sidebar_parts():
+    return tuple((category.pk, category.name, category.num_posts) for category in categories.get_index().active())
+
+
+def set_validators(request, response, etag, modified):
+    """Заголовки валидаторов; ответ обязан перепроверяться (no-cache), для вошедших - только в браузере."""
+    if modified is not None and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(modified)
+    response.headers.setdefault('ETag', etag)
+    patch_cache_control(response, no_cache=True)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified для GET-представления: get_validators() вызывается до основной работы,
+    при совпадении с If-None-Match / If-Modified-Since сразу отдается 304.
+    """
+
+    def get_validators(self):
+        """
+        (части ETag, отметки времени для Last-Modified) или None - без условного ответа.
+        Отметки - только если их максимум меняется при любом изменении страницы, иначе пустой список.
+        """
+        return None
+
+    def get(self, request, *args, **kwargs):
+        validators = None if pagecache.pending_messages(request) else self.get_validators()
+        if validators is None:
+            return super().get(request, *args, **kwargs)
+        parts, stamps = validators
+        etag = make_etag(type(self).__name__, parts, viewer_parts(request), sidebar_parts())
+        # Вошедшим - только ETag: в нем есть зритель, в дате его нет
+        modified = None if request.user.is_authenticated else last_modified(*stamps)
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(request, response, etag, modified)
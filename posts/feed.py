@@ -0,0 +1,141 @@
+# posts/feed.py
+"""
+Чтение ленты подписок с fan-out on read для "тяжелых" авторов (см. posts.timeline).
+
+Для каждого автора в кеше (Redis через django_redis) хранится короткий список последних
+видимых постов [(published_at, post_id), ...] по убыванию. Страница ленты собирается
+k-way слиянием (heapq) этих списков и страницы TimelineEntry; из БД загружаются только
+посты-победители. Стоимость страницы зависит от ее размера, а не от объема постов подписок.
+"""
+
+import heapq
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from . import timeline
+from .models import Post, TimelineEntry
+from .pagination import CursorPage, CursorPaginator
+
+# Элемент ленты; атрибуты совпадают с ключом курсора TimelineEntry ('-published_at', '-post_id')
+FeedItem = namedtuple('FeedItem', 'published_at post_id')
+FEED_CURSOR_ORDERING = ('-published_at', '-post_id')
+
+
+def _author_key(author_id):
+    return f'feed:author:{author_id}:recent'
+
+
+def invalidate_author(author_id):
+    """Сбрасывает кеш последних постов автора (вызывается при сохранении/удалении поста)."""
+    cache.delete(_author_key(author_id))
+
+
+def recent_posts(author_ids):
+    """{author_id: [FeedItem, ...]} - последние FEED_AUTHOR_CACHE_SIZE видимых постов каждого автора."""
+    keys = {author_id: _author_key(author_id) for author_id in author_ids}
+    cached = cache.get_many(keys.values())
+    result = {author_id: cached[key] for author_id, key in keys.items() if key in cached}
+    missing = [author_id for author_id in keys if author_id not in result]
+    if missing:
+        # Промахи кеша добираем одним запросом: ROW_NUMBER() в пределах автора. Читаем с default -
+        # список живет FEED_AUTHOR_CACHE_TIMEOUT, и реплика сохранила бы в нем пост до сброса (posts.replicas)
+        size = getattr(settings, 'FEED_AUTHOR_CACHE_SIZE', 200)
+        ranked = timeline.feed_visible_posts().using(DEFAULT_DB_ALIAS).filter(author_id__in=missing).annotate(
+            position=Window(RowNumber(), partition_by=[F('author_id')],
+                            order_by=[F('published_at').desc(), F('id').desc()])
+        ).filter(position__lte=size).order_by('author_id', '-published_at', '-id')
+        fresh = {author_id: [] for author_id in missing}
+        for author_id, published_at, post_id in ranked.values_list('author_id', 'published_at', 'pk'):
+            fresh[author_id].append(FeedItem(published_at, post_id))
+        cache.set_many({keys[author_id]: items for author_id, items in fresh.items()},
+                       getattr(settings, 'FEED_AUTHOR_CACHE_TIMEOUT', 3600))
+        result.update(fresh)
+    return result
+
+
+def _window(items, key, previous, limit):
+    """Не более limit элементов убывающего списка items, ближайших к курсору key в нужную сторону."""
+    if key is None:
+        return items[:limit]
+    if previous:
+        newer = [item for item in items if item > key]
+        return newer[-limit:]
+    return [item for item in items if item < key][:limit]
+
+
+class MergedFeed:
+    """Страница ленты: TimelineEntry пользователя + посты fan-out-on-read авторов, слитые по времени."""
+
+    def __init__(self, user, per_page):
+        self.user = user
+        self.per_page = per_page
+        self.paginator = CursorPaginator(TimelineEntry.objects.none(), per_page, ordering=FEED_CURSOR_ORDERING)
+        self._windows = {}
+        self._pages = {}
+
+    def _read_time_authors(self):
+        profile = getattr(self.user, 'profile', None)
+        if profile is None:
+            return set()
+        followed_ids = list(profile.following.values_list('user_id', flat=True))
+        return timeline.fanout_on_read_authors(followed_ids)
+
+    def _timeline_source(self, token, limit):
+        # Страница TimelineEntry того же размера (limit строк) по тому же курсору
+        entries = timeline.read(self.user).select_related(None).only('published_at', 'post_id')
+        paginator = CursorPaginator(entries, limit, ordering=FEED_CURSOR_ORDERING)
+        return [FeedItem(entry.published_at, entry.post_id) for entry in paginator.page(token).object_list]
+
+    def window(self, token=None):
+        """(FeedItem страницы, has_next, has_previous) без загрузки постов; считается один раз на токен."""
+        if token not in self._windows:
+            self._windows[token] = self._merge(token)
+        return self._windows[token]
+
+    def _merge(self, token):
+        direction, values = ('n', None) if not token else self.paginator.decode_cursor(token)
+        key = FeedItem(*values) if values else None
+        previous = direction == 'p'
+        limit = self.per_page + 1  # +1 элемент, чтобы узнать, есть ли еще
+
+        sources = [self._timeline_source(token, limit)]
+        for items in recent_posts(self._read_time_authors()).values():
+            sources.append(_window(items, key, previous, limit))
+
+        # k-way слияние убывающих списков; один пост может прийти и из ленты, и из кеша автора
+        merged, seen = [], set()
+        for item in heapq.merge(*sources, reverse=True):
+            if item.post_id not in seen:
+                seen.add(item.post_id)
+                merged.append(item)
+        window = merged[-limit:] if previous else merged[:limit]
+        has_more = len(window) > self.per_page
+        if previous:
+            window = window[1:] if has_more else window
+            has_next, has_previous = True, has_more
+        else:
+            window = window[:self.per_page]
+            has_next, has_previous = has_more, key is not None
+        return window, has_next, has_previous
+
+    def page(self, token=None):
+        """Страница постов (CursorPage); как и окно, загружается один раз на токен."""
+        if token not in self._pages:
+            self._pages[token] = self._load_page(token)
+        return self._pages[token]
+
+    def _load_page(self, token):
+        window, has_next, has_previous = self.window(token)
+        # Из БД - только победители
+        posts = Post.objects.select_related('author__profile', 'category').in_bulk([item.post_id for item in window])
+        object_list = [posts[item.post_id] for item in window if item.post_id in posts]
+        return CursorPage(
+            object_list,
+            next_cursor=self.paginator.encode_cursor(window[-1], 'n') if window and has_next else None,
+            previous_cursor=self.paginator.encode_cursor(window[0], 'p') if window and has_previous else None,
+        )
@@ -1,7 +1,9 @@
 # posts/forms.py
 
 from django import forms
+from django.forms.models import ModelChoiceIterator
 from django.utils import timezone # Нужен для проверки времени
+from . import categories
 from .models import Post, Category, Comment
 
 # --- Форма комментария (остается без изменений из вашего файла) ---
@@ -22,11 +24,33 @@ class CommentForm(forms.ModelForm):
              'content': '', # Скрываем метку, т.к. есть placeholder
         }
 
+# --- Выбор категории по кешированному индексу (posts.categories), без запросов к Category ---
+class CategoryChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        yield from categories.get_index().choices()
+
+    def __len__(self):
+        return len(categories.get_index().categories) + (self.field.empty_label is not None)
+
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    iterator = CategoryChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            return categories.get_index().by_id[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+
 # --- Обновленная форма поста с видимостью и расписанием ---
 class PostForm(forms.ModelForm):
     """Форма для создания и редактирования постов."""
     # Поле для выбора категории (из вашего файла)
-    category = forms.ModelChoiceField(
+    category = CategoryChoiceField(
         queryset=Category.objects.all().order_by('name'),
         required=False, # Категория не обязательна
         empty_label="-- Выберите категорию --",
@@ -0,0 +1,127 @@
+# posts/fragments.py
+"""
+Кеш отрисованных фрагментов: карточки постов и узлы комментариев.
+
+В кеше лежит часть, одинаковая для всех зрителей (каркас), под ключом id + версия объекта:
+updated_at меняется при правке (save), счетчики - при голосе и комментарии, поэтому старые
+версии просто перестают читаться и истекают по FRAGMENT_CACHE_TIMEOUT. Зависящее от зрителя
+(подсветка голоса, кнопки ответа/правки/удаления) кешируется вариантами и вместе с "N минут назад"
+подставляется в слоты каркаса заменой строки. Вся страница читается одним get_many.
+
+Имя/аватар автора и название категории в версию не входят - обновятся по истечении TTL.
+"""
+
+from django.conf import settings
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Comment
+
+POST_CARD_TEMPLATE = 'posts/components/post_card/post_card.html'
+POST_ACTIONS_TEMPLATE = 'posts/partials/post_actions_fragment.html'
+COMMENT_BODY_TEMPLATE = 'posts/partials/comment_body.html'
+COMMENT_ACTIONS_TEMPLATE = 'posts/partials/comment_actions.html'
+
+# Слоты в каркасе: HTML-комментарии, которых не бывает в пользовательском тексте (он экранируется)
+TIME_SLOT = '<!--fragment:time-->'
+ACTIONS_SLOT = '<!--fragment:actions-->'
+SLOTS = {'time_slot': mark_safe(TIME_SLOT), 'actions_slot': mark_safe(ACTIONS_SLOT)}
+
+
+def timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 86400)
+
+
+def _stamp(value):
+    return int(value.timestamp() * 1_000_000) if value else 0
+
+
+def post_card_key(post):
+    return f'fragment:post:{post.pk}:{_stamp(post.updated_at)}'
+
+
+def post_actions_key(post, user_vote):
+    counters = f'{post.likes_count}.{post.dislikes_count}.{post.comments_count}'
+    return f'fragment:post:{post.pk}:{_stamp(post.updated_at)}:{counters}:actions:{user_vote or 0}'
+
+
+def comment_body_key(comment):
+    return f'fragment:comment:{comment.pk}:{_stamp(comment.updated_at)}'
+
+
+def comment_actions_key(comment, can_reply, is_author):
+    # Кнопки зависят только от id комментария и прав зрителя
+    return f'fragment:comment:{comment.pk}:actions:{int(can_reply)}{int(is_author)}'
+
+
+def _render(cached, rendered, key, template, context):
+    """Фрагмент из прочитанного кеша или отрисованный сейчас (попадет в set_many)."""
+    html = cached.get(key) or rendered.get(key)
+    if html is None:
+        html = rendered[key] = render_to_string(template, context)
+    return html
+
+
+def _stitch(body, time_value, actions):
+    time_html = escape(str(naturaltime(time_value))) if time_value else ''
+    return mark_safe(body.replace(TIME_SLOT, time_html, 1).replace(ACTIONS_SLOT, actions, 1))
+
+
+# --- Карточки постов ---
+def post_cards(posts, user_votes=None):
+    """HTML карточек в порядке posts; user_votes - {post_id: vote_type} текущего зрителя."""
+    user_votes = user_votes or {}
+    items = [(post, user_votes.get(post.pk)) for post in posts]
+    keys = [(post_card_key(post), post_actions_key(post, vote)) for post, vote in items]
+    cached = cache.get_many({key for pair in keys for key in pair})
+    rendered, cards = {}, []
+    for (post, vote), (card_key, actions_key) in zip(items, keys):
+        body = _render(cached, rendered, card_key, POST_CARD_TEMPLATE, {'post': post, **SLOTS})
+        actions = _render(cached, rendered, actions_key, POST_ACTIONS_TEMPLATE, {'post': post, 'user_vote': vote})
+        cards.append(_stitch(body, post.published_at, actions))
+    if rendered:
+        cache.set_many(rendered, timeout())
+    return cards
+
+
+# --- Узлы комментариев ---
+def walk(comments):
+    """Комментарии и все их загруженные ответы (children) в порядке обхода."""
+    for comment in comments:
+        yield comment
+        yield from walk(getattr(comment, 'children', ()))
+
+
+def attach_comment_bodies(comments, user):
+    """Проставляет comment.body_html всем узлам comments и их children (одно чтение кеша на всех)."""
+    nodes = [comment for comment in walk(comments) if 'body_html' not in comment.__dict__]
+    if not nodes:
+        return
+    authenticated = bool(user and user.is_authenticated)
+    variants = [
+        (authenticated and comment.depth < Comment.MAX_DEPTH, authenticated and comment.author_id == user.pk)
+        for comment in nodes
+    ]
+    _attach(nodes, variants)
+
+
+def attach_comment_variant(comment, can_reply, is_author):
+    """Проставляет comment.body_html для заданного варианта кнопок, а не для конкретного зрителя (posts.live)."""
+    comment.__dict__.pop('body_html', None)
+    _attach([comment], [(can_reply, is_author)])
+
+
+def _attach(nodes, variants):
+    keys = [(comment_body_key(comment), comment_actions_key(comment, *variant)) for comment, variant in zip(nodes, variants)]
+    cached = cache.get_many({key for pair in keys for key in pair})
+    rendered = {}
+    for comment, (can_reply, is_author), (body_key, actions_key) in zip(nodes, variants, keys):
+        body = _render(cached, rendered, body_key, COMMENT_BODY_TEMPLATE, {'comment': comment, **SLOTS})
+        actions = _render(cached, rendered, actions_key, COMMENT_ACTIONS_TEMPLATE,
+                          {'comment': comment, 'can_reply': can_reply, 'is_author': is_author})
+        comment.body_html = _stitch(body, comment.created_at, actions)
+    if rendered:
+        cache.set_many(rendered, timeout())
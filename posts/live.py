@@ -0,0 +1,308 @@
+# posts/live.py
+"""
+Живые обновления страницы поста через Server-Sent Events (только ASGI).
+
+Записи (post_vote, add_comment) после коммита публикуют в канал поста короткое событие без HTML:
+- comment: id нового комментария, его родитель и автор;
+- actions: счетчики поста изменились (и кто как проголосовал); значения читаются при отрисовке.
+Фрагменты рисуются не на пути записи, а в процессе, где у поста есть подписчики, - один раз на событие
+(render), и раздаются всем его потокам: узел комментария (тот же шаблон, что отдает add_comment) в
+вариантах кнопок для гостя и для вошедшего (ответить можно, править/удалять - нет) и
+post_actions_fragment.html для каждого значения голоса зрителя (None/1/-1). Поток помнит голос своего
+зрителя и обновляет его по событиям с его user_id.
+
+Брокер - LocalBroker (в процессе; тесты, разработка, один процесс) или RedisBroker (кеш django_redis):
+одна подписка Redis на пост в процессе, дальше раздача локальным подписчикам. Оба рисуют событие
+в event loop подписчиков (sync_to_async), а не в потоке запроса-записи; LocalBroker без
+подписчиков поста событие отбрасывает (под WSGI потоков нет вовсе). Ожидающий зритель - буфер и
+asyncio.Event без потока; раз в LIVE_HEARTBEAT_SECONDS уходит комментарий-пинг.
+
+Буфер подписчика ограничен LIVE_BUFFER_SIZE: еще не отправленные actions заменяются новыми
+(нужны только последние счетчики; голоса замененных событий переносятся в оставшееся), а при переполнении комментариями поток отправляет reset
+и закрывается - клиент перечитывает ветки комментариев. Django 4.2 не прерывает ответ при
+разрыве соединения, поэтому поток живет не дольше LIVE_STREAM_MAX_SECONDS, после чего
+EventSource переподключается сам.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from users.graph import redis_connection
+
+from . import fragments, votes
+from .models import Comment, Post
+
+COMMENT, ACTIONS, RESET = 'comment', 'actions', 'reset'
+COMMENT_TEMPLATE = 'posts/components/comment_display/comment_display.html'
+GUEST, MEMBER = 'guest', 'member'
+VOTE_VARIANTS = (None, 1, -1)
+COUNTERS = ('likes_count', 'dislikes_count', 'comments_count')
+RETRY_MS = 3000  # Пауза EventSource перед переподключением
+
+
+def heartbeat_seconds():
+    return getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 15)
+
+
+def buffer_size():
+    return getattr(settings, 'LIVE_BUFFER_SIZE', 100)
+
+
+def max_stream_seconds():
+    return getattr(settings, 'LIVE_STREAM_MAX_SECONDS', 600)
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+# --- Подписка ---
+def user_votes(message):
+    """{user_id: голос} события actions, включая голоса замененных им неотправленных событий."""
+    if 'votes' in message:
+        return message['votes']
+    return {} if message.get('user_id') is None else {message['user_id']: message['vote']}
+
+
+class Subscription:
+    """Ограниченный буфер событий одного потока; наполняется в потоке его event loop."""
+
+    def __init__(self, channel, maxsize):
+        self.channel = channel
+        self.maxsize = maxsize
+        self.loop = asyncio.get_running_loop()
+        self.queue = deque()
+        self.overflowed = False
+        self._ready = asyncio.Event()
+
+    def deliver(self, message):
+        if self.overflowed:
+            return
+        if message['type'] == ACTIONS:
+            # Счетчики важны только последние: заменяем еще не отправленные, но голоса из них переносим -
+            # по ним поток обновляет голос своего зрителя. Сообщение общее для всех потоков: копия, не правка
+            carried = {}
+            for queued in self.queue:
+                if queued['type'] == ACTIONS:
+                    carried.update(user_votes(queued))
+            if carried:
+                message = {**message, 'votes': {**carried, **user_votes(message)}}
+            self.queue = deque(queued for queued in self.queue if queued['type'] != ACTIONS)
+        if len(self.queue) >= self.maxsize:
+            self.overflowed = True
+            self.queue.clear()
+        else:
+            self.queue.append(message)
+        self._ready.set()
+
+    async def get(self, timeout):
+        """События, накопленные к моменту пробуждения, или [] по таймауту."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return []
+        self._ready.clear()
+        messages, self.queue = list(self.queue), deque()
+        return messages
+
+
+class LocalBroker:
+    """Брокер в памяти процесса: публикация сразу раздается подписчикам этого процесса."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            loops = {subscription.loop for subscription in self._subscribers.get(channel, ())}
+        for loop in loops:
+            # publish вызывается из потоков синхронного кода (запрос-запись): рисует не он, а event loop подписчиков
+            asyncio.run_coroutine_threadsafe(self._dispatch(channel, event), loop)
+
+    async def _dispatch(self, channel, event):
+        """Рисует событие один раз (шаблоны и ORM - в потоке) и раздает подписчикам канала в этом event loop."""
+        message = await sync_to_async(render)(event)
+        if message is None:
+            return
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            subscribers = [subscription for subscription in self._subscribers.get(channel, ())
+                           if subscription.loop is loop]
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    async def subscribe(self, channel):
+        subscription = Subscription(channel, buffer_size())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Убирает подписчика; True, если в канале больше никого нет."""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.channel, None)
+                return True
+        return False
+
+
+class RedisBroker(LocalBroker):
+    """Брокер через Redis pub/sub: один канал Redis на пост и одно соединение-слушатель на процесс."""
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+        self._loop = None
+        self._pubsub = None
+        self._listener = None
+
+    def _key(self, channel):
+        return cache.make_key(f'live:{channel}')
+
+    def publish(self, channel, event):
+        # Короткое событие; рисуют фрагменты слушатели процессов, где у поста есть подписчики
+        self._conn.publish(self._key(channel), json.dumps(event))
+
+    def _async_client(self):
+        import redis.asyncio
+
+        # Параметры соединения (хост, БД, пароль) - те же, что у синхронного пула кеша
+        return redis.asyncio.Redis(**self._conn.connection_pool.connection_kwargs)
+
+    async def subscribe(self, channel):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._listener = loop, None
+            self._pubsub = self._async_client().pubsub()
+        with self._lock:
+            first = channel not in self._subscribers
+        subscription = await super().subscribe(channel)
+        if first:
+            await self._pubsub.subscribe(self._key(channel))
+        if self._listener is None:
+            # Слушатель запускается после первой подписки: до нее у pubsub нет соединения
+            self._listener = loop.create_task(self._listen(self._pubsub))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        last = super().unsubscribe(subscription)
+        if last and self._loop is subscription.loop and not self._loop.is_closed():
+            self._loop.create_task(self._unsubscribe(subscription.channel))
+        return last
+
+    async def _unsubscribe(self, channel):
+        with self._lock:
+            if channel in self._subscribers:
+                return  # Пока отписывались, пришел новый подписчик
+        await self._pubsub.unsubscribe(self._key(channel))
+
+    async def _listen(self, pubsub):
+        from redis.exceptions import RedisError
+        prefix = self._key('')
+        while True:
+            try:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat_seconds())
+            except RedisError:
+                # pubsub переподключается и подписывается заново; события за время разрыва теряются
+                await asyncio.sleep(1)
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            channel = message['channel'].decode()[len(prefix):]
+            with self._lock:
+                if channel not in self._subscribers:
+                    continue
+            # Шаблоны и чтение комментария - синхронный код; один раз на событие для всех потоков процесса
+            await self._dispatch(channel, json.loads(message['data']))
+
+
+_broker = None
+
+
+def get_broker():
+    """RedisBroker, если кеш - django_redis, иначе LocalBroker (один на процесс)."""
+    global _broker
+    if _broker is None:
+        conn = redis_connection()
+        _broker = RedisBroker(conn) if conn is not None else LocalBroker()
+    return _broker
+
+
+# --- Публикация (синхронный код, после коммита) ---
+def publish_actions(post_id, user_id=None, user_vote=None):
+    """Счетчики поста изменились; user_id/user_vote - кто и как проголосовал (None - не голос)."""
+    event = {'type': ACTIONS, 'post_id': post_id, 'user_id': user_id, 'vote': user_vote}
+    get_broker().publish(post_channel(post_id), event)
+
+
+def publish_comment(comment):
+    """Новый комментарий: узел рисуется у подписчиков (render)."""
+    event = {'type': COMMENT, 'id': comment.pk, 'parent_id': comment.parent_id, 'user_id': comment.author_id}
+    get_broker().publish(post_channel(comment.post_id), event)
+
+
+def render(event):
+    """Сообщение для потоков (событие + html по вариантам зрителя) или None, если рисовать нечего."""
+    if event['type'] == ACTIONS:
+        # Счетчики на момент отрисовки (с несброшенными голосами буфера) - не старее события
+        post = Post.objects.filter(pk=event['post_id']).only('slug', *COUNTERS).first()
+        if post is None:
+            return None
+        votes.refresh_counters(post)
+        html = {str(vote or 0): render_to_string(fragments.POST_ACTIONS_TEMPLATE, {'post': post, 'user_vote': vote})
+                for vote in VOTE_VARIANTS}
+        return {**event, 'html': html}
+    comment = Comment.objects.select_related('author__profile', 'parent').filter(pk=event['id']).first()
+    if comment is None:
+        return None  # Уже удален
+    html = {}
+    for variant, can_reply in ((GUEST, False), (MEMBER, comment.depth < Comment.MAX_DEPTH)):
+        fragments.attach_comment_variant(comment, can_reply=can_reply, is_author=False)
+        html[variant] = render_to_string(COMMENT_TEMPLATE, {'comment': comment, 'user': None, 'level': comment.depth})
+    return {**event, 'html': html}
+
+
+# --- Поток SSE ---
+def _event(name, data):
+    lines = ''.join(f'data: {line}\n' for line in data.splitlines() or [''])
+    return f'event: {name}\n{lines}\n'
+
+
+async def stream(post_id, user_id=None, user_vote=None):
+    """Асинхронный генератор строк text/event-stream для зрителя поста (user_id None - гость)."""
+    broker = get_broker()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_stream_seconds()
+    subscription = await broker.subscribe(post_channel(post_id))
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        while loop.time() < deadline:
+            messages = await subscription.get(min(heartbeat_seconds(), max(deadline - loop.time(), 0)))
+            if subscription.overflowed:
+                yield _event(RESET, '')
+                return
+            if not messages:
+                yield ': ping\n\n'
+                continue
+            for message in messages:
+                if message['type'] == ACTIONS:
+                    if user_id is not None:
+                        user_vote = user_votes(message).get(user_id, user_vote)
+                    yield _event(ACTIONS, message['html'][str(user_vote or 0)])
+                elif message['user_id'] != user_id:  # Автор уже получил свой комментарий ответом add_comment
+                    payload = {'id': message['id'], 'parent_id': message['parent_id'],
+                               'html': message['html'][GUEST if user_id is None else MEMBER]}
+                    yield _event(COMMENT, json.dumps(payload))
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,105 @@
+# posts/management/commands/bench_asgi.py
+
+import asyncio
+import secrets
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Comment, Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает обработчики Django в процессе, без HTTP-сервера: test Client в пуле потоков "
+        "(синхронный обработчик, как под WSGI) и AsyncClient с конкурентными корутинами (асинхронный обработчик). "
+        "Это накладные расходы обработчика и переходов sync/async, а не пропускная способность серверов: "
+        "для нее нужны настоящие WSGI- и ASGI-серверы (например, gunicorn и uvicorn) и внешний генератор нагрузки. "
+        "Тестовые пользователь и пост удаляются после замера. "
+        "Замерять на PostgreSQL: SQLite при параллельной записи (vote) отвечает 'database is locked'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Запросов на эндпоинт.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Одновременных запросов.")
+
+    def handle(self, *args, **options):
+        prefix = f"bench_{secrets.token_hex(3)}"
+        # Данные коммитятся: запросы ASGI выполняются в других потоках и соединениях с БД
+        user = User.objects.create_user(username=prefix, password=None)
+        try:
+            post = Post.objects.create(
+                title=prefix, content="bench", author=user, is_published=True, published_at=timezone.now())
+            comment = Comment.objects.create(post=post, author=user, content="bench")
+            endpoints = [
+                ('reply_form', 'get', reverse('posts:get_reply_form', args=[comment.pk]), {}, True),
+                ('vote', 'post', reverse('posts:post_vote', args=[post.pk]), {'vote_type': 'like'}, True),
+                ('post_detail (аноним)', 'get', post.get_absolute_url(), {}, False),
+            ]
+            self.stdout.write(f"Запросов: {options['requests']}, одновременно: {options['concurrency']}")
+            self.stdout.write(f"{'Эндпоинт':<24}{'Стек':<6}{'req/s':>10}{'p50, мс':>10}{'p95, мс':>10}")
+            for name, method, url, data, authenticated in endpoints:
+                for stack, run in (('WSGI', self._run_wsgi), ('ASGI', self._run_asgi)):
+                    elapsed, latencies = run(user if authenticated else None, method, url, data, options)
+                    self._report(name, stack, elapsed, latencies)
+        finally:
+            user.delete()  # Пост, комментарий и голоса удаляются каскадом
+
+    def _report(self, name, stack, elapsed, latencies):
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        self.stdout.write(
+            f"{name:<24}{stack:<6}{len(latencies) / elapsed:>10.1f}"
+            f"{statistics.median(latencies) * 1000:>10.2f}{p95 * 1000:>10.2f}"
+        )
+
+    def _check(self, response):
+        if response.status_code != 200:
+            raise RuntimeError(f"Неожиданный ответ {response.status_code}")
+
+    # --- WSGI: по клиенту на поток ---
+    def _run_wsgi(self, user, method, url, data, options):
+        local = threading.local()
+
+        def request(_):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                if user is not None:
+                    local.client.force_login(user)
+            started = time.perf_counter()
+            self._check(getattr(local.client, method)(url, data))
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            latencies = list(pool.map(request, range(options['requests'])))
+        return time.perf_counter() - started, latencies
+
+    # --- ASGI: корутины в одном event loop ---
+    def _run_asgi(self, user, method, url, data, options):
+        client = AsyncClient()
+        if user is not None:
+            client.force_login(user)
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def request():
+            async with semaphore:
+                started = time.perf_counter()
+                self._check(await getattr(client, method)(url, data))
+                return time.perf_counter() - started
+
+        async def run():
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(request() for _ in range(options['requests'])))
+            return time.perf_counter() - started, list(latencies)
+
+        return asyncio.run(run())
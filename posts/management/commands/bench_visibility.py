@@ -0,0 +1,145 @@
+# posts/management/commands/bench_visibility.py
+
+import random
+import secrets
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from posts.models import Post
+from users.models import Profile
+
+User = get_user_model()
+
+
+def legacy_visible_posts(user, base_queryset):
+    """Прежняя реализация (OR + JOIN по author__profile__followers + DISTINCT) - эталон для сравнения."""
+    now = timezone.now()
+    published_q = Q(is_published=True, published_at__lte=now)
+    visibility_q = Q(visibility=Post.VISIBILITY_PUBLIC)
+    visibility_q |= Q(visibility=Post.VISIBILITY_PRIVATE, author=user)
+    visibility_q |= Q(visibility=Post.VISIBILITY_FOLLOWERS, author__profile__followers=user.profile)
+    draft_q = Q(author=user) & (Q(is_published=False) | Q(published_at__gt=now))
+    return base_queryset.filter((published_q & visibility_q) | draft_q).distinct()
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает планы и время запросов видимости постов: прежний OR/JOIN/DISTINCT против "
+        "EXISTS-движка PostManager. Синтетические данные создаются в транзакции и откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=50, help="Подписок на одного пользователя.")
+        parser.add_argument('--viewers', type=int, default=20, help="Сколько разных зрителей замерять.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--explain', action='store_true', help="Напечатать планы запросов.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self._populate(options)
+                self._run(options)
+                raise _Rollback
+        except _Rollback:
+            self.stdout.write("Синтетические данные откатаны.")
+
+    # --- Генерация данных ---
+    def _populate(self, options):
+        started = time.perf_counter()
+        prefix = f"bench_{secrets.token_hex(3)}_"
+        users = User.objects.bulk_create(
+            [User(username=f"{prefix}{i}", password="!") for i in range(options['users'])], batch_size=1000
+        )
+        if not users or users[0].pk is None:  # Бэкенды без RETURNING: перечитываем PK
+            users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+        # bulk_create не отправляет post_save, поэтому профили создаем сами
+        Profile.objects.bulk_create([Profile(user=u) for u in users], batch_size=1000)
+        profiles = list(Profile.objects.filter(user__in=users).order_by('pk'))
+        self.profiles = profiles
+
+        Follow = Profile.following.through
+        follows = []
+        for profile in profiles:
+            for target in random.sample(profiles, min(options['follows'], len(profiles) - 1)):
+                if target.pk != profile.pk:
+                    follows.append(Follow(from_profile_id=profile.pk, to_profile_id=target.pk))
+        Follow.objects.bulk_create(follows, batch_size=5000, ignore_conflicts=True)
+
+        now = timezone.now()
+        visibilities = [Post.VISIBILITY_PUBLIC] * 6 + [Post.VISIBILITY_FOLLOWERS] * 3 + [Post.VISIBILITY_PRIVATE]
+        posts = []
+        for _ in range(options['posts']):
+            published_at = now - timedelta(minutes=random.randint(-600, 60 * 24 * 365))
+            is_published = random.random() > 0.05
+            posts.append(Post(
+                title="bench", slug=secrets.token_urlsafe(12), content="bench",
+                author_id=random.choice(users).pk,
+                visibility=random.choice(visibilities) if is_published else Post.VISIBILITY_PRIVATE,
+                is_published=is_published, published_at=published_at if is_published else None,
+                status=Post.status_for(is_published, published_at, now),  # bulk_create не вызывает save()
+            ))
+        Post.objects.bulk_create(posts, batch_size=2000)
+        self.stdout.write(
+            f"Данные: {len(users)} пользователей, {len(follows)} подписок, {len(posts)} постов "
+            f"({time.perf_counter() - started:.1f} c)."
+        )
+
+    # --- Замеры ---
+    def _measure(self, build_queryset, viewers, repeat, page_size):
+        page_times, count_times = [], []
+        for viewer in viewers:
+            for _ in range(repeat):
+                queryset = build_queryset(viewer).order_by('-published_at', '-created_at', '-id')
+                started = time.perf_counter()
+                list(queryset[:page_size])
+                page_times.append(time.perf_counter() - started)
+                started = time.perf_counter()
+                queryset.count()
+                count_times.append(time.perf_counter() - started)
+        return statistics.median(page_times) * 1000, statistics.median(count_times) * 1000
+
+    def _run(self, options):
+        base_qs = Post.objects.all()
+        viewers = [p.user for p in random.sample(self.profiles, min(options['viewers'], len(self.profiles)))]
+        variants = {
+            'legacy (JOIN + DISTINCT)': lambda viewer: legacy_visible_posts(viewer, base_qs),
+            'engine (EXISTS)': lambda viewer: Post.objects.get_visible_posts_for_user(viewer, base_queryset=base_qs),
+        }
+
+        # Проверка эквивалентности результатов на одном зрителе
+        sample = viewers[0]
+        legacy_ids = set(variants['legacy (JOIN + DISTINCT)'](sample).values_list('pk', flat=True))
+        engine_ids = set(variants['engine (EXISTS)'](sample).values_list('pk', flat=True))
+        # Движок дополнительно показывает автору его собственные посты "для подписчиков" (как Post.can_view)
+        own_followers_only = set(base_qs.filter(
+            author=sample, visibility=Post.VISIBILITY_FOLLOWERS).values_list('pk', flat=True))
+        if legacy_ids | own_followers_only != engine_ids:
+            self.stderr.write(self.style.ERROR("Результаты legacy и engine расходятся!"))
+
+        self.stdout.write(f"\nБД: {connection.vendor}; зрителей: {len(viewers)}, повторов: {options['repeat']}")
+        self.stdout.write(f"{'Вариант':<28}{'страница, мс':>14}{'COUNT, мс':>12}")
+        for name, build in variants.items():
+            page_ms, count_ms = self._measure(build, viewers, options['repeat'], options['page_size'])
+            self.stdout.write(f"{name:<28}{page_ms:>14.2f}{count_ms:>12.2f}")
+
+        if options['explain']:
+            for name, build in variants.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f"\nПлан: {name}"))
+                queryset = build(sample).order_by('-published_at', '-created_at', '-id')[:options['page_size']]
+                self.stdout.write(queryset.explain())
@@ -0,0 +1,23 @@
+# posts/management/commands/check_replicas.py
+
+from django.core.management.base import BaseCommand
+
+from posts import replicas
+
+
+class Command(BaseCommand):
+    help = "Показывает отставание реплик из DATABASE_REPLICAS и используются ли они для чтения (REPLICA_MAX_LAG_SECONDS)."
+
+    def handle(self, *args, **options):
+        aliases = replicas.replica_aliases()
+        if not aliases:
+            self.stdout.write("Реплики не настроены: все чтения идут в default.")
+            return
+        for alias in aliases:
+            lag = replicas.replica_lag(alias)
+            if lag is None:
+                self.stdout.write(self.style.ERROR(f"{alias}: недоступна или отставание неизвестно"))
+            elif lag > replicas.max_lag():
+                self.stdout.write(self.style.WARNING(f"{alias}: отставание {lag:.1f} c - исключена из чтения"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{alias}: отставание {lag:.1f} c"))
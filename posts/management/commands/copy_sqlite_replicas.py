@@ -0,0 +1,37 @@
+# posts/management/commands/copy_sqlite_replicas.py
+
+import sqlite3
+import time
+from contextlib import closing
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from posts import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную SQLite-БД в SQLite-реплики из DATABASE_REPLICAS (замена репликации для локальной "
+        "проверки posts.replicas). С --loop работает как воркер; остановка воркера видна роутеру как отставание реплик."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно.")
+        parser.add_argument('--interval', type=float, default=2, help="Пауза между копированиями, c.")
+
+    def handle(self, *args, **options):
+        source = connections['default']
+        targets = [alias for alias in replicas.replica_aliases() if connections[alias].vendor == 'sqlite']
+        if source.vendor != 'sqlite' or not targets:
+            raise CommandError("Нужны основная БД и хотя бы одна реплика на SQLite (DJANGO_DB_REPLICAS).")
+        source.ensure_connection()
+        while True:
+            for alias in targets:
+                # Backup API копирует постранично и не мешает открытым соединениям реплики читать
+                with closing(sqlite3.connect(connections[alias].settings_dict['NAME'])) as target:
+                    source.connection.backup(target)
+            if not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Скопировано в реплики: {', '.join(targets)}"))
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,38 @@
+# posts/management/commands/flush_votes.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import votebuffer
+from users.graph import redis_connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит голоса из буфера отложенной записи (Redis) в PostVote/Vote и пересчитывает счетчики постов. "
+        "С --loop работает как воркер и сбрасывает буфер каждые --interval секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно.")
+        parser.add_argument('--interval', type=float, default=1, help="Пауза, когда буфер пуст, c.")
+        parser.add_argument('--batch-size', type=int, default=votebuffer.BATCH_SIZE, help="Постов за один проход.")
+
+    def handle(self, *args, **options):
+        # Работает и при выключенном VOTE_WRITE_BEHIND: после выключения режима буфер нужно досбросить
+        conn = redis_connection()
+        if conn is None:
+            raise CommandError("Буфер голосов доступен только с кешем django_redis.")
+        while True:
+            total = 0
+            while True:
+                flushed = votebuffer.flush(conn, batch_size=options['batch_size'])
+                total += flushed
+                if flushed < options['batch_size']:
+                    break
+            if total or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Сброшено постов: {total}"))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,254 @@
+# posts/management/commands/import_posts.py
+
+import base64
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+
+from posts import categories, feed, search
+from posts.models import Category, Post
+
+User = get_user_model()
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on', 'да'}
+VISIBILITIES = {value for value, _ in Post.VISIBILITY_CHOICES}
+
+
+class RecordError(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует посты из JSONL или CSV потоком, пачками bulk_create в транзакциях. "
+        "Поля записи: title, content, author (username), category (slug или название), visibility, "
+        "is_published, published_at (ISO 8601), slug. Повторный запуск продолжает с последней "
+        "закоммиченной пачки; уже импортированные записи без своего slug (по сгенерированному slug) "
+        "пропускаются, а slug из файла, занятый другим постом или повторенный, - ошибка записи."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл .jsonl/.csv или '-' для stdin.")
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help="По умолчанию - по расширению файла.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--key', help="Ключ импорта для детерминированных slug (по умолчанию - имя файла).")
+        parser.add_argument('--state-file', help="Файл контрольной точки (по умолчанию - <path>.import-state).")
+        parser.add_argument('--restart', action='store_true', help="Игнорировать контрольную точку.")
+        parser.add_argument('--create-categories', action='store_true', help="Создавать отсутствующие категории.")
+        parser.add_argument('--max-errors', type=int, default=20, help="Сколько ошибок записей печатать.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        self.batch_size = options['batch_size']
+        self.create_categories = options['create_categories']
+        self.max_errors = options['max_errors']
+        self.key = options['key'] or os.path.basename(path)
+        self.state_file = options['state_file'] or (None if path == '-' else f"{path}.import-state")
+
+        start_at = 0 if options['restart'] else self._load_checkpoint()
+        if start_at:
+            self.stdout.write(f"Продолжаем с записи {start_at} (контрольная точка {self.state_file}).")
+
+        self.authors, self.categories = {}, {}
+        for pk, slug, name in Category.objects.values_list('pk', 'slug', 'name'):
+            self.categories[slug] = self.categories[name.lower()] = pk
+        self.now = timezone.now()
+        self.stats = dict(read=0, imported=0, existing=0, errors=0)
+        self.touched_authors = set()
+        started = time.perf_counter()
+
+        stream = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        try:
+            batch = []
+            for number, record in self._records(stream, fmt):
+                if number < start_at:
+                    continue
+                batch.append((number, record))
+                if len(batch) >= self.batch_size:
+                    self._flush(batch, started)
+                    batch = []
+            if batch:
+                self._flush(batch, started)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        # bulk_create не отправляет post_save: сбрасываем кеши, которые обычно чистят сигналы
+        categories.invalidate()
+        for author_id in self.touched_authors:
+            feed.invalidate_author(author_id)
+        if self.state_file and os.path.exists(self.state_file):
+            os.remove(self.state_file)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: прочитано {self.stats['read']}, импортировано {self.stats['imported']}, "
+            f"уже были {self.stats['existing']}, ошибок {self.stats['errors']} за {elapsed:.1f} c."
+        ))
+        if self.stats['imported']:
+            self.stdout.write("Ленты подписчиков не обновлялись: при необходимости запустите rebuild_timelines.")
+
+    # --- Чтение ---
+    def _records(self, stream, fmt):
+        """(номер записи, dict) без загрузки файла целиком."""
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(stream))
+            return
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record = RecordError(f"некорректный JSON: {e}")
+            if not isinstance(record, (dict, RecordError)):
+                record = RecordError("запись должна быть JSON-объектом")
+            yield number, record
+            number += 1
+
+    # --- Контрольная точка ---
+    def _load_checkpoint(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return 0
+        with open(self.state_file, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('key') != self.key:
+            raise CommandError(f"Контрольная точка {self.state_file} относится к другому импорту; используйте --restart.")
+        return state['next']
+
+    def _save_checkpoint(self, next_number):
+        if self.state_file:
+            tmp = f"{self.state_file}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'key': self.key, 'next': next_number}, f)
+            os.replace(tmp, self.state_file)
+
+    # --- Пачка ---
+    def _flush(self, batch, started):
+        self._resolve_authors(record for _, record in batch if isinstance(record, dict))
+        posts, explicit = {}, {}
+        for number, record in batch:
+            self.stats['read'] += 1
+            try:
+                if isinstance(record, RecordError):
+                    raise record
+                post = self._build(number, record)
+                if post.slug in posts:
+                    raise RecordError(f"slug '{post.slug}' уже встречался в файле")
+            except RecordError as e:
+                self._error(number, e)
+                continue
+            posts[post.slug] = post
+            if record.get('slug'):
+                explicit[post.slug] = number
+
+        # Уникальность slug проверяется одним запросом на пачку. Совпавший сгенерированный slug -
+        # запись уже импортирована; совпавший slug из файла - чужой пост, это ошибка записи
+        existing = set(Post.objects.filter(slug__in=list(posts)).values_list('slug', flat=True))
+        for slug in existing & set(explicit):
+            self._error(explicit[slug], RecordError(f"slug '{slug}' уже занят другим постом"))
+        new_posts = [post for slug, post in posts.items() if slug not in existing]
+        with transaction.atomic():
+            Post.objects.bulk_create(new_posts, batch_size=self.batch_size)
+            # Сигналов нет - полнотекстовый индекс пополняем той же транзакцией
+            search.index_rows((post.pk, post.title, post.content) for post in new_posts)
+        self._save_checkpoint(batch[-1][0] + 1)
+
+        self.stats['existing'] += len(existing - set(explicit))
+        self.stats['imported'] += len(new_posts)
+        self.touched_authors.update(post.author_id for post in new_posts)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"  ...записей {self.stats['read']}, импортировано {self.stats['imported']} "
+            f"({self.stats['read'] / elapsed if elapsed else 0:.0f} записей/с)"
+        )
+
+    def _resolve_authors(self, records):
+        missing = {str(record.get('author') or '') for record in records} - set(self.authors) - {''}
+        if missing:
+            self.authors.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+
+    def _resolve_category(self, value):
+        if not value:
+            return None
+        if not isinstance(value, str):
+            raise RecordError(f"некорректная категория {value!r}")
+        category_id = self.categories.get(value) or self.categories.get(str(value).lower())
+        if category_id is None:
+            if not self.create_categories:
+                raise RecordError(f"категория '{value}' не найдена")
+            category = Category.objects.create(name=value)
+            category_id = self.categories[category.slug] = self.categories[category.name.lower()] = category.pk
+        return category_id
+
+    def _slug(self, number, record):
+        slug = record.get('slug')
+        if slug:
+            if not isinstance(slug, str) or slugify(slug) != slug or len(slug) > Post._meta.get_field('slug').max_length:
+                raise RecordError(f"некорректный slug '{slug}'")
+            return slug
+        # Тот же формат, что в Post.save (16 символов urlsafe), но детерминированный: повтор не создает дубликатов
+        digest = hashlib.sha256(f"{self.key}:{number}".encode()).digest()[:12]
+        return base64.urlsafe_b64encode(digest).decode()
+
+    def _build(self, number, record):
+        title, content = record.get('title') or '', record.get('content') or ''
+        if not isinstance(title, str) or not isinstance(content, str):
+            raise RecordError("title и content должны быть строками")
+        title = title.strip()
+        if not title or not content:
+            raise RecordError("пустой title или content")
+        if len(title) > Post._meta.get_field('title').max_length:
+            raise RecordError("слишком длинный title")
+        author_id = self.authors.get(str(record.get('author') or ''))
+        if author_id is None:
+            raise RecordError(f"автор '{record.get('author')}' не найден")
+        visibility = record.get('visibility') or Post.VISIBILITY_PUBLIC
+        if not isinstance(visibility, str) or visibility not in VISIBILITIES:
+            raise RecordError(f"некорректная видимость '{visibility}'")
+        is_published = record.get('is_published')
+        # Пустая ячейка CSV (или null) - поле не задано, по умолчанию пост опубликован
+        if is_published is None or (isinstance(is_published, str) and not is_published.strip()):
+            is_published = True
+        elif isinstance(is_published, str):
+            is_published = is_published.strip().lower() in TRUE_VALUES
+        published_at = record.get('published_at') or None
+        if published_at:
+            try:
+                # parse_datetime возвращает None для чужого формата и бросает ValueError для 2024-13-45
+                published_at = parse_datetime(published_at) if isinstance(published_at, str) else None
+            except ValueError:
+                published_at = None
+            if published_at is None:
+                raise RecordError(f"некорректная дата '{record.get('published_at')}'")
+            if timezone.is_naive(published_at):
+                published_at = timezone.make_aware(published_at)
+
+        # Те же правила, что в Post.save: черновик - без даты и приватный, публикация - дата по умолчанию now
+        if is_published:
+            published_at = published_at or self.now
+        else:
+            published_at, visibility = None, Post.VISIBILITY_PRIVATE
+        return Post(
+            title=title, content=content, slug=self._slug(number, record),
+            author_id=author_id, category_id=self._resolve_category(record.get('category')),
+            visibility=visibility, is_published=bool(is_published), published_at=published_at,
+            status=Post.status_for(is_published, published_at, self.now),
+        )
+
+    def _error(self, number, error):
+        self.stats['errors'] += 1
+        if self.stats['errors'] <= self.max_errors:
+            self.stderr.write(f"Запись {number}: {error}")
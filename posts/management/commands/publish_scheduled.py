@@ -0,0 +1,37 @@
+# posts/management/commands/publish_scheduled.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts import publishing
+
+
+class Command(BaseCommand):
+    help = (
+        "Публикует запланированные посты, время которых наступило (status scheduled -> published). "
+        "С --loop работает как воркер: спит до ближайшей публикации, но не дольше --interval секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно.")
+        parser.add_argument('--interval', type=float, default=30, help="Максимальная пауза между проходами, c.")
+        parser.add_argument('--batch-size', type=int, default=publishing.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        while True:
+            published = publishing.publish_due(batch_size=options['batch_size'])
+            if published or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Опубликовано постов: {published}"))
+            if not options['loop']:
+                return
+            time.sleep(self._pause(options['interval']))
+
+    @staticmethod
+    def _pause(interval):
+        # Новые запланированные посты появляются в любой момент, поэтому пауза ограничена interval
+        due_at = publishing.next_due_at()
+        if due_at is None:
+            return interval
+        return min(interval, max((due_at - timezone.now()).total_seconds(), 0.5))
@@ -0,0 +1,35 @@
+# posts/management/commands/rank_posts.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import pagecache, ranking
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает оценки постов для сортировок hot/top_day/top_week: посты с активностью после прошлого прохода. "
+        "С --loop работает как воркер, --full пересчитывает все посты."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Работать постоянно.")
+        parser.add_argument('--interval', type=float, default=60, help="Пауза между проходами, c.")
+        parser.add_argument('--full', action='store_true', help="Пересчитать все посты.")
+        parser.add_argument('--batch-size', type=int, default=ranking.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['full']:
+            updated = ranking.rebuild(batch_size=options['batch_size'])
+            if updated:
+                pagecache.purge(pagecache.RANKING)
+            self.stdout.write(self.style.SUCCESS(f"Оценки пересчитаны, изменилось постов: {updated}"))
+            return
+        while True:
+            updated = ranking.refresh_due(batch_size=options['batch_size'])
+            if updated or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f"Изменилось оценок постов: {updated}"))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,33 @@
+# posts/management/commands/rebuild_post_counters.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счетчики постов (лайки, дизлайки, комментарии) и ответов на комментарии по таблицам PostVote и Comment."
+
+    def add_arguments(self, parser):
+        parser.add_argument('post_ids', nargs='*', type=int, help="ID постов (по умолчанию - все посты).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько постов пересчитывать в одной транзакции.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Post.objects.order_by('pk')
+        if options['post_ids']:
+            queryset = queryset.filter(pk__in=options['post_ids'])
+
+        # Идем по диапазонам PK, чтобы не держать одну длинную транзакцию на всю таблицу
+        total, last_pk = 0, 0
+        while True:
+            batch_ids = list(queryset.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not batch_ids:
+                break
+            with transaction.atomic():
+                total += Post.objects.rebuild_counters(batch_ids)
+            last_pk = batch_ids[-1]
+            self.stdout.write(f"  ...обработано постов: {total}")
+
+        self.stdout.write(self.style.SUCCESS(f"Счетчики пересчитаны для постов: {total}."))
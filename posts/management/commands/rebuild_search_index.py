@@ -0,0 +1,16 @@
+# posts/management/commands/rebuild_search_index.py
+
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Перестраивает полнотекстовый индекс постов (FTS5 на SQLite, tsvector на Postgres) по таблице постов."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Сколько постов индексировать за один раз.")
+
+    def handle(self, *args, **options):
+        total = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Поисковый индекс перестроен, постов: {total}."))
@@ -0,0 +1,36 @@
+# posts/management/commands/rebuild_timelines.py
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Заполняет (backfill) или пересобирает ленты подписок TimelineEntry по текущим подпискам."
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help="Пользователи (по умолчанию - все, у кого есть подписки).")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        else:
+            users = users.filter(profile__following__isnull=False).distinct()
+
+        total_users = total_entries = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                total_entries += timeline.rebuild(user_id)
+            total_users += 1
+            if total_users % 100 == 0:
+                self.stdout.write(f"  ...лент пересобрано: {total_users}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Пересобрано лент: {total_users}, записей: {total_entries} "
+            f"(лимит на пользователя: {timeline.timeline_size()})."
+        ))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:48
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Vote = apps.get_model('posts', 'Vote')
+    Comment = apps.get_model('posts', 'Comment')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    content_type = ContentType.objects.filter(app_label='posts', model='post').first()
+
+    def votes_count(vote_type):
+        return Vote.objects.filter(
+            content_type=content_type, object_id=OuterRef('pk'), vote_type=vote_type
+        ).order_by().values('object_id').annotate(c=Count('pk')).values('c')
+
+    comments_count = Comment.objects.filter(
+        post=OuterRef('pk')
+    ).order_by().values('post').annotate(c=Count('pk')).values('c')
+
+    updates = {'comments_count': Coalesce(Subquery(comments_count), 0)}
+    if content_type is not None:
+        updates['likes_count'] = Coalesce(Subquery(votes_count(1)), 0)
+        updates['dislikes_count'] = Coalesce(Subquery(votes_count(-1)), 0)
+    Post.objects.update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('posts', '0005_alter_post_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментарии'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislikes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Дизлайки'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Лайки'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:56
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_status(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    now = timezone.now()
+    published = Post.objects.filter(is_published=True, published_at__isnull=False)
+    published.filter(published_at__lte=now).update(status='published')
+    published.filter(published_at__gt=now).update(status='scheduled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_timeline_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Черновик'), ('scheduled', 'Запланирован'), ('published', 'Опубликован')], default='draft', editable=False, max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', 'published_at'], name='post_status_published_idx'),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+    ]
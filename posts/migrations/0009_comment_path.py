@@ -0,0 +1,58 @@
+# Generated by Django 4.2.20 on 2026-10-18 19:59
+
+from django.db import migrations, models
+
+PATH_STEP = 10
+
+
+def backfill_paths(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    parents = dict(Comment.objects.values_list('pk', 'parent_id'))
+    paths = {}
+
+    def resolve(pk):
+        # Поднимаемся до ближайшего предка с известным путем, затем спускаемся обратно
+        chain = []
+        while pk is not None and pk not in paths:
+            chain.append(pk)
+            pk = parents.get(pk)
+        prefix = paths.get(pk, '')
+        for node in reversed(chain):
+            prefix += str(node).zfill(PATH_STEP)
+            paths[node] = prefix
+
+    batch = []
+    for pk in parents:
+        resolve(pk)
+        path = paths[pk]
+        batch.append(Comment(pk=pk, path=path, depth=len(path) // PATH_STEP - 1))
+        if len(batch) >= 1000:
+            Comment.objects.bulk_update(batch, ['path', 'depth'])
+            batch = []
+    if batch:
+        Comment.objects.bulk_update(batch, ['path', 'depth'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_post_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Глубина'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Путь'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:01
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_replies_count(apps, schema_editor):
+    Comment = apps.get_model('posts', 'Comment')
+    replies = Comment.objects.filter(parent=OuterRef('pk')).order_by().values('parent').annotate(c=Count('pk')).values('c')
+    Comment.objects.update(replies_count=Coalesce(Subquery(replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_comment_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Ответы'),
+        ),
+        migrations.RunPython(backfill_replies_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:24
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+
+def backfill_counters_updated_at(apps, schema_editor):
+    # Время прошлых голосов/комментариев неизвестно: берем время последней правки поста
+    apps.get_model('posts', 'Post').objects.update(counters_updated_at=F('updated_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='counters_updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Счетчики изменены'),
+        ),
+        migrations.RunPython(backfill_counters_updated_at, migrations.RunPython.noop),
+    ]
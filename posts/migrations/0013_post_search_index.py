@@ -0,0 +1,40 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:40
+
+from django.db import migrations
+
+# Структура индекса зависит от СУБД; DDL зафиксирован здесь, чтобы правки posts.search не меняли миграцию.
+# Таблица пустая: заполняет ее текущий код поиска после migrate (posts.signals.fill_search_index).
+CREATE_SQL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts "
+        "USING fts5(title, content, tokenize='unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        "CREATE TABLE IF NOT EXISTS posts_post_search ("
+        "post_id integer PRIMARY KEY REFERENCES posts_post (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        "document tsvector NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS posts_post_search_document_gin ON posts_post_search USING gin (document)",
+    ],
+}
+DROP_SQL = {
+    'sqlite': ["DROP TABLE IF EXISTS posts_post_fts"],
+    'postgresql': ["DROP TABLE IF EXISTS posts_post_search"],
+}
+
+
+def run_sql(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_counters_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sql(CREATE_SQL), run_sql(DROP_SQL)),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_post_votes(apps, schema_editor):
+    # Переносим голоса за посты из обобщенной таблицы Vote пачками
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Vote = apps.get_model('posts', 'Vote')
+    Post = apps.get_model('posts', 'Post')
+    PostVote = apps.get_model('posts', 'PostVote')
+    content_type = ContentType.objects.filter(app_label='posts', model='post').first()
+    if content_type is None:
+        return
+    rows = Vote.objects.filter(content_type=content_type, object_id__in=Post.objects.values('pk')).order_by('pk').values_list('object_id', 'user_id', 'vote_type')
+    batch = []
+    for post_id, user_id, value in rows.iterator(chunk_size=1000):
+        batch.append(PostVote(post_id=post_id, user_id=user_id, value=value))
+        if len(batch) >= 1000:
+            PostVote.objects.bulk_create(batch)
+            batch = []
+    PostVote.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('posts', '0013_post_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostVote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.SmallIntegerField(choices=[(1, 'Нравится'), (-1, 'Не нравится')], verbose_name='Голос')),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.post', verbose_name='Пост')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Голос за пост',
+                'verbose_name_plural': 'Голоса за посты',
+                'indexes': [models.Index(fields=['post', 'value'], name='post_vote_post_value_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='postvote',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_post_vote_user_post'),
+        ),
+        migrations.RunPython(copy_post_votes, migrations.RunPython.noop),
+    ]
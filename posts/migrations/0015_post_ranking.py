@@ -0,0 +1,62 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:39
+
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Формула на момент миграции (posts.ranking.scores): правки posts.ranking не меняют заполнение
+COMMENT_WEIGHT = 0.5
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def scores(likes, dislikes, comments, published_at):
+    score = likes - dislikes + COMMENT_WEIGHT * comments
+    order = math.log10(max(abs(score), 1))
+    sign = (score > 0) - (score < 0)
+    decay = getattr(settings, 'RANKING_HOT_DECAY_SECONDS', 45000)
+    return score, round(sign * order + (published_at - EPOCH).total_seconds() / decay, 7)
+
+
+def backfill_scores(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    rows = Post.objects.order_by('pk').values_list(
+        'pk', 'likes_count', 'dislikes_count', 'comments_count', 'published_at', 'created_at')
+    batch = []
+    for pk, likes, dislikes, comments, published_at, created_at in rows.iterator(chunk_size=500):
+        score, hot_score = scores(likes, dislikes, comments, published_at or created_at)
+        batch.append(Post(pk=pk, score=score, hot_score=hot_score))
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ['score', 'hot_score'])
+            batch = []
+    Post.objects.bulk_update(batch, ['score', 'hot_score'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_vote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Горячесть'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-hot_score', '-id'], name='post_status_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['counters_updated_at'], name='post_counters_updated_idx'),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='votes_flushed',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Сброс голосов'),
+        ),
+    ]
@@ -4,34 +4,91 @@ import secrets
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import Q, Manager
+from django.db.models import Count, Exists, F, Manager, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Greatest, Now, Substr
 from django.urls import reverse, NoReverseMatch
 from django.utils import timezone
 # slugify больше не нужен для генерации основного слага, но может быть полезен для Category
 from django.utils.text import slugify
 
+from users.models import Profile
+
+from .audience import Audience
+
 # --- Менеджеры и Категория остаются без изменений ---
 class PostManager(Manager):
     def get_queryset(self): return super().get_queryset()
     def published(self):
-        now = timezone.now()
-        return self.get_queryset().filter(is_published=True, published_at__lte=now)
+        return self.get_queryset().filter(status=Post.STATUS_PUBLISHED)
     def get_visible_posts_for_user(self, user, base_queryset=None):
-        now = timezone.now()
-        published_q = Q(is_published=True, published_at__lte=now)
-        if base_queryset is None: qs = self.get_queryset()
-        else: qs = base_queryset
-        if user and user.is_authenticated:
-            visibility_q = Q(visibility=Post.VISIBILITY_PUBLIC)
-            visibility_q |= Q(visibility=Post.VISIBILITY_PRIVATE, author=user)
-            if hasattr(user, 'profile'):
-                visibility_q |= Q(visibility=Post.VISIBILITY_FOLLOWERS, author__profile__followers=user.profile)
-            draft_q = Q(author=user) & (Q(is_published=False) | Q(published_at__gt=now))
-            final_q = (published_q & visibility_q) | draft_q
-        else:
-            final_q = published_q & Q(visibility=Post.VISIBILITY_PUBLIC)
-        return qs.filter(final_q).distinct()
+        """
+        Единый движок видимости: посты, которые user может открыть (та же логика, что в Post.can_view).
+
+        Каждая ветка аудитории - отдельное условие без JOIN по подписчикам: свои посты (любой статус),
+        опубликованные публичные и опубликованные "для подписчиков" через EXISTS по таблице подписок.
+        Строки не размножаются, поэтому DISTINCT не нужен и планировщик может использовать индексы.
+        "Опубликован" - это status, а не сравнение с текущим временем (его выставляет publish_scheduled).
+        """
+        qs = self.get_queryset() if base_queryset is None else base_queryset
+        published_q = Q(status=Post.STATUS_PUBLISHED)
+        if not user or not user.is_authenticated:
+            return qs.filter(published_q, visibility=Post.VISIBILITY_PUBLIC)
+
+        audience_q = Q(visibility=Post.VISIBILITY_PUBLIC)
+        profile = getattr(user, 'profile', None)
+        if profile is not None:
+            audience_q |= Q(visibility=Post.VISIBILITY_FOLLOWERS) & Exists(self.follow_subquery(profile.pk))
+        return qs.filter(Q(author=user) | (published_q & audience_q))
+
+    @staticmethod
+    def follow_subquery(follower_profile_id):
+        """Подписка follower_profile_id на автора поста (коррелированный подзапрос по author_id)."""
+        Follow = Profile.following.through
+        return Follow.objects.filter(
+            from_profile_id=follower_profile_id, to_profile__user_id=OuterRef('author_id')
+        )
+
+    # --- Денормализованные счетчики (likes_count / dislikes_count / comments_count) ---
+    def adjust_counters(self, post_id, **deltas):
+        """Атомарно сдвигает счетчики поста на delta (F-выражения, без чтения строки)."""
+        updates = {field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items() if delta}
+        if updates:
+            self.get_queryset().filter(pk=post_id).update(**updates, counters_updated_at=Now())
+
+    @staticmethod
+    def _votes_count(value):
+        # Проход по индексу PostVote (post, value) без ContentType
+        return PostVote.objects.filter(
+            post=OuterRef("pk"), value=value
+        ).order_by().values("post").annotate(c=Count("pk")).values("c")
+
+    def rebuild_vote_counters(self, post_ids):
+        """Пересчитывает только likes_count / dislikes_count постов post_ids (сброс буфера голосов)."""
+        return self.get_queryset().filter(pk__in=list(post_ids)).update(
+            likes_count=Coalesce(Subquery(self._votes_count(Vote.LIKE)), 0),
+            dislikes_count=Coalesce(Subquery(self._votes_count(Vote.DISLIKE)), 0),
+            counters_updated_at=Now(),
+        )
+
+    def rebuild_counters(self, post_ids=None):
+        """Пересчитывает счетчики по таблицам PostVote и Comment (для всех постов или для post_ids), включая Comment.replies_count."""
+        comments_count = Comment.objects.filter(
+            post=OuterRef("pk")
+        ).order_by().values("post").annotate(c=Count("pk")).values("c")
+
+        qs = self.get_queryset()
+        if post_ids is not None:
+            post_ids = list(post_ids)
+            qs = qs.filter(pk__in=post_ids)
+        Comment.objects.rebuild_replies_counts(post_ids)
+        return qs.update(
+            likes_count=Coalesce(Subquery(self._votes_count(Vote.LIKE)), 0),
+            dislikes_count=Coalesce(Subquery(self._votes_count(Vote.DISLIKE)), 0),
+            comments_count=Coalesce(Subquery(comments_count), 0),
+            counters_updated_at=Now(),
+        )
 
 class Category(models.Model):
     name = models.CharField("Название", max_length=100, unique=True, help_text="Максимум 100 символов.")
@@ -54,6 +111,14 @@ class Post(models.Model):
         (VISIBILITY_FOLLOWERS, 'Только подписчикам'),
         (VISIBILITY_PRIVATE, 'Только мне'),
     ]
+    STATUS_DRAFT = 'draft'
+    STATUS_SCHEDULED = 'scheduled'
+    STATUS_PUBLISHED = 'published'
+    STATUS_CHOICES = [
+        (STATUS_DRAFT, 'Черновик'),
+        (STATUS_SCHEDULED, 'Запланирован'),
+        (STATUS_PUBLISHED, 'Опубликован'),
+    ]
 
     title = models.CharField("Заголовок", max_length=200, help_text="Максимум 200 символов.")
     # Слаг остается NOT NULL и unique
@@ -69,8 +134,26 @@ class Post(models.Model):
     visibility = models.CharField("Видимость", max_length=10, choices=VISIBILITY_CHOICES, default=VISIBILITY_PUBLIC, db_index=True, help_text="Кто сможет видеть пост после публикации.")
     is_published = models.BooleanField("Опубликовано", default=False, help_text="Пост будет виден согласно настройкам видимости и даты публикации.")
     created_at = models.DateTimeField("Создано", auto_now_add=True)
+    # Меняется при каждом save() (правка) - версия кешированных фрагментов (posts.fragments)
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
     published_at = models.DateTimeField("Дата публикации", null=True, blank=True, db_index=True, help_text="Дата и время, когда пост станет доступен (если отмечено 'Опубликовано'). Если пусто, используется текущее время.")
+    # Состояние для чтения: вычисляется в save(), scheduled -> published переводит publish_scheduled.
+    # Списки фильтруют по нему, а не по published_at <= now(), поэтому их можно кешировать
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default=STATUS_DRAFT, editable=False)
     votes = GenericRelation("Vote", related_query_name="post_votes")
+    # Денормализованные счетчики: обновляются при записи (post_vote, add_comment, delete_comment, админка),
+    # чтобы списки не агрегировали Vote/Comment. Починить рассинхрон: manage.py rebuild_post_counters
+    likes_count = models.PositiveIntegerField("Лайки", default=0, editable=False)
+    dislikes_count = models.PositiveIntegerField("Дизлайки", default=0, editable=False)
+    comments_count = models.PositiveIntegerField("Комментарии", default=0, editable=False)
+    # Время последнего сдвига счетчиков или правки комментария (updated_at они не трогают) -
+    # валидатор ETag/Last-Modified (posts.conditional)
+    counters_updated_at = models.DateTimeField("Счетчики изменены", default=timezone.now, editable=False)
+    # Оценки для сортировок ?sort=hot|top_day|top_week; пересчитываются по активности (posts.ranking)
+    score = models.FloatField("Рейтинг", default=0, editable=False)
+    hot_score = models.FloatField("Горячесть", default=0, editable=False)
+    # Номер последнего снимка буфера голосов, записанного в счетчики (posts.votebuffer)
+    votes_flushed = models.BigIntegerField("Сброс голосов", default=0, editable=False)
 
     objects = PostManager()
 
@@ -81,6 +164,11 @@ class Post(models.Model):
             models.Index(fields=["author"]), models.Index(fields=["category"]),
             models.Index(fields=["visibility"]), models.Index(fields=["is_published", "published_at"]),
             models.Index(fields=["slug"]),
+            # Выборка по статусу и проход планировщика (status='scheduled' AND published_at <= now)
+            models.Index(fields=["status", "published_at"], name="post_status_published_idx"),
+            # Сортировка "горячие" и инкрементальный пересчет оценок (posts.ranking)
+            models.Index(fields=["status", "-hot_score", "-id"], name="post_status_hot_idx"),
+            models.Index(fields=["counters_updated_at"], name="post_counters_updated_idx"),
         ]
 
     def __str__(self): return self.title
@@ -110,11 +198,19 @@ class Post(models.Model):
         else:
             self.published_at = None
             self.visibility = self.VISIBILITY_PRIVATE
+        self.status = self.status_for(self.is_published, self.published_at)
         # -------------------------------------------------------------------
 
         super().save(*args, **kwargs) # Сохраняем объект с уже присвоенным слагом
     # --- КОНЕЦ ИЗМЕНЕНИЯ ---
 
+    @classmethod
+    def status_for(cls, is_published, published_at, now=None):
+        """Статус по флагу публикации и дате (дата в будущем - запланирован)."""
+        if not is_published or published_at is None:
+            return cls.STATUS_DRAFT
+        return cls.STATUS_SCHEDULED if published_at > (now or timezone.now()) else cls.STATUS_PUBLISHED
+
     def get_absolute_url(self):
         # URL строится на основе слага
         if self.slug:
@@ -129,41 +225,93 @@ class Post(models.Model):
 
     @property
     def total_votes(self):
-        result = self.votes.aggregate(total=models.Sum("vote_type"))
-        return result.get("total") or 0
+        return self.likes_count - self.dislikes_count
 
     def can_view(self, user):
-        # (Логика can_view остается без изменений)
-        is_draft = not self.is_published or (self.published_at and self.published_at > timezone.now())
-        if is_draft:
-            return user.is_authenticated and user == self.author
-        if self.visibility == self.VISIBILITY_PUBLIC:
-            return True
-        if not user or not user.is_authenticated:
-            return False
-        if self.visibility == self.VISIBILITY_PRIVATE:
-            return user == self.author
-        if self.visibility == self.VISIBILITY_FOLLOWERS:
-            if user == self.author: return True
-            if hasattr(user, 'profile') and hasattr(self.author, 'profile'):
-                return self.author.profile.followers.filter(pk=user.profile.pk).exists()
-            return False
-        return False
+        """Разовая проверка; в представлениях - audience.for_request(request), подписки грузятся раз на запрос."""
+        return Audience(user).can_view(self)
 
 
 # --- Модель Comment ---
-# (остается без изменений)
+class CommentManager(Manager):
+    def thread(self, post_id):
+        """Все комментарии поста в порядке обхода дерева (один проход по индексу (post, path))."""
+        return self.get_queryset().filter(post_id=post_id).order_by("path")
+
+    def subtree(self, comment, include_self=True):
+        """Комментарий и все ответы под ним: диапазон path в [path, следующий префикс)."""
+        lower = {"path__gte" if include_self else "path__gt": comment.path}
+        return self.get_queryset().filter(
+            post_id=comment.post_id, path__lt=Comment.path_upper_bound(comment.path), **lower
+        ).order_by("path")
+
+    def rebuild_replies_counts(self, post_ids=None):
+        """Пересчитывает replies_count (число прямых ответов) у комментариев постов post_ids или у всех."""
+        replies = self.get_queryset().filter(parent=OuterRef("pk")).order_by().values("parent").annotate(c=Count("pk")).values("c")
+        qs = self.get_queryset()
+        if post_ids is not None:
+            qs = qs.filter(post_id__in=list(post_ids))
+        return qs.update(replies_count=Coalesce(Subquery(replies), 0))
+
+
 class Comment(models.Model):
+    MAX_DEPTH = 5  # Глубже отвечать нельзя (глубина корневого комментария - 0)
+    PATH_STEP = 10  # Сегмент пути - pk, дополненный нулями; путь состоит только из цифр
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments", verbose_name="Пост")
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="comments", verbose_name="Автор")
     content = models.TextField("Текст комментария")
     created_at = models.DateTimeField("Создано", auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField("Изменено", auto_now=True)
     parent = models.ForeignKey("self", null=True, blank=True, on_delete=models.CASCADE, related_name="replies", verbose_name="Родительский комментарий")
-    class Meta: verbose_name = "Комментарий"; verbose_name_plural = "Комментарии"; ordering = ["created_at"]
+    # Материализованный путь (pk предков и свой) и глубина - заполняются в save()
+    path = models.CharField("Путь", max_length=255, default="", editable=False)
+    depth = models.PositiveSmallIntegerField("Глубина", default=0, editable=False)
+    # Число прямых ответов: обновляется в add_comment / delete_comment, в админке - rebuild_counters
+    replies_count = models.PositiveIntegerField("Ответы", default=0, editable=False)
+
+    objects = CommentManager()
+
+    class Meta:
+        verbose_name = "Комментарий"; verbose_name_plural = "Комментарии"; ordering = ["created_at"]
+        indexes = [models.Index(fields=["post", "path"], name="comment_post_path_idx")]
     def __str__(self): return f'Комментарий от {self.author} к "{self.post.title[:30]}..."'
     @property
     def is_parent(self): return self.parent is None
 
+    @classmethod
+    def path_segment(cls, pk): return str(pk).zfill(cls.PATH_STEP)
+
+    @staticmethod
+    def path_upper_bound(path):
+        """Наименьшая строка той же длины, большая всех путей с префиксом path (только цифры - не зависит от collation)."""
+        return str(int(path) + 1).zfill(len(path))
+
+    def clean(self):
+        if self.parent_id:
+            if self.parent.post_id != self.post_id:
+                raise ValidationError({"parent": "Родительский комментарий относится к другому посту."})
+            if self.path and self.parent.path.startswith(self.path):
+                raise ValidationError({"parent": "Нельзя сделать родителем сам комментарий или ответ на него."})
+
+    def save(self, *args, **kwargs):
+        prefix = self.parent.path if self.parent_id else ""
+        self.depth = len(prefix) // self.PATH_STEP
+        old_path = self.path
+        if not old_path:
+            # pk известен только после INSERT - дописываем путь вторым UPDATE в той же транзакции
+            super().save(*args, **kwargs)
+            self.path = prefix + self.path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+            return
+        self.path = prefix + old_path[-self.PATH_STEP:]
+        super().save(*args, **kwargs)
+        if self.path != old_path:
+            # Сменился родитель (админка) - переносим поддерево одним UPDATE
+            Comment.objects.filter(post_id=self.post_id, path__gt=old_path, path__lt=self.path_upper_bound(old_path)).update(
+                path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                depth=F("depth") + (len(self.path) - len(old_path)) // self.PATH_STEP,
+            )
+
 # --- Модель Vote ---
 # (остается без изменений)
 class Vote(models.Model):
@@ -179,7 +327,44 @@ class Vote(models.Model):
         verbose_name = "Голос"; verbose_name_plural = "Голоса"
         constraints = [models.UniqueConstraint(fields=["user", "content_type", "object_id"], name="unique_user_content_vote")]
         indexes = [models.Index(fields=["content_type", "object_id"])]
+    @classmethod
+    def counter_field(cls, vote_type):
+        """Имя счетчика на Post, соответствующего типу голоса."""
+        return "likes_count" if vote_type == cls.LIKE else "dislikes_count"
     def __str__(self):
         try: content_repr = str(self.content_object) if self.content_object else "Объект удален"
         except Exception: content_repr = f"Объект ({self.content_type} ID: {self.object_id})"
-        return f"{self.user} - {self.get_vote_type_display()} ({content_repr})"
\ No newline at end of file
+        return f"{self.user} - {self.get_vote_type_display()} ({content_repr})"
+
+# --- Модель PostVote (компактное хранилище голосов за посты) ---
+class PostVote(models.Model):
+    """
+    Голос за пост в узкой таблице (post, user, value): голоса зрителя на странице и счетчики читаются
+    одним проходом по индексу, без ContentType. Vote пишется параллельно (posts.votes).
+    """
+    # Индексы по FK не нужны: их покрывают unique (user, post) и (post, value)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+", db_index=False, verbose_name="Пост")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", db_index=False, verbose_name="Пользователь")
+    value = models.SmallIntegerField("Голос", choices=Vote.VOTE_CHOICES)
+    class Meta:
+        verbose_name = "Голос за пост"; verbose_name_plural = "Голоса за посты"
+        constraints = [models.UniqueConstraint(fields=["user", "post"], name="unique_post_vote_user_post")]
+        indexes = [models.Index(fields=["post", "value"], name="post_vote_post_value_idx")]
+    def __str__(self): return f"{self.user_id} -> пост {self.post_id}: {self.value}"
+
+# --- Модель TimelineEntry (лента подписчика, fan-out on write) ---
+class TimelineEntry(models.Model):
+    """Материализованная запись ленты: пост автора, на которого подписан owner. Заполняется в posts.timeline."""
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeline_entries", verbose_name="Владелец ленты")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries", verbose_name="Пост")
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+", verbose_name="Автор поста")
+    published_at = models.DateTimeField("Дата публикации")
+    class Meta:
+        verbose_name = "Запись ленты"; verbose_name_plural = "Записи лент"
+        constraints = [models.UniqueConstraint(fields=["owner", "post"], name="unique_timeline_owner_post")]
+        indexes = [
+            # Чтение ленты - один диапазонный проход по этому индексу
+            models.Index(fields=["owner", "-published_at", "-post"], name="timeline_owner_published_idx"),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ]
+    def __str__(self): return f"Лента {self.owner_id}: пост {self.post_id}"
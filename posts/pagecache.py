@@ -0,0 +1,178 @@
+# posts/pagecache.py
+"""
+Кеш целых страниц для анонимных читателей (список постов, категории, детальная страница) с
+точечным сбросом по суррогатным ключам. Подключается к CBV через AsyncPageCacheMixin (serve_async).
+
+Представление помечает страницу ключами (tag): post:<id>, author:<user_id>, category:<id>,
+'posts' (состав списков), 'categories' (сайдбар) и 'ranking' (списки с сортировкой по оценке).
+Для каждого ключа в кеше хранится метка - время последнего сброса; purge() ставит новую метку, а закешированная страница отдается, только
+если все ее метки на месте и не новее момента, когда страницу начали строить. Так сброс во время
+отрисовки тоже не дает сохранить устаревшую страницу, а вытесненная метка просто дает промах.
+
+Что не кешируется: запросы авторизованных пользователей и не-GET/HEAD; запросы, у которых есть
+непоказанные сообщения (messages иначе потерялись бы); ответы, которые использовали CSRF-токен
+(в HTML попал бы чужой токен), ставят cookie или вывели сообщения. Анонимные страницы форм с
+токеном не содержат: голосование и комментарии доступны только после входа.
+"""
+
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from . import replicas
+from .asynchttp import aget_user
+
+POSTS = 'posts'
+CATEGORIES = 'categories'
+RANKING = 'ranking'
+# Заголовки, которые сохраняются вместе со страницей
+STORED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+def timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def _mark_key(key):
+    return f'pagecache:key:{key}'
+
+
+def _page_key(request):
+    url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'pagecache:page:{url}'
+
+
+# --- Суррогатные ключи ---
+def post_keys(post):
+    """Ключи страниц, на которых виден пост: сам пост, его автор и категория."""
+    keys = [f'post:{post.pk}', f'author:{post.author_id}']
+    if post.category_id:
+        keys.append(f'category:{post.category_id}')
+    return keys
+
+
+def tag(request, *keys):
+    """Помечает страницу текущего запроса ключами (учитываются, только если ее кеширует serve_async)."""
+    request.surrogate_keys = getattr(request, 'surrogate_keys', set()) | set(keys)
+
+
+def purge(*keys):
+    """Сбрасывает все страницы с любым из keys (после коммита текущей транзакции)."""
+    if keys:
+        transaction.on_commit(lambda: cache.set_many({_mark_key(key): time.time() for key in keys}, timeout()))
+
+
+def purge_post(post):
+    purge(*post_keys(post))
+
+
+# --- Чтение и запись страниц ---
+def pending_messages(request):
+    """Число сообщений messages, которые запрос еще не показал (без пометки прочитанными)."""
+    return len(messages.get_messages(request)) if hasattr(request, '_messages') else 0
+
+
+def _cacheable_request(request):
+    return (request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+            and not pending_messages(request))
+
+
+def _cacheable_response(request, response):
+    storage = getattr(request, '_messages', None)
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and getattr(request, 'surrogate_keys', None)
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            and not (storage is not None and (storage.used or len(storage))))
+
+
+async def _afetch(request):
+    entry = await cache.aget(_page_key(request))
+    if entry is None:
+        return None
+    return _cached_response(request, entry, await cache.aget_many([_mark_key(key) for key in entry['keys']]))
+
+
+def _cached_response(request, entry, marks):
+    if len(marks) < len(entry['keys']) or any(mark > entry['started'] for mark in marks.values()):
+        return None
+    response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    for header, value in entry['headers'].items():
+        response.headers[header] = value
+    # Валидаторы страницы (posts.conditional) действуют и для копии из кеша
+    return get_conditional_response(
+        request, etag=response.get('ETag'), last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+        response=response,
+    )
+
+
+def _entry(request, response, started):
+    # Страница с реплики отражает данные на момент started минус отставание реплики (posts.replicas)
+    started -= replicas.read_staleness()
+    return {
+        'keys': sorted(request.surrogate_keys), 'started': started,
+        'content': response.content, 'content_type': response['Content-Type'],
+        'headers': {header: response[header] for header in STORED_HEADERS if response.has_header(header)},
+    }
+
+
+async def _astore(request, response, started):
+    entry = _entry(request, response, started)
+    marks = await cache.aget_many([_mark_key(key) for key in entry['keys']])
+    for key in entry['keys']:
+        if _mark_key(key) not in marks:
+            await cache.aadd(_mark_key(key), entry['started'], timeout())
+    await cache.aset(_page_key(request), entry, timeout())
+
+
+def _rendered(response):
+    if hasattr(response, 'render') and callable(response.render):
+        response = response.render()
+    return response
+
+
+async def serve_async(request, get_response):
+    """
+    Отдает анонимному читателю страницу из кеша или строит ее корутиной get_response() и кеширует
+    помеченный (tag) ответ. Попадание в кеш обслуживается целиком в event loop; шаблонный ответ
+    рендерится в потоке (шаблоны синхронные).
+    """
+    await aget_user(request)
+    if not _cacheable_request(request):
+        return await get_response()
+    cached = await _afetch(request)
+    if cached is not None:
+        return cached
+    started = time.time()
+    response = await get_response()
+    if request.method == 'GET':
+        if hasattr(response, 'render') and not response.is_rendered:
+            response = await sync_to_async(_rendered)(response)
+        if _cacheable_response(request, response):
+            await _astore(request, response, started)
+    return response
+
+
+class AsyncPageCacheMixin:
+    """
+    Асинхронный get для CBV с кешем анонимных страниц. Асинхронно только попадание в кеш: оно
+    отдается без перехода в поток. Промах (и любой запрос вошедшего) - это синхронный get
+    представления (ORM, шаблоны) и рендер одним вызовом sync_to_async, то есть та же работа в потоке,
+    что и под WSGI.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        sync_get = super().get
+
+        def render():
+            return _rendered(sync_get(request, *args, **kwargs))
+
+        return await serve_async(request, sync_to_async(render))
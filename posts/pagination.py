@@ -0,0 +1,148 @@
+# posts/pagination.py
+
+import base64
+import json
+
+from django.db.models import F, Q
+from django.http import Http404
+
+
+class InvalidCursor(Exception):
+    """Курсор из query string не удалось разобрать."""
+
+
+class CursorPage:
+    """Страница keyset-пагинации. Общего количества и номера страницы нет - они требуют COUNT(*)."""
+    is_cursor = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset (cursor) пагинация: следующая страница - это строки "после" ключа последней строки
+    в порядке ordering, поэтому стоимость не зависит от глубины (нет OFFSET и COUNT).
+
+    ordering - поля в порядке сортировки ('-published_at', '-created_at', '-id'); последнее поле
+    должно быть уникальным. NULL считается меньше любого значения (NULLS LAST при DESC) -
+    так черновики без published_at идут в конце, как при сортировке по '-is_published'.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-published_at', '-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    # --- Токены ---
+    def encode_cursor(self, obj, direction):
+        # isoformat() сохраняет микросекунды (DjangoJSONEncoder обрезает их до миллисекунд)
+        key = [getattr(obj, name) for name, _ in self.fields]
+        key = [value.isoformat() if hasattr(value, 'isoformat') else value for value in key]
+        raw = json.dumps({'d': direction, 'k': key}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            data = json.loads(raw)
+            direction, key = data['d'], data['k']
+            if direction not in ('n', 'p') or len(key) != len(self.fields):
+                raise ValueError
+            model_meta = self.queryset.model._meta
+            values = [None if value is None else model_meta.get_field(name).to_python(value)
+                      for (name, _), value in zip(self.fields, key)]
+        except Exception as e:
+            raise InvalidCursor(token) from e
+        return direction, values
+
+    # --- Построение запроса ---
+    def _order_by(self, reverse=False):
+        exprs = []
+        for name, descending in self.fields:
+            if descending != reverse:
+                exprs.append(F(name).desc(nulls_last=True))
+            else:
+                exprs.append(F(name).asc(nulls_first=True))
+        return exprs
+
+    @staticmethod
+    def _beyond(name, value, descending):
+        """Условие "поле строго дальше value" в направлении обхода (NULL - минимум)."""
+        if descending:
+            if value is None:
+                return Q(pk__in=[])
+            return Q(**{f'{name}__lt': value}) | Q(**{f'{name}__isnull': True})
+        return Q(**{f'{name}__isnull': False}) if value is None else Q(**{f'{name}__gt': value})
+
+    @staticmethod
+    def _equal(name, value):
+        return Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+    def _seek_q(self, values, reverse=False):
+        # (a, b, c) "после" (va, vb, vc): a > va ИЛИ (a = va И (b > vb ИЛИ (b = vb И c > vc)))
+        condition = None
+        for (name, descending), value in reversed(list(zip(self.fields, values))):
+            beyond = self._beyond(name, value, descending != reverse)
+            condition = beyond if condition is None else beyond | (self._equal(name, value) & condition)
+        return condition
+
+    def page(self, token=None):
+        """Возвращает страницу по токену курсора (None - первая страница)."""
+        direction, values = ('n', None) if not token else self.decode_cursor(token)
+        reverse = direction == 'p'
+        queryset = self.queryset.order_by(*self._order_by(reverse=reverse))
+        if values is not None:
+            queryset = queryset.filter(self._seek_q(values, reverse=reverse))
+
+        rows = list(queryset[:self.per_page + 1])  # +1 строка, чтобы узнать, есть ли еще
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if rows and has_previous else None,
+        )
+
+
+class CursorPaginationMixin:
+    """Подменяет OFFSET-пагинацию ListView на keyset (?cursor=<токен>)."""
+    cursor_ordering = ('-published_at', '-created_at', '-id')
+    cursor_query_param = 'cursor'
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, ordering=self.get_cursor_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор страницы.")
+        return (paginator, page, page.object_list, page.has_other_pages())
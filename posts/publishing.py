@@ -0,0 +1,49 @@
+# posts/publishing.py
+"""
+Перевод запланированных постов в опубликованные. Один проход - диапазон по индексу
+(status, published_at): status='scheduled' AND published_at <= now. После коммита для каждого
+переведенного поста отправляется сигнал post_became_visible (ленты, кеши и т.п.).
+"""
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Post
+from .signals import post_became_visible
+
+BATCH_SIZE = 500
+
+
+def due_posts(now):
+    return Post.objects.filter(status=Post.STATUS_SCHEDULED, published_at__lte=now)
+
+
+def next_due_at():
+    """Время ближайшей запланированной публикации (или None)."""
+    return (Post.objects.filter(status=Post.STATUS_SCHEDULED)
+            .order_by('published_at').values_list('published_at', flat=True).first())
+
+
+def publish_due(now=None, batch_size=BATCH_SIZE):
+    """Публикует все наступившие посты. Возвращает число переведенных постов."""
+    now = now or timezone.now()
+    published = 0
+    while True:
+        with transaction.atomic():
+            # skip_locked: несколько воркеров не берут одни и те же строки (на SQLite игнорируется)
+            post_ids = list(
+                due_posts(now).order_by('published_at').select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not post_ids:
+                return published
+            # Повторная проверка статуса в UPDATE - пост могли снять с публикации после выборки
+            Post.objects.filter(pk__in=post_ids, status=Post.STATUS_SCHEDULED).update(status=Post.STATUS_PUBLISHED)
+            posts = list(Post.objects.filter(pk__in=post_ids, status=Post.STATUS_PUBLISHED))
+            transaction.on_commit(lambda posts=posts: _notify(posts))
+        published += len(posts)
+
+
+def _notify(posts):
+    for post in posts:
+        post_became_visible.send(sender=Post, instance=post)
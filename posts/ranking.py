@@ -0,0 +1,116 @@
+# posts/ranking.py
+"""
+Сортировки списков постов ?sort=hot|top_day|top_week по заранее посчитанным колонкам Post.
+
+score - баланс поста: лайки - дизлайки + COMMENT_WEIGHT * комментарии. hot_score - "горячесть":
+порядок величины баланса (log10) плюс время публикации в единицах RANKING_HOT_DECAY_SECONDS, так что
+новый пост с тем же балансом выше старого, а чтобы обойти более новый пост, старому нужно в 10 раз
+больше голосов за каждый такой интервал. Оценка не зависит от текущего времени, поэтому пересчитывать
+нужно только посты с новой активностью.
+
+Воркер rank_posts пересчитывает посты, чьи счетчики изменились (counters_updated_at) с прошлого прохода,
+и сбрасывает кеш страниц с сортировкой (ключ pagecache.RANKING). Новый пост получает оценку сразу при
+сохранении (posts.signals). "Лучшие за день/неделю" - посты, опубликованные за период, по score.
+Видимость по-прежнему применяет PostManager.get_visible_posts_for_user.
+"""
+
+import math
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import pagecache
+from .models import Post
+
+HOT, TOP_DAY, TOP_WEEK = 'hot', 'top_day', 'top_week'
+SORT_CHOICES = (('', 'Новые'), (HOT, 'Горячие'), (TOP_DAY, 'Лучшие за день'), (TOP_WEEK, 'Лучшие за неделю'))
+TOP_PERIODS = {TOP_DAY: timedelta(days=1), TOP_WEEK: timedelta(days=7)}
+# Порядок для keyset-пагинации; последнее поле уникально
+ORDERINGS = {
+    HOT: ('-hot_score', '-id'),
+    TOP_DAY: ('-score', '-published_at', '-id'),
+    TOP_WEEK: ('-score', '-published_at', '-id'),
+}
+COMMENT_WEIGHT = 0.5
+# Точка отсчета времени в hot_score (меньше значения - меньше потеря точности float)
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+BATCH_SIZE = 500
+REFRESHED_AT_KEY = 'ranking:refreshed_at'
+# Запас по времени: счетчики, обновленные в еще не закоммиченной транзакции, попадут в следующий проход
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+
+def hot_decay_seconds():
+    return getattr(settings, 'RANKING_HOT_DECAY_SECONDS', 45000)
+
+
+def scores(likes, dislikes, comments, published_at):
+    """(score, hot_score) по счетчикам и времени публикации."""
+    score = likes - dislikes + COMMENT_WEIGHT * comments
+    order = math.log10(max(abs(score), 1))
+    sign = (score > 0) - (score < 0)
+    return score, round(sign * order + (published_at - EPOCH).total_seconds() / hot_decay_seconds(), 7)
+
+
+# --- Чтение ---
+def get_sort(value):
+    """Допустимое значение ?sort= или '' (хронологический порядок)."""
+    return value if value in ORDERINGS else ''
+
+
+def ranked(queryset, sort, now=None):
+    """Опубликованные посты queryset для сортировки sort (для "лучших" - только за период)."""
+    queryset = queryset.filter(status=Post.STATUS_PUBLISHED)
+    if sort in TOP_PERIODS:
+        queryset = queryset.filter(published_at__gte=(now or timezone.now()) - TOP_PERIODS[sort])
+    return queryset
+
+
+# --- Пересчет ---
+def refresh(post_ids):
+    """Пересчитывает оценки постов post_ids; возвращает число постов, у которых оценка изменилась."""
+    rows = Post.objects.filter(pk__in=list(post_ids)).values_list(
+        'pk', 'likes_count', 'dislikes_count', 'comments_count', 'published_at', 'created_at', 'score', 'hot_score')
+    posts = []
+    for pk, likes, dislikes, comments, published_at, created_at, old_score, old_hot_score in rows:
+        score, hot_score = scores(likes, dislikes, comments, published_at or created_at)
+        if (score, hot_score) != (old_score, old_hot_score):
+            posts.append(Post(pk=pk, score=score, hot_score=hot_score))
+    Post.objects.bulk_update(posts, ['score', 'hot_score'], batch_size=BATCH_SIZE)
+    return len(posts)
+
+
+def _refresh_queryset(queryset, batch_size):
+    total, batch = 0, []
+    for pk in queryset.order_by().values_list('pk', flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            total += refresh(batch)
+            batch = []
+    return total + (refresh(batch) if batch else 0)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Пересчитывает оценки всех постов; возвращает число изменившихся."""
+    return _refresh_queryset(Post.objects.all(), batch_size)
+
+
+def refresh_due(batch_size=BATCH_SIZE):
+    """
+    Проход воркера: посты с активностью после прошлого прохода (при первом запуске или потере
+    метки в кеше - все посты); возвращает число постов с изменившейся оценкой.
+    """
+    started = timezone.now()
+    refreshed_at = cache.get(REFRESHED_AT_KEY)
+    if refreshed_at is None:
+        total = rebuild(batch_size)
+    else:
+        total = _refresh_queryset(
+            Post.objects.filter(counters_updated_at__gte=refreshed_at - REFRESH_OVERLAP), batch_size)
+    cache.set(REFRESHED_AT_KEY, started, None)
+    if total:
+        pagecache.purge(pagecache.RANKING)
+    return total
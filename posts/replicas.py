@@ -0,0 +1,196 @@
+# posts/replicas.py
+"""
+Чтение с реплик БД: роутер ReplicaRouter и ReplicaMiddleware.
+
+На реплику уходят только чтения GET/HEAD-запросов к представлениям с атрибутом replica_reads = True
+(списки и страницы постов, лента, профиль, списки подписок), кроме сессий и пользователей; все
+остальное - запись, формы, воркеры, команды - работает с default. Реплика выбирается одна на
+запрос из здоровых.
+
+Read-your-writes: первая запись в запросе (любой db_for_write, включая сохранение сессии при входе)
+переводит остаток запроса на default, а ответ ставит cookie PIN_COOKIE на REPLICA_STICKY_SECONDS -
+пока она есть, все запросы браузера читают с default. REPLICA_STICKY_SECONDS должно быть больше
+REPLICA_MAX_LAG_SECONDS.
+
+Здоровье: раз в REPLICA_CHECK_INTERVAL процесс меряет отставание реплик; недоступная или
+отстающая больше REPLICA_MAX_LAG_SECONDS реплика не используется (нет здоровых - читаем с default).
+PostgreSQL - по времени последней примененной транзакции (0, если весь полученный WAL применен),
+SQLite-копии - по времени последнего копирования (copy_sqlite_replicas). Кеш страниц
+(posts.pagecache) сохраняет страницу, собранную с реплики, как начатую раньше на величину
+отставания, поэтому сброс после записи отменяет и ее. Общие производные кеши без такой метки
+(индекс категорий, последние посты авторов ленты, число подписчиков, граф подписок) строятся
+запросами к default даже внутри replica_reads-представлений.
+
+Локально: DJANGO_DB_REPLICAS="db_replica.sqlite3" и manage.py copy_sqlite_replicas --loop.
+Для двух PostgreSQL (основной и потоковая реплика) - алиас реплики в DATABASES с
+"TEST": {"MIRROR": "default"} и его имя в DATABASE_REPLICAS.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+PIN_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD')
+# Сессия и пользователь определяют, кто делает запрос (вход только что мог записать их), - только default
+PRIMARY_APPS = ('auth', 'sessions')
+
+_PG_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 15)
+
+
+def max_lag():
+    return getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 10)
+
+
+def check_interval():
+    return getattr(settings, 'REPLICA_CHECK_INTERVAL', 5)
+
+
+# --- Здоровье реплик ---
+def replica_lag(alias):
+    """Отставание реплики в секундах или None, если она недоступна или отставание неизвестно."""
+    connection = connections[alias]
+    try:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(_PG_LAG_SQL)
+                lag = cursor.fetchone()[0]
+            return float(lag) if lag is not None else None
+        if connection.vendor == 'sqlite':
+            return max(time.time() - os.path.getmtime(connection.settings_dict['NAME']), 0.0)
+    except (DatabaseError, OSError):
+        return None
+    return 0.0
+
+
+_health = {'checked': None, 'lags': {}}
+_health_lock = threading.Lock()
+
+
+def healthy_replicas():
+    """{alias: верхняя оценка отставания} здоровых реплик; проверка - не чаще REPLICA_CHECK_INTERVAL на процесс."""
+    checked = _health['checked']
+    if (checked is None or time.monotonic() - checked >= check_interval()) and _health_lock.acquire(blocking=False):
+        # Проверяет один поток, остальные пока читают прошлый результат
+        try:
+            _health['lags'] = {alias: replica_lag(alias) for alias in replica_aliases()}
+            _health['checked'] = checked = time.monotonic()
+        finally:
+            _health_lock.release()
+    if checked is None:
+        return {}
+    # С момента проверки реплика могла отстать еще на столько же
+    since_check = time.monotonic() - checked
+    return {alias: lag + since_check for alias, lag in _health['lags'].items() if lag is not None and lag <= max_lag()}
+
+
+# --- Состояние запроса ---
+class _RequestState:
+    __slots__ = ('request', 'pinned', 'wrote', 'replica', 'staleness')
+
+    def __init__(self, request):
+        self.request = request
+        self.pinned = request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+        self.wrote = False
+        self.replica = None
+        self.staleness = 0.0
+
+
+_state = ContextVar('replica_state', default=None)
+
+
+def read_staleness():
+    """На сколько секунд данные текущего запроса могут отставать от default (0 - читали только default)."""
+    state = _state.get()
+    return state.staleness if state is not None and state.replica is not None else 0.0
+
+
+def _replica_view(func):
+    return getattr(getattr(func, 'view_class', func), 'replica_reads', False)
+
+
+class ReplicaRouter:
+    """Чтения помеченных представлений - на реплику, все остальное - на default."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.pinned or model._meta.app_label in PRIMARY_APPS:
+            return None
+        if state.replica is None:
+            # Решение принимается на первом чтении после выбора представления (до него - сессия и пользователь)
+            match = state.request.resolver_match
+            if match is None or not _replica_view(match.func):
+                return None
+            replicas = healthy_replicas()
+            if not replicas:
+                state.pinned = True
+                return None
+            state.replica = random.choice(list(replicas))
+            state.staleness = replicas[state.replica]
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема реплик приходит с основной БД (репликация или копирование)
+        return False if db in replica_aliases() else None
+
+
+@sync_and_async_middleware
+def ReplicaMiddleware(get_response):
+    """Задает состояние роутера на запрос и ставит cookie PIN_COOKIE после записи."""
+
+    def finish(state, response):
+        if state.wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=sticky_seconds(), httponly=True, samesite='Lax')
+        return response
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            state = _RequestState(request)
+            token = _state.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _state.reset(token)
+            return finish(state, response)
+    else:
+        def middleware(request):
+            state = _RequestState(request)
+            token = _state.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _state.reset(token)
+            return finish(state, response)
+    return middleware
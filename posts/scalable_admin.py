@@ -0,0 +1,107 @@
+# posts/scalable_admin.py
+"""
+Режим производительности админки для больших таблиц (посты, комментарии, голоса, профили).
+
+- EstimatedCountPaginator: для нефильтрованного списка число строк берется из статистики СУБД
+  (pg_class.reltuples / sqlite_stat1), а не COUNT(*) по всей таблице; полный счетчик
+  "N всего" отключен (show_full_result_count).
+- AutocompleteFilter: фильтр по внешнему ключу без списка всех значений в сайдбаре - поле
+  автодополнения на стандартном autocomplete view админки (select2).
+- date_hierarchy с ограничением: если в текущей выборке больше ADMIN_DATE_HIERARCHY_MAX_ROWS
+  строк, уровни строятся по диапазону MIN/MAX, без DISTINCT по датам (тег capped_date_hierarchy).
+"""
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(model, using='default'):
+    """Оценка числа строк таблицы модели по статистике СУБД или None, если статистики нет."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # reltuples обновляют ANALYZE/autovacuum; -1 - таблица еще не анализировалась
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+                row = cursor.fetchone()
+                return row[0] if row and row[0] >= 0 else None
+            if connection.vendor == 'sqlite':
+                # sqlite_stat1 появляется после ANALYZE; первое число stat - строк в таблице
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+                if cursor.fetchone() is None:
+                    return None
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                row = cursor.fetchone()
+                return int(row[0].split()[0]) if row else None
+    except DatabaseError:
+        return None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator changelist: большая таблица без фильтров считается по оценке, остальное - точно."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= getattr(settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000):
+                return estimate
+        return super().count
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Фильтр по ForeignKey с автодополнением: list_filter = [('author', AutocompleteFilter)].
+    Поиск идет через autocomplete view по search_fields админки связанной модели.
+    """
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.attname}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.field_name = field.name
+        # Подпись выбранного значения - один запрос по PK вместо списка всех объектов
+        self.selected_label = None
+        if self.lookup_val:
+            selected = field.remote_field.model._default_manager.filter(pk=self.lookup_val).first()
+            self.selected_label = str(selected) if selected is not None else self.lookup_val
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is not None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': self.selected_label,
+        }
+
+
+class ScalableAdminMixin:
+    """Подключает к ModelAdmin оценочный paginator, фильтры автодополнения и ограниченный date_hierarchy."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    change_list_template = 'admin/scalable_change_list.html'
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, (list, tuple)) and issubclass(list_filter[1], AutocompleteFilter):
+                # JS/CSS select2 и autocomplete.js - те же, что у виджета autocomplete_fields
+                field = self.model._meta.get_field(list_filter[0])
+                return media + AutocompleteSelect(field, self.admin_site).media
+        return media
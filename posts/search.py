@@ -0,0 +1,221 @@
+# posts/search.py
+"""
+Полнотекстовый поиск по постам (заголовок и текст) с учетом русской морфологии.
+
+SQLite: виртуальная таблица FTS5 posts_post_fts(title, content), rowid = id поста. В нее пишутся
+основы слов (posts.stemmer), запрос стеммится так же; ранжирование bm25 с весом заголовка.
+Postgres: таблица posts_post_search(post_id, document tsvector) с GIN-индексом, словарь 'russian'
+(заголовок - вес A, текст - вес B), ранжирование ts_rank_cd.
+Другие СУБД: icontains без индекса.
+
+Таблицы индекса создает миграция 0013, заполняет - перестройка после migrate (posts.signals).
+Индекс обновляется после коммита сохранения/удаления поста (posts.signals), полная перестройка -
+команда rebuild_search_index. Индекс видимость не знает: найденные id пачками фильтруются тем же
+PostManager.get_visible_posts_for_user, что и списки, пока не наберется SEARCH_MAX_RESULTS видимых
+или не будет прочитано SEARCH_MAX_PAGES пачек (запрос, совпадающий в основном со скрытыми от зрителя
+постами, не проходит весь индекс на каждом запросе).
+Последнее слово запроса ищется по префиксу, чтобы результаты обновлялись по мере ввода.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+
+from .models import Post
+from .stemmer import stem
+
+WORD_RE = re.compile(r'\w+')
+# Служебные слова не сужают выдачу (словарь 'russian' в Postgres отбрасывает их сам)
+STOP_WORDS = frozenset('а б бы в во да до же за и из или к ко ли на не ни но о об от по с со то у'.split())
+
+
+def max_results():
+    return getattr(settings, 'SEARCH_MAX_RESULTS', 200)
+
+
+def max_pages():
+    return getattr(settings, 'SEARCH_MAX_PAGES', 5)
+
+
+def words(text):
+    return WORD_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def query_words(query):
+    return [word for word in words(query) if word not in STOP_WORDS][:10]
+
+
+def stemmed(text):
+    return ' '.join(stem(word) for word in words(text))
+
+
+# --- Бэкенды индекса ---
+class SqliteBackend:
+    table = 'posts_post_fts'  # Создается миграцией 0013
+    # Строк (id) в одном запросе: у INSERT по 3 параметра на строку, SQLite до 3.32 принимает не больше 999
+    batch_size = 300
+
+    def index(self, cursor, rows):
+        rows = [(pk, stemmed(title), stemmed(content)) for pk, title, content in rows]
+        self.remove(cursor, [pk for pk, _, _ in rows])
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            # Один INSERT на пачку: executemany ломает отладочный курсор (DEBUG, debug_toolbar)
+            cursor.execute(
+                f"INSERT INTO {self.table} (rowid, title, content) VALUES "
+                + ', '.join(['(%s, %s, %s)'] * len(batch)),
+                [value for row in batch for value in row],
+            )
+
+    def remove(self, cursor, post_ids):
+        post_ids = list(post_ids)
+        for start in range(0, len(post_ids), self.batch_size):
+            batch = post_ids[start:start + self.batch_size]
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(batch))})", batch)
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {self.table}")
+
+    def match(self, cursor, query, limit, offset=0):
+        terms = [stem(word) for word in query_words(query)]
+        if not terms:
+            return []
+        # Слова в кавычках (синтаксис FTS5 не интерпретируется), последнее - по префиксу; пробел = AND
+        expression = ' '.join(f'"{term}"' for term in terms) + '*'
+        cursor.execute(
+            f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+            f"ORDER BY bm25({self.table}, 10.0, 1.0), rowid LIMIT %s OFFSET %s",
+            [expression, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    table = 'posts_post_search'  # Создается миграцией 0013
+    document = "setweight(to_tsvector('russian', %s), 'A') || setweight(to_tsvector('russian', %s), 'B')"
+
+    def index(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {self.table} (post_id, document) VALUES (%s, {self.document}) "
+            f"ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+            list(rows),
+        )
+
+    def remove(self, cursor, post_ids):
+        cursor.execute(f"DELETE FROM {self.table} WHERE post_id = ANY(%s)", [list(post_ids)])
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {self.table}")
+
+    def match(self, cursor, query, limit, offset=0):
+        terms = query_words(query)
+        if not terms:
+            return []
+        # Слова - только \w+, поэтому синтаксис tsquery не нарушается; последнее - по префиксу
+        expression = ' & '.join(terms) + ':*'
+        cursor.execute(
+            f"SELECT post_id FROM {self.table}, to_tsquery('russian', %s) query "
+            f"WHERE document @@ query ORDER BY ts_rank_cd(document, query) DESC, post_id LIMIT %s OFFSET %s",
+            [expression, limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class FallbackBackend:
+    """Без индекса: поиск подстроки (для СУБД без FTS)."""
+
+    def index(self, cursor, rows):
+        pass
+
+    def remove(self, cursor, post_ids):
+        pass
+
+    def clear(self, cursor):
+        pass
+
+    def match(self, cursor, query, limit, offset=0):
+        condition = Q()
+        for word in query_words(query):
+            condition &= Q(title__icontains=word) | Q(content__icontains=word)
+        if not condition:
+            return []
+        matched = Post.objects.filter(condition).order_by('-published_at', '-pk').values_list('pk', flat=True)
+        return list(matched[offset:offset + limit])
+
+
+BACKENDS = {'sqlite': SqliteBackend, 'postgresql': PostgresBackend}
+
+
+def get_backend(db_connection=None):
+    return BACKENDS.get((db_connection or connection).vendor, FallbackBackend)()
+
+
+# --- Обновление индекса ---
+def index_rows(rows, db_connection=None):
+    """Индексирует строки (id, title, content); уже проиндексированные посты перезаписываются."""
+    db_connection = db_connection or connection
+    rows = list(rows)
+    if rows:
+        with db_connection.cursor() as cursor:
+            get_backend(db_connection).index(cursor, rows)
+
+
+def update_post(post):
+    index_rows([(post.pk, post.title, post.content)])
+
+
+def remove_posts(post_ids):
+    post_ids = list(post_ids)
+    if post_ids:
+        with connection.cursor() as cursor:
+            get_backend().remove(cursor, post_ids)
+
+
+def rebuild(batch_size=500, using=DEFAULT_DB_ALIAS):
+    """Перестраивает индекс по всем постам; возвращает число проиндексированных."""
+    db_connection = connections[using]
+    with db_connection.cursor() as cursor:
+        get_backend(db_connection).clear(cursor)
+    total, batch = 0, []
+    rows = Post.objects.using(using).order_by('pk').values_list('pk', 'title', 'content')
+    for row in rows.iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            index_rows(batch, db_connection)
+            total, batch = total + len(batch), []
+    index_rows(batch, db_connection)
+    return total + len(batch)
+
+
+# --- Поиск ---
+def match_ids(query, limit=None, offset=0):
+    """id постов по релевантности без учета видимости (не более limit / SEARCH_MAX_RESULTS, начиная с offset)."""
+    with connection.cursor() as cursor:
+        return get_backend().match(cursor, query, limit or max_results(), offset)
+
+
+def search(query, user):
+    """id видимых пользователю постов по убыванию релевантности (не более SEARCH_MAX_RESULTS)."""
+    limit = max_results()
+    found = []
+    # Видимость проверяется до отсечения: индекс читается пачками, пока не наберется limit видимых,
+    # но не больше max_pages() пачек - дальше выдача для этого зрителя обрезается
+    for page in range(max_pages()):
+        ids = match_ids(query, limit, page * limit)
+        if not ids:
+            break
+        visible = set(Post.objects.get_visible_posts_for_user(
+            user, base_queryset=Post.objects.filter(pk__in=ids)
+        ).values_list('pk', flat=True))
+        found.extend(pk for pk in ids if pk in visible)
+        if len(found) >= limit or len(ids) < limit:
+            break
+    return found[:limit]
+
+
+def load_posts(post_ids):
+    """Посты для карточек в порядке post_ids."""
+    posts = Post.objects.select_related('author__profile', 'category').in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
@@ -0,0 +1,190 @@
+# posts/signals.py
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from users.models import Profile
+from users.signals import follow_changed
+
+from . import categories, feed, pagecache, ranking, search, timeline
+from .models import Category, Comment, Post
+
+# Пост стал виден читателям: опубликован сразу при сохранении или переведен из запланированных
+# (posts.publishing). Аргументы: sender=Post, instance. Отправляется после коммита транзакции.
+post_became_visible = Signal()
+
+# Поля, от которых зависит попадание поста в ленты подписчиков
+FEED_STATE_FIELDS = ('status', 'is_published', 'published_at', 'visibility')
+# Поля, состояние которых запоминается до сохранения (ленты + индекс категорий)
+TRACKED_FIELDS = FEED_STATE_FIELDS + ('category_id',)
+
+
+def _state(instance, fields):
+    return tuple(getattr(instance, field) for field in fields)
+
+
+def _state_before(instance, fields):
+    before = getattr(instance, '_state_before', None)
+    return None if before is None else tuple(before[field] for field in fields)
+
+
+# --- Ленты подписчиков: изменения постов ---
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    """Запоминаем состояние поста до сохранения, чтобы не делать fan-out при обычной правке текста."""
+    instance._state_before = None
+    if instance.pk and not raw:
+        instance._state_before = Post.objects.filter(pk=instance.pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(post_save, sender=Post)
+def sync_post_timelines(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = _state_before(instance, FEED_STATE_FIELDS)
+    if not created and _state(instance, FEED_STATE_FIELDS) == before:
+        return
+    was_published = before is not None and before[0] == Post.STATUS_PUBLISHED
+    if instance.status == Post.STATUS_PUBLISHED and not was_published:
+        transaction.on_commit(lambda: post_became_visible.send(sender=Post, instance=instance))
+    else:
+        transaction.on_commit(lambda: timeline.sync_post(instance))
+# Удаление поста чистит ленты каскадно (TimelineEntry.post on_delete=CASCADE)
+
+
+@receiver(post_became_visible)
+def fan_out_visible_post(sender, instance, **kwargs):
+    timeline.sync_post(instance)
+    feed.invalidate_author(instance.author_id)
+    categories.invalidate()
+
+
+# --- Кеш последних постов автора для чтения ленты (posts.feed) ---
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_author_feed_cache(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        author_id = instance.author_id
+        transaction.on_commit(lambda: feed.invalidate_author(author_id))
+
+
+# --- Индекс категорий (posts.categories): счетчики опубликованных постов ---
+@receiver(post_save, sender=Post)
+def invalidate_categories_on_post_save(sender, instance, created, raw=False, **kwargs):
+    # Публикация сама отправляет post_became_visible; здесь - снятие с публикации и смена категории
+    before = _state_before(instance, ('status', 'category_id'))
+    if raw or created or before is None:
+        return
+    published = instance.status == Post.STATUS_PUBLISHED
+    unpublished = before[0] == Post.STATUS_PUBLISHED and not published
+    recategorized = published and before[1] != instance.category_id
+    if unpublished or recategorized:
+        transaction.on_commit(categories.invalidate)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_categories_on_post_delete(sender, instance, **kwargs):
+    if instance.status == Post.STATUS_PUBLISHED and instance.category_id:
+        transaction.on_commit(categories.invalidate)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_categories_on_category_change(sender, **kwargs):
+    transaction.on_commit(categories.invalidate)
+
+
+# --- Кеш страниц для анонимных читателей (posts.pagecache) ---
+@receiver(post_save, sender=Post)
+def purge_pages_on_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    pagecache.purge_post(instance)
+    # Пост появился, исчез или переехал в списках - сбрасываем и страницы списков без него
+    if created or _state(instance, TRACKED_FIELDS) != _state_before(instance, TRACKED_FIELDS):
+        pagecache.purge(pagecache.POSTS)
+
+
+@receiver(post_delete, sender=Post)
+def purge_pages_on_post_delete(sender, instance, **kwargs):
+    pagecache.purge(pagecache.POSTS, *pagecache.post_keys(instance))
+
+
+@receiver(post_became_visible)
+def purge_pages_on_publish(sender, instance, **kwargs):
+    # Отложенная публикация (posts.publishing) меняет статус через update(), без post_save
+    pagecache.purge(pagecache.POSTS, *pagecache.post_keys(instance))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_pages_on_comment_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pagecache.purge(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def purge_pages_on_category_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pagecache.purge(f'category:{instance.pk}')
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_save, sender=Profile)
+def purge_pages_on_author_change(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Имя и аватар автора на карточках, детальной странице и в комментариях; вход (last_login) не в счет
+    if not raw and set(update_fields or ()) != {'last_login'}:
+        pagecache.purge(f'author:{getattr(instance, "user_id", instance.pk)}')
+
+
+# --- Валидаторы страницы поста (posts.conditional) ---
+@receiver(post_save, sender=Comment)
+def touch_post_on_comment_edit(sender, instance, created, raw=False, **kwargs):
+    # Добавление и удаление сдвигают comments_count вместе с counters_updated_at; правка - только отметку
+    if not created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(counters_updated_at=Now())
+
+
+# --- Полнотекстовый индекс (posts.search) ---
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: search.update_post(instance))
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    post_id = instance.pk
+    transaction.on_commit(lambda: search.remove_posts([post_id]))
+
+
+@receiver(post_migrate)
+def fill_search_index(sender, app_config, using, plan=None, **kwargs):
+    # Миграция 0013 создает пустой индекс; посты в него пишет текущий код поиска (стемминг - в Python)
+    created = any(
+        migration.app_label == 'posts' and migration.name == '0013_post_search_index' and not backwards
+        for migration, backwards in plan or ()
+    )
+    if app_config.label == 'posts' and created:
+        search.rebuild(using=using)
+
+
+# --- Ленты подписчиков: подписки/отписки (после коммита, см. users.signals.follow_changed) ---
+@receiver(follow_changed)
+def sync_follow_timelines(sender, follower, followees, followed, **kwargs):
+    handler = timeline.on_follow if followed else timeline.on_unfollow
+    for followee in followees:
+        handler(follower.user_id, followee.user_id)
+
+
+# --- Оценки для сортировок (posts.ranking) ---
+@receiver(post_save, sender=Post)
+def rank_post_on_save(sender, instance, created, raw=False, **kwargs):
+    # Остальное пересчитывает воркер rank_posts по counters_updated_at
+    if not raw and (created or _state(instance, ('published_at',)) != _state_before(instance, ('published_at',))):
+        post_id = instance.pk
+        transaction.on_commit(lambda: ranking.refresh([post_id]))
@@ -0,0 +1,91 @@
+# posts/stemmer.py
+"""
+Стеммер русского языка (алгоритм Snowball/Porter для русского) без внешних зависимостей.
+
+Используется поиском (posts.search) на SQLite: в индекс FTS5 и в запрос попадают основы слов,
+поэтому "программирование", "программы" и "программой" находят друг друга. На Postgres ту же
+работу делает словарь 'russian' в to_tsvector.
+"""
+
+import re
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND = re.compile(r'((ив|ивши|ившись|ыв|ывши|ывшись)|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$'
+)
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+DERIVATIONAL = re.compile(r'(ост|ость)$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def _regions(word):
+    """Начала областей RV и R2 (индексы в word)."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _cut(pattern, text):
+    """text без окончания pattern и признак, что окончание найдено."""
+    stripped = pattern.sub('', text, count=1)
+    return stripped, stripped != text
+
+
+def stem(word):
+    """Основа слова в нижнем регистре ('ё' приводится к 'е'); слова без гласных не меняются."""
+    word = word.lower().replace('ё', 'е')
+    rv_start, r2_start = _regions(word)
+    if rv_start >= len(word):
+        return word
+    prefix, rv = word[:rv_start], word[rv_start:]
+
+    # Шаг 1: деепричастие, иначе возвратная частица + прилагательное/причастие, глагол или существительное
+    rv, found = _cut(PERFECTIVE_GERUND, rv)
+    if not found:
+        rv, _ = _cut(REFLEXIVE, rv)
+        rv, found = _cut(ADJECTIVE, rv)
+        if found:
+            rv, _ = _cut(PARTICIPLE, rv)
+        else:
+            rv, found = _cut(VERB, rv)
+            if not found:
+                rv, _ = _cut(NOUN, rv)
+
+    # Шаг 2: конечная "и"
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # Шаг 3: словообразовательный суффикс, только в R2
+    r2_offset = max(r2_start - rv_start, 0)
+    if DERIVATIONAL.search(rv[r2_offset:]):
+        rv, _ = _cut(DERIVATIONAL, rv)
+
+    # Шаг 4: "нн" -> "н", превосходная степень, мягкий знак
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    else:
+        rv, found = _cut(SUPERLATIVE, rv)
+        if found and rv.endswith('нн'):
+            rv = rv[:-1]
+        elif rv.endswith('ь'):
+            rv = rv[:-1]
+    return prefix + rv
@@ -1,6 +1,8 @@
 # posts/templatetags/post_tags.py
 from django import template
-from django.utils.http import urlencode
+from django.utils.safestring import mark_safe
+
+from posts import fragments
 
 register = template.Library()
 
@@ -18,5 +20,20 @@ def urlencode_partial(get_params, exclude_key=""):
     if exclude_key and exclude_key in params:
         params.pop(exclude_key)
     if params:
-        return f"&{urlencode(params)}"
-    return ""
\ No newline at end of file
+        # Значения QueryDict - списки: urlencode(params) без doseq превратил бы их в "['...']"
+        return f"&{params.urlencode()}"
+    return ""
+
+# --- Кешированные фрагменты (posts.fragments) ---
+@register.simple_tag
+def post_cards(posts, user_votes=None):
+    """Карточки постов страницы: каркасы из кеша одним запросом + голос зрителя."""
+    return mark_safe(''.join(fragments.post_cards(posts, user_votes)))
+
+
+@register.simple_tag
+def comment_body(comment, user):
+    """Комментарий без ответов; если view не подготовил body_html для страницы - подготавливаем для его поддерева."""
+    if 'body_html' not in comment.__dict__:
+        fragments.attach_comment_bodies([comment], user)
+    return comment.body_html
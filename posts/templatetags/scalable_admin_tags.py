@@ -0,0 +1,66 @@
+# posts/templatetags/scalable_admin_tags.py
+import calendar
+import datetime
+
+from django import template
+from django.conf import settings
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.db.models import Max, Min
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def capped_date_hierarchy(cl):
+    """date_hierarchy, который на больших выборках не делает DISTINCT по датам (posts.scalable_admin)."""
+    limit = getattr(settings, 'ADMIN_DATE_HIERARCHY_MAX_ROWS', 50000)
+    # COUNT по подзапросу с LIMIT: стоимость ограничена limit строками
+    if cl.queryset[:limit + 1].count() <= limit:
+        return date_hierarchy(cl)
+    return _range_hierarchy(cl)
+
+
+def _range_hierarchy(cl):
+    """Уровни по календарю внутри диапазона MIN/MAX: периоды без строк тоже попадают в список."""
+    field_name = cl.date_hierarchy
+    year_field, month_field, day_field = (f'{field_name}__{part}' for part in ('year', 'month', 'day'))
+    year, month, day = (cl.params.get(name) for name in (year_field, month_field, day_field))
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__'])
+
+    if year and month and day:
+        return date_hierarchy(cl)  # Выбранный день: Django ничего не агрегирует
+    if year and month:
+        year, month = int(year), int(month)
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year}), 'title': str(year)},
+            'choices': [
+                {'link': link({year_field: year, month_field: month, day_field: number}),
+                 'title': capfirst(formats.date_format(datetime.date(year, month, number), 'MONTH_DAY_FORMAT'))}
+                for number in range(1, calendar.monthrange(year, month)[1] + 1)
+            ],
+        }
+    if year:
+        year = int(year)
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {'link': link({year_field: year, month_field: number}),
+                 'title': capfirst(formats.date_format(datetime.date(year, number, 1), 'YEAR_MONTH_FORMAT'))}
+                for number in range(1, 13)
+            ],
+        }
+    date_range = cl.queryset.aggregate(first=Min(field_name), last=Max(field_name))
+    if not date_range['first']:
+        return {'show': False}
+    first, last = (timezone.localtime(value) if timezone.is_aware(value) else value for value in date_range.values())
+    return {
+        'show': True,
+        'choices': [{'link': link({year_field: number}), 'title': str(number)} for number in range(first.year, last.year + 1)],
+    }
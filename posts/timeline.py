@@ -0,0 +1,161 @@
+# posts/timeline.py
+"""
+Лента подписок с fan-out on write: при публикации пост раскладывается в TimelineEntry всех
+подписчиков автора, а PostFeedView читает ленту одним диапазонным проходом по индексу
+(owner, -published_at, -post). Запланированные посты раскладываются, когда publish_scheduled
+переводит их в status='published' (сигнал post_became_visible), поэтому чтение не сравнивает с now.
+
+Авторы с числом подписчиков от FEED_FANOUT_MAX_FOLLOWERS в ленты не раскладываются -
+их посты подмешиваются при чтении (posts.feed, fan-out on read).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Profile
+
+from .models import Post, TimelineEntry
+
+FEED_VISIBILITIES = (Post.VISIBILITY_PUBLIC, Post.VISIBILITY_FOLLOWERS)
+BATCH_SIZE = 1000
+FOLLOWER_COUNT_TIMEOUT = 600
+
+
+def timeline_size():
+    return getattr(settings, 'FEED_TIMELINE_SIZE', 500)
+
+
+def is_feed_visible(post):
+    """Попадает ли пост в ленты подписчиков (опубликован и не приватный)."""
+    return post.status == Post.STATUS_PUBLISHED and post.visibility in FEED_VISIBILITIES
+
+
+def feed_visible_posts():
+    return Post.objects.filter(status=Post.STATUS_PUBLISHED, visibility__in=FEED_VISIBILITIES)
+
+
+def fanout_max_followers():
+    return getattr(settings, 'FEED_FANOUT_MAX_FOLLOWERS', 10000)
+
+
+def follower_counts(author_ids):
+    """{author_id: число подписчиков} по Profile.followers_count; кешируется на FOLLOWER_COUNT_TIMEOUT секунд."""
+    keys = {author_id: f'feed:author:{author_id}:followers' for author_id in author_ids}
+    cached = cache.get_many(keys.values())
+    counts = {author_id: cached[key] for author_id, key in keys.items() if key in cached}
+    missing = [author_id for author_id in keys if author_id not in counts]
+    if missing:
+        fresh = dict.fromkeys(missing, 0)
+        # Общий кеш - с default, не с реплики запроса (posts.replicas)
+        fresh.update(Profile.objects.using(DEFAULT_DB_ALIAS).filter(user_id__in=missing).values_list(
+            'user_id', 'followers_count'))
+        cache.set_many({keys[author_id]: n for author_id, n in fresh.items()}, FOLLOWER_COUNT_TIMEOUT)
+        counts.update(fresh)
+    return counts
+
+
+def fanout_on_read_authors(author_ids):
+    """Авторы, чьи посты не раскладываются по лентам, а подмешиваются при чтении."""
+    threshold = fanout_max_followers()
+    return {author_id for author_id, n in follower_counts(author_ids).items() if n >= threshold}
+
+
+def follower_user_ids(author_id):
+    """ID пользователей-подписчиков автора (по таблице подписок, без загрузки профилей)."""
+    Follow = Profile.following.through
+    return Follow.objects.filter(to_profile__user_id=author_id).values_list('from_profile__user_id', flat=True)
+
+
+def _batched(iterable, size=BATCH_SIZE):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def trim(owner_ids):
+    """Оставляет в лентах owner_ids только FEED_TIMELINE_SIZE последних записей."""
+    ranked = TimelineEntry.objects.filter(owner_id__in=owner_ids).annotate(
+        position=Window(
+            RowNumber(), partition_by=[F('owner_id')], order_by=[F('published_at').desc(), F('post_id').desc()]
+        )
+    ).filter(position__gt=timeline_size()).values_list('pk', flat=True)
+    stale_ids = list(ranked)
+    for batch in _batched(stale_ids):
+        TimelineEntry.objects.filter(pk__in=batch).delete()
+
+
+# --- События постов ---
+def fan_out(post):
+    """Раскладывает пост в ленты всех подписчиков автора (идемпотентно)."""
+    if fanout_on_read_authors([post.author_id]):
+        return  # Слишком много подписчиков: пост подмешивается при чтении (posts.feed)
+    # Если пост уже разложен, а поменялась дата публикации - обновляем ее в существующих записях
+    TimelineEntry.objects.filter(post=post).exclude(published_at=post.published_at).update(
+        published_at=post.published_at
+    )
+    for owner_ids in _batched(follower_user_ids(post.author_id).iterator()):
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=owner_id, post_id=post.pk, author_id=post.author_id,
+                           published_at=post.published_at) for owner_id in owner_ids],
+            ignore_conflicts=True,
+        )
+        trim(owner_ids)
+
+
+def retract(post):
+    """Убирает пост из всех лент (снят с публикации или стал приватным)."""
+    TimelineEntry.objects.filter(post=post).delete()
+
+
+def sync_post(post):
+    """Приводит ленты в соответствие с текущим состоянием поста."""
+    if is_feed_visible(post):
+        fan_out(post)
+    else:
+        retract(post)
+
+
+# --- События подписок ---
+def on_follow(follower_user_id, author_id):
+    """Новая подписка: добавляем в ленту последние посты автора."""
+    recent = feed_visible_posts().filter(author_id=author_id).order_by('-published_at', '-id')
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=follower_user_id, post_id=post_id, author_id=author_id, published_at=published_at)
+         for post_id, published_at in recent.values_list('pk', 'published_at')[:timeline_size()]],
+        ignore_conflicts=True,
+    )
+    trim([follower_user_id])
+
+
+def on_unfollow(follower_user_id, author_id):
+    """Отписка: удаляем из ленты все посты автора."""
+    TimelineEntry.objects.filter(owner_id=follower_user_id, author_id=author_id).delete()
+
+
+# --- Чтение и восстановление ---
+def read(owner):
+    """Queryset ленты пользователя: диапазон по индексу (owner, -published_at, -post)."""
+    return TimelineEntry.objects.filter(owner=owner).select_related(
+        'post__author__profile', 'post__category'
+    )
+
+
+def rebuild(owner_id):
+    """Пересобирает ленту пользователя с нуля по текущим подпискам. Возвращает число записей."""
+    following_ids = Profile.objects.filter(followers__user_id=owner_id).values_list('user_id', flat=True)
+    recent = feed_visible_posts().filter(author_id__in=following_ids).order_by('-published_at', '-id')
+    entries = [
+        TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, published_at=published_at)
+        for post_id, author_id, published_at in recent.values_list('pk', 'author_id', 'published_at')[:timeline_size()]
+    ]
+    TimelineEntry.objects.filter(owner_id=owner_id).delete()
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE)
+    return len(entries)
@@ -8,6 +8,7 @@ urlpatterns = [
     # --- Списки постов ---
     path('feed/', views.PostFeedView.as_view(), name='post_feed'),
     path('category/<slug:category_slug>/', views.PostListView.as_view(), name='post_list_by_category'),
+    path('search/', views.search_posts, name='search'),
 
     # --- CRUD постов ---
     path('post/new/', views.PostCreateView.as_view(), name='post_create'),
@@ -17,9 +18,12 @@ urlpatterns = [
     # --- HTMX для постов ---
     path('post/<int:post_id>/vote/', views.post_vote, name='post_vote'),
     path('post/<int:post_id>/comment/add/', views.add_comment, name='add_comment'),
+    path('post/<int:post_id>/comments/', views.comment_threads, name='comment_threads'),
+    path('post/<int:post_id>/stream/', views.post_stream, name='post_stream'),
 
     # --- HTMX для комментариев ---
     path('comment/<int:comment_id>/reply/', views.get_reply_form, name='get_reply_form'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies, name='comment_replies'),
     path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
     path('comment/<int:comment_id>/edit/', views.get_edit_form, name='get_edit_form'),
     path('comment/<int:comment_id>/update/', views.update_comment, name='update_comment'),
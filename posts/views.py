@@ -1,22 +1,36 @@
 # posts/views.py
 
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
-from django.contrib.contenttypes.models import ContentType
-from django.db.models import Count, Q, Prefetch
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F
 from django.http import (HttpResponse, HttpResponseBadRequest,
                          HttpResponseForbidden, HttpResponseNotAllowed, Http404,
-                         HttpResponseRedirect)  # Добавили HttpResponseRedirect
+                         HttpResponseRedirect, StreamingHttpResponse)  # Добавили HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render, redirect
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy, reverse
 from django.utils import timezone
-from django.views.decorators.http import require_POST, require_http_methods, require_GET
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition, require_POST, require_GET
 from django.views.generic import DetailView, ListView, CreateView, UpdateView
 from django.contrib import messages
 
-from .models import Category, Comment, Post, Vote
+from .models import Comment, Post, Vote
+from . import asynchttp, audience, categories, comments, fragments, live, pagecache, ranking, search, timeline, votes
+from .asynchttp import aget_object_or_404, aget_user
+from .conditional import ConditionalGetMixin
+from .feed import MergedFeed
 from .forms import CommentForm, PostForm
+from .pagecache import AsyncPageCacheMixin
+from .pagination import CursorPaginationMixin, InvalidCursor
+
+logger = logging.getLogger(__name__)
 
 
 class PostCreateView(LoginRequiredMixin, CreateView):
@@ -93,7 +107,7 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         post = self.object
         # Убедимся, что у объекта есть слаг после сохранения
-        if post.slug and post.can_view(self.request.user):
+        if post.slug and audience.for_request(self.request).can_view(post):
             # Используем kwargs для передачи slug
             return reverse('posts:post_detail', kwargs={'slug': post.slug})
         else:
@@ -104,243 +118,277 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
             return reverse_lazy('posts:post_list')
 
 
-class PostListView(ListView):
-    """Отображает список постов с учетом видимости и пагинацией."""
+class PostListView(AsyncPageCacheMixin, ConditionalGetMixin, CursorPaginationMixin, ListView):
+    """Отображает список постов с учетом видимости и keyset-пагинацией; ?sort= - сортировки posts.ranking."""
     model = Post
     template_name = 'posts/post_list.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'posts'
     paginate_by = 10
 
+    def get_sort(self):
+        return ranking.get_sort(self.request.GET.get('sort'))
+
+    def get_cursor_ordering(self):
+        return ranking.ORDERINGS.get(self.get_sort(), self.cursor_ordering)
+
     def get_queryset(self):
         base_qs = Post.objects.select_related('author__profile', 'category')
         category_slug = self.kwargs.get('category_slug')
         if category_slug:
-            category = get_object_or_404(Category, slug=category_slug)
+            category = categories.get_index().by_slug.get(category_slug)
+            if category is None:
+                raise Http404("Категория не найдена.")
             base_qs = base_qs.filter(category=category)
             self.category = category
         else:
             self.category = None
 
-        user = self.request.user
-        now = timezone.now()
-        published_q = Q(is_published=True, published_at__lte=now)
-
-        if user.is_authenticated:
-            visibility_q = Q(visibility=Post.VISIBILITY_PUBLIC) | \
-                           Q(visibility=Post.VISIBILITY_PRIVATE, author=user)
-            if hasattr(user, 'profile'):
-                visibility_q |= Q(visibility=Post.VISIBILITY_FOLLOWERS, author__profile__followers=user.profile)
-            author_draft_q = Q(author=user) & ~published_q
-            final_q = (published_q & visibility_q) | author_draft_q
-        else:
-            final_q = published_q & Q(visibility=Post.VISIBILITY_PUBLIC)
-
-        queryset = base_qs.filter(final_q).distinct()
-        queryset = queryset.annotate(
-            likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-            dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
-            comments_count=Count('comments', distinct=True)
-        )
+        # Видимость - общий движок PostManager (EXISTS вместо JOIN + DISTINCT);
+        # счетчики голосов/комментариев хранятся в колонках Post, агрегаты не нужны
+        queryset = Post.objects.get_visible_posts_for_user(self.request.user, base_queryset=base_qs)
+        if self.get_sort():
+            # Сортировка по заранее посчитанной оценке (только опубликованные); порядок задает CursorPaginator
+            return ranking.ranked(queryset, self.get_sort())
+        # Порядок страниц задает CursorPaginator: published_at DESC NULLS LAST (черновики в конце), created_at, id
         return queryset.order_by('-is_published', '-published_at', '-created_at')
 
+    def paginate_queryset(self, queryset, page_size):
+        # Страница, загруженная для валидаторов (get_validators), второй раз не запрашивается
+        if getattr(self, '_pagination', None) is None:
+            self._pagination = super().paginate_queryset(queryset, page_size)
+        return self._pagination
+
+    def get_validators(self):
+        # Версии - из строк самой страницы: ListView.get возьмет ее же из paginate_queryset
+        queryset = self.get_queryset()
+        _, page, rows, _ = self.paginate_queryset(queryset, self.get_paginate_by(queryset))
+        versions = [(post.pk, post.status, post.updated_at, post.counters_updated_at) for post in rows]
+        # Только ETag: ушедший со страницы пост не сдвигает максимум дат, а состав страницы есть в versions
+        return (self.kwargs.get('category_slug'), self.get_sort(), versions, page.has_next(), page.has_previous()), []
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = getattr(self, 'category', None)
         context['title'] = f'Посты категории "{self.category.name}"' if self.category else 'Все посты'
-        user_votes = {}
-        if self.request.user.is_authenticated:
-            post_ids = [post.id for post in context['posts']]
-            if post_ids:
-                content_type = ContentType.objects.get_for_model(Post)
-                votes = Vote.objects.filter(
-                    user=self.request.user, content_type=content_type, object_id__in=post_ids
-                ).values('object_id', 'vote_type')
-                user_votes = {vote['object_id']: vote['vote_type'] for vote in votes}
-        context['user_votes'] = user_votes
+        # Страница сбрасывается при изменении состава списков, сайдбара, категории и любого поста на ней
+        pagecache.tag(self.request, pagecache.POSTS, pagecache.CATEGORIES,
+                      *([f'category:{self.category.pk}'] if self.category else []),
+                      *([pagecache.RANKING] if self.get_sort() else []),
+                      *(key for post in context['posts'] for key in pagecache.post_keys(post)))
+        context['sort'] = self.get_sort()
+        context['sort_choices'] = ranking.SORT_CHOICES
+        context['user_votes'] = votes.user_votes(self.request.user, [post.id for post in context['posts']])
         return context
 
 
-class PostDetailView(DetailView):
+class PostDetailView(AsyncPageCacheMixin, ConditionalGetMixin, DetailView):
     """Отображает детальную страницу поста и его комментарии."""
     model = Post
     template_name = 'posts/post_detail.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'post'
     slug_field = 'slug'
     slug_url_kwarg = 'slug'
 
     def get_object(self, queryset=None):
-        queryset = self.get_queryset()
-        obj = super().get_object(queryset=queryset)
-        if not obj.can_view(self.request.user):
-            raise Http404("Пост не найден или у вас нет прав на его просмотр.")
-        return obj
+        # Пост нужен и валидаторам (get_validators), и самой странице - загружаем один раз
+        if getattr(self, '_post', None) is None:
+            obj = super().get_object(queryset=self.get_queryset())
+            if not audience.for_request(self.request).can_view(obj):
+                raise Http404("Пост не найден или у вас нет прав на его просмотр.")
+            self._post = obj
+        return self._post
+
+    def get_validators(self):
+        post = self.get_object()
+        # Добавление, удаление и правка комментария сдвигают counters_updated_at поста (posts.signals)
+        stamps = [post.updated_at, post.counters_updated_at]
+        return (post.pk, post.status, *stamps), stamps
 
     def get_queryset(self):
         return Post.objects.select_related(
             'author__profile', 'category'
-        ).prefetch_related(
-            Prefetch('comments', queryset=Comment.objects.select_related('author__profile').order_by('created_at'))
-        ).annotate(
-            likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-            dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
         ).filter(slug=self.kwargs.get(self.slug_url_kwarg))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         post = self.object
         context['title'] = post.title
-        context['comments'] = post.comments.all()
-
-        user_vote = None
-        if self.request.user.is_authenticated:
-            content_type = ContentType.objects.get_for_model(Post)
-            try:
-                vote_obj = Vote.objects.get(user=self.request.user, content_type=content_type, object_id=post.id)
-                user_vote = vote_obj.vote_type
-            except Vote.DoesNotExist:
-                pass
-        context['user_vote'] = user_vote
+        # Первая страница веток; остальное догружается через HTMX (comment_threads / comment_replies)
+        page = comments.load_threads(post.id)
+        fragments.attach_comment_bodies(page, self.request.user)
+        context['comments'] = page
+        pagecache.tag(self.request, pagecache.CATEGORIES, *pagecache.post_keys(post),
+                      *(f'author:{comment.author_id}' for comment in fragments.walk(page)))
+        if page.has_next():
+            context['comments_more_url'] = reverse('posts:comment_threads', args=[post.id])
+            context['comments_more_query'] = comments.more_query(page.next_cursor, len(page))
+
+        context['user_vote'] = votes.user_vote(self.request.user, post.id)
 
         if self.request.user.is_authenticated:
             context['comment_form'] = CommentForm()
         return context
 
 
-class PostFeedView(LoginRequiredMixin, ListView):
+class PostFeedView(LoginRequiredMixin, ConditionalGetMixin, ListView):
     """Отображает ленту постов от пользователей, на которых подписан текущий."""
     model = Post
     template_name = 'posts/post_feed.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'posts'
     paginate_by = 10
 
     def get_queryset(self):
-        user = self.request.user
-        following_user_ids = []
-        if hasattr(user, 'profile'):
-            following_user_ids = user.profile.following.values_list('user_id', flat=True)
-        if not following_user_ids:
-            return Post.objects.none()
-        queryset = Post.objects.filter(
-            author_id__in=following_user_ids,
-            is_published=True,
-            published_at__lte=timezone.now(),
-            visibility__in=[Post.VISIBILITY_PUBLIC, Post.VISIBILITY_FOLLOWERS]
-        ).select_related('author__profile', 'category').annotate(
-            likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-            dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
-            comments_count=Count('comments', distinct=True)
-        ).order_by('-published_at')
-        return queryset
+        # Лента читается из TimelineEntry (fan-out on write); сама страница собирается в paginate_queryset
+        return timeline.read(self.request.user)
+
+    def get_feed(self):
+        if getattr(self, '_feed', None) is None:
+            self._feed = MergedFeed(self.request.user, self.paginate_by)
+        return self._feed
+
+    def paginate_queryset(self, queryset, page_size):
+        # Страница ленты + посты авторов с fan-out on read, слитые по времени (keyset, ?cursor=<токен>)
+        feed = self.get_feed()
+        try:
+            page = feed.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404("Некорректный курсор страницы.")
+        return (feed.paginator, page, page.object_list, page.has_other_pages())
+
+    def get_validators(self):
+        # Версии - из постов самой страницы: MergedFeed загружает ее один раз на токен
+        try:
+            page = self.get_feed().page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            return None
+        versions = [(post.pk, post.status, post.visibility, post.updated_at, post.counters_updated_at) for post in page]
+        return (versions, page.has_next(), page.has_previous()), []
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Моя лента'
-        user_votes = {}
-        post_ids = [post.id for post in context['posts']]
-        if post_ids and self.request.user.is_authenticated:
-            content_type = ContentType.objects.get_for_model(Post)
-            votes = Vote.objects.filter(
-                user=self.request.user, content_type=content_type, object_id__in=post_ids
-            ).values('object_id', 'vote_type')
-            user_votes = {vote['object_id']: vote['vote_type'] for vote in votes}
-        context['user_votes'] = user_votes
+        context['user_votes'] = votes.user_votes(self.request.user, [post.id for post in context['posts']])
         context['category'] = None
         return context
 
 
+@require_GET
+def search_posts(request):
+    """Поиск по постам (posts.search). HTMX-запросы получают только блок результатов: ввод и "Показать еще"."""
+    query = request.GET.get('q', '').strip()[:200]
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        offset = 0
+    per_page = getattr(settings, 'SEARCH_RESULTS_PER_PAGE', 10)
+    found_ids = search.search(query, request.user) if query else []
+    posts = search.load_posts(found_ids[offset:offset + per_page])
+    user_votes = votes.user_votes(request.user, [post.id for post in posts])
+    next_offset = offset + per_page
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск', 'query': query, 'posts': posts, 'user_votes': user_votes,
+        'found_count': len(found_ids), 'offset': offset,
+        'next_offset': next_offset if next_offset < len(found_ids) else None, 'category': None,
+    }
+    template = 'posts/partials/search_results.html' if request.headers.get('HX-Request') else 'posts/search.html'
+    response = render(request, template, context)
+    patch_vary_headers(response, ['HX-Request'])
+    return response
+
+
 # --- HTMX Views ---
 
-@login_required
-@require_POST
-def post_vote(request, post_id):
+def _cast_vote(user, post, value):
+    """Транзакция голоса (select_for_update) и свежие счетчики - синхронно, одним переходом в поток."""
+    final = votes.cast(user, post, value)
+    # Перечитываем только счетчики (один SELECT по PK вместо агрегации) и добавляем несброшенные голоса
+    votes.refresh_counters(post)
+    live.publish_actions(post.pk, user.pk, final)
+    return final
+
+
+@asynchttp.login_required
+@asynchttp.require_POST
+async def post_vote(request, post_id):
     """Обрабатывает лайк/дизлайк поста."""
-    post = get_object_or_404(Post, pk=post_id)
-    if not post.can_view(request.user):
+    post = await aget_object_or_404(Post.objects, pk=post_id)
+    if not await audience.for_request(request).acan_view(post):
         return HttpResponseForbidden("У вас нет доступа к этому посту для голосования.")
     vote_type = request.POST.get('vote_type')
     if vote_type not in ['like', 'dislike']: return HttpResponseBadRequest("Invalid vote type")
     vote_value = Vote.LIKE if vote_type == 'like' else Vote.DISLIKE
-    content_type = ContentType.objects.get_for_model(Post)
-    vote, created = Vote.objects.get_or_create(user=request.user, content_type=content_type, object_id=post.id,
-                                               defaults={'vote_type': vote_value})
-    user_vote_final_type = None
-    if not created:
-        if vote.vote_type == vote_value:
-            vote.delete()
-        else:
-            vote.vote_type = vote_value; vote.save(); user_vote_final_type = vote_value
-    else:
-        user_vote_final_type = vote_value
-    post_with_counts = Post.objects.filter(pk=post.id).annotate(
-        likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-        dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
-        comments_count=Count('comments', distinct=True)
-    ).first()
-    if not post_with_counts: return HttpResponseBadRequest("Post not found after voting.")
-    context = {'post': post_with_counts, 'user_vote': user_vote_final_type, 'request': request}
+    user_vote_final_type = await sync_to_async(_cast_vote)(request.user, post, vote_value)
+    context = {'post': post, 'user_vote': user_vote_final_type, 'request': request}
     html_fragment = render_to_string('posts/partials/post_actions_fragment.html', context)
     return HttpResponse(html_fragment)
 
 
-@login_required
-@require_GET
-def get_reply_form(request, comment_id):
+@asynchttp.login_required
+@asynchttp.require_GET
+async def get_reply_form(request, comment_id):
     """Возвращает форму для ответа на комментарий."""
-    parent_comment = get_object_or_404(Comment, pk=comment_id)
-    if not parent_comment.post.can_view(request.user):
+    parent_comment = await aget_object_or_404(Comment.objects.select_related('post'), pk=comment_id)
+    if not await audience.for_request(request).acan_view(parent_comment.post):
         return HttpResponseForbidden("Нет доступа к посту для ответа на комментарий.")
     form = CommentForm()
-    context = {'form': form, 'parent_comment': parent_comment, 'post_id': parent_comment.post.id}
+    context = {'form': form, 'parent_comment': parent_comment, 'post_id': parent_comment.post_id}
     return render(request, 'posts/partials/_comment_reply_form.html', context)
 
 
-@login_required
-@require_POST
-def add_comment(request, post_id):
+def _save_comment(request, new_comment, parent_comment):
+    """Сохраняет комментарий со счетчиками и рендерит его (шаблон читает автора и тело из кеша/БД)."""
+    with transaction.atomic():
+        new_comment.save()
+        Post.objects.adjust_counters(new_comment.post_id, comments_count=1)
+        if parent_comment:
+            Comment.objects.filter(pk=parent_comment.pk).update(replies_count=F('replies_count') + 1)
+    context = {'comment': new_comment, 'user': request.user, 'level': new_comment.depth}
+    html = render_to_string('posts/components/comment_display/comment_display.html', context, request=request)
+    # Остальным зрителям поста - через SSE (posts.live): узел комментария и новые счетчики
+    live.publish_comment(new_comment)
+    live.publish_actions(new_comment.post_id)
+    return html
+
+
+@asynchttp.login_required
+@asynchttp.require_POST
+async def add_comment(request, post_id):
     """Добавляет новый комментарий или ответ."""
-    post = get_object_or_404(Post, pk=post_id)
-    if not post.can_view(request.user):
+    post = await aget_object_or_404(Post.objects, pk=post_id)
+    if not await audience.for_request(request).acan_view(post):
         return HttpResponseForbidden("Нет доступа к посту для добавления комментария.")
     form = CommentForm(request.POST)
     parent_comment = None
     parent_id = request.POST.get('parent_id')
     if parent_id:
         try:
-            parent_comment = Comment.objects.get(pk=parent_id, post=post)
-            level_check = 0;
-            temp = parent_comment
-            while temp:
-                level_check += 1;
-                temp = temp.parent
-                if level_check > 5:  # Ограничение глубины ответа
-                    return HttpResponseBadRequest("Нельзя отвечать на комментарий с таким уровнем вложенности.")
+            parent_comment = await Comment.objects.aget(pk=parent_id, post=post)
         except (Comment.DoesNotExist, ValueError):
             return HttpResponseBadRequest("Родительский комментарий не найден или ID некорректен.")
+        if parent_comment.depth >= Comment.MAX_DEPTH:  # Ограничение глубины ответа
+            return HttpResponseBadRequest("Нельзя отвечать на комментарий с таким уровнем вложенности.")
 
     if form.is_valid():
         new_comment = form.save(commit=False)
         new_comment.post = post
         new_comment.author = request.user
         new_comment.parent = parent_comment
-        new_comment.save()
-        level = 0
-        if parent_comment:
-            temp_parent = parent_comment
-            while temp_parent: level += 1; temp_parent = temp_parent.parent
-        context = {'comment': new_comment, 'user': request.user, 'level': level}
         try:
-            template_path = 'posts/components/comment_display/comment_display.html'
-            html_fragment = render_to_string(template_path, context, request=request)
-        except Exception as e:
-            print(f"Error rendering comment template ({template_path}): {e}")
-            return HttpResponseBadRequest(f"Ошибка рендеринга комментария: {e}")
+            # Транзакция и рендер (шаблон может обращаться к БД) - один переход в поток
+            html_fragment = await sync_to_async(_save_comment)(request, new_comment, parent_comment)
+        except Exception:
+            logger.exception("Не удалось сохранить или отрисовать комментарий к посту %s", post_id)
+            raise
+        # Форма ответа сама целится в #replies-for-<parent> (beforeend), поэтому фрагмент отдаем телом ответа:
+        # HTML в заголовке HX-Swap-Oob не проходит (заголовки не могут содержать переводы строк)
+        response = HttpResponse(html_fragment)
         if new_comment.parent_id:
-            response = HttpResponse(status=204)  # No Content
-            response['HX-Swap-Oob'] = f'beforeend:#replies-for-{new_comment.parent_id}:{html_fragment}'
             response['HX-Trigger-After-Swap'] = '{"commentAdded":true, "removeNoCommentsPlaceholder":""}'
         else:
-            response = HttpResponse(html_fragment)
-            if post.comments.filter(parent__isnull=True).count() == 1:
+            if not await post.comments.filter(parent__isnull=True).exclude(pk=new_comment.pk).aexists():
                 response['HX-Swap-Oob'] = 'delete:#no-comments-placeholder'
             response['HX-Trigger-After-Swap'] = '{"commentAdded":true}'
         return response
@@ -351,24 +399,85 @@ def add_comment(request, post_id):
             f"Ошибка валидации: {errors_str}" if errors_str else "Ошибка валидации комментария.")
 
 
-@login_required
-@require_http_methods(["DELETE"])
-def delete_comment(request, comment_id):
+def _delete_comment(comment):
+    """Удаляет комментарий с ответами и сдвигает счетчики в одной транзакции."""
+    with transaction.atomic():
+        # delete() возвращает число удаленных строк по моделям, включая каскадно удаленные ответы
+        _, deleted_per_model = comment.delete()
+        Post.objects.adjust_counters(comment.post_id, comments_count=-deleted_per_model.get(Comment._meta.label, 0))
+        if comment.parent_id:
+            Comment.objects.filter(pk=comment.parent_id, replies_count__gt=0).update(replies_count=F('replies_count') - 1)
+
+
+@asynchttp.login_required
+@asynchttp.require_http_methods(["DELETE"])
+async def delete_comment(request, comment_id):
     """Удаляет комментарий."""
-    comment = get_object_or_404(Comment, pk=comment_id)
-    if request.user != comment.author:
+    comment = await aget_object_or_404(Comment.objects, pk=comment_id)
+    if request.user.pk != comment.author_id:
         return HttpResponseForbidden("Вы не можете удалить этот комментарий.")
-    post_id = comment.post.id
-    was_top_level = comment.parent is None
-    comment.delete()
+    post_id, was_top_level = comment.post_id, comment.parent_id is None
+    await sync_to_async(_delete_comment)(comment)
     response = HttpResponse(status=200)  # OK
-    if was_top_level and not Comment.objects.filter(post_id=post_id, parent__isnull=True).exists():
+    if was_top_level and not await Comment.objects.filter(post_id=post_id, parent__isnull=True).aexists():
         placeholder_html = '<p id="no-comments-placeholder" class="text-gray-500">Комментариев пока нет.</p>'
         response['HX-Swap-Oob'] = f'innerHTML:#comment-list:{placeholder_html}'
     response['HX-Trigger'] = '{"showMessage": "Комментарий удален"}'
     return response
 
 
+@asynchttp.require_GET
+async def post_stream(request, post_id):
+    """SSE-поток живых обновлений поста: новые комментарии и счетчики (posts.live)."""
+    if not isinstance(request, ASGIRequest):
+        # Под WSGI бесконечный ответ занял бы рабочий поток; на 204 EventSource не переподключается
+        return HttpResponse(status=204)
+    post = await aget_object_or_404(Post.objects, pk=post_id)
+    user = await aget_user(request)  # До проверки видимости: она читает request.user
+    if not await audience.for_request(request).acan_view(post):
+        return HttpResponseForbidden("Нет доступа к этому посту.")
+    user_vote = await sync_to_async(votes.user_vote)(user, post.pk) if user.is_authenticated else None
+    response = StreamingHttpResponse(live.stream(post.pk, user.pk, user_vote), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: не буферизовать поток
+    return response
+
+
+@require_GET
+def comment_threads(request, post_id):
+    """Следующая страница корневых комментариев поста (кнопка "Показать еще комментарии")."""
+    post = get_object_or_404(Post, pk=post_id)
+    if not audience.for_request(request).can_view(post):
+        return HttpResponseForbidden("Нет доступа к комментариям этого поста.")
+    return _comment_page(request, post.id, parent=None, url=reverse('posts:comment_threads', args=[post.id]))
+
+
+@require_GET
+def comment_replies(request, comment_id):
+    """Следующая страница ответов на комментарий (кнопка "Показать еще ответы")."""
+    parent = get_object_or_404(Comment.objects.select_related('post'), pk=comment_id)
+    if not audience.for_request(request).can_view(parent.post):
+        return HttpResponseForbidden("Нет доступа к комментариям этого поста.")
+    return _comment_page(request, parent.post_id, parent=parent, url=reverse('posts:comment_replies', args=[parent.id]))
+
+
+def _comment_page(request, post_id, parent, url):
+    try:
+        shown = max(int(request.GET.get('shown', 0)), 0)
+        page = comments.load_threads(post_id, parent=parent, token=request.GET.get('cursor'))
+    except (ValueError, InvalidCursor):
+        return HttpResponseBadRequest("Некорректный курсор страницы.")
+    fragments.attach_comment_bodies(page, request.user)
+    shown += len(page)
+    context = {
+        'comments': page, 'level': parent.depth + 1 if parent else 0, 'parent': parent,
+        'more_url': url if page.has_next() else '',
+        'more_query': comments.more_query(page.next_cursor, shown),
+        'more_count': max(parent.replies_count - shown, 0) if parent else None,
+    }
+    return render(request, 'posts/partials/comment_page.html', context)
+
+
 @login_required
 @require_GET
 def get_edit_form(request, comment_id):
@@ -390,11 +499,8 @@ def update_comment(request, comment_id):
         return HttpResponseForbidden("Вы не можете редактировать этот комментарий.")
     form = CommentForm(request.POST, instance=comment)
     if form.is_valid():
-        updated_comment = form.save()
-        level = 0
-        temp_parent = updated_comment.parent
-        while temp_parent: level += 1; temp_parent = temp_parent.parent
-        context = {'comment': updated_comment, 'user': request.user, 'level': level}
+        updated_comment = comments.load_subtree(form.save())  # Перерисовываем вместе с ответами
+        context = {'comment': updated_comment, 'user': request.user, 'level': updated_comment.depth}
         template_path = 'posts/components/comment_display/comment_display.html'
         return render(request, template_path, context)
     else:
@@ -406,8 +512,21 @@ def update_comment(request, comment_id):
         return response
 
 
+def _comment_updated_at(request, comment_id):
+    # Одна выборка на запрос и для ETag, и для Last-Modified
+    if not hasattr(request, '_comment_updated_at'):
+        request._comment_updated_at = Comment.objects.filter(pk=comment_id).values_list('updated_at', flat=True).first()
+    return request._comment_updated_at
+
+
+def _comment_etag(request, comment_id):
+    updated_at = _comment_updated_at(request, comment_id)
+    return f'comment-{comment_id}-{updated_at.timestamp()}' if updated_at else None
+
+
 @login_required
 @require_GET
+@condition(etag_func=_comment_etag, last_modified_func=_comment_updated_at)
 def get_comment_content(request, comment_id):
     """Возвращает HTML-блок с оригинальным текстом комментария."""
     comment = get_object_or_404(Comment, pk=comment_id)
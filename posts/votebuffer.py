@@ -0,0 +1,229 @@
+# posts/votebuffer.py
+"""
+Отложенная запись голосов (write-behind) для вирусных постов: VOTE_WRITE_BEHIND = True и кеш django_redis.
+
+Голос применяется Lua-скриптом к структурам поста в Redis - хешу state (user_id -> значение, 0 - голоса
+нет), множеству changed (кто голосовал после последнего сброса) и хешу delta (сдвиг likes_count /
+dislikes_count), поэтому ответ post_vote не ждет блокировок БД. Повторный такой же голос снимает
+его, противоположный - заменяет (как в votes.cast); текущий голос берется из state, иначе из PostVote.
+
+Воркер flush_votes пачками переносит изменения в PostVote/Vote (upsert/delete) и пересчитывает
+счетчики постов по PostVote. Сброс поста: claim снимает снимок fstate/fdelta с номером seq (растет,
+не меньше времени Redis в мкс), после коммита complete удаляет его. Если процесс упал между ними,
+снимок остается и применяется повторно - запись идемпотентна (значения абсолютные, счетчики
+пересчитываются). Номер поколения gen меняется при очистке state и не дает применить к голосу
+значение из БД, прочитанное до коммита сброса.
+
+Сдвиги счетчиков для ответа голосующему читаются из Redis до БД. Транзакция сброса записывает номер
+снимка в Post.votes_flushed, поэтому fdelta, уже вошедший в счетчики БД (коммит прошел, complete
+еще нет), и delta, забранный более новым записанным снимком, не прибавляются второй раз.
+
+Перед выключением режима очередь нужно сбросить: manage.py flush_votes.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Value, When
+
+from users.graph import redis_connection
+
+from . import pagecache
+from .models import Post, PostVote, Vote
+
+BATCH_SIZE = 100
+COUNTERS = ('likes_count', 'dislikes_count')
+_RETRY = -2
+
+
+def connection():
+    """Соединение Redis, если режим отложенной записи включен, иначе None."""
+    if not getattr(settings, 'VOTE_WRITE_BEHIND', False):
+        return None
+    return redis_connection()
+
+
+def _key(post_id, name):
+    return cache.make_key(f'votebuf:{post_id}:{name}')
+
+
+def _dirty_key():
+    return cache.make_key('votebuf:dirty')
+
+
+def _flushing_key():
+    return cache.make_key('votebuf:flushing')
+
+
+def _stored_vote(user_id, post_id):
+    return PostVote.objects.filter(user_id=user_id, post_id=post_id).values_list('value', flat=True).first() or 0
+
+
+# --- Голосование ---
+def cast(conn, user_id, post_id, value):
+    """Применяет голос в Redis; возвращает итоговый голос пользователя (None - голос снят)."""
+    script = conn.register_script(_CAST_SCRIPT)
+    keys = [_key(post_id, 'state'), _key(post_id, 'changed'), _key(post_id, 'delta'), _key(post_id, 'gen'), _dirty_key()]
+    final = _RETRY
+    while final == _RETRY:
+        pipe = conn.pipeline(transaction=False)
+        pipe.hget(keys[0], user_id)
+        pipe.get(keys[3])
+        current, gen = pipe.execute()
+        # Голоса нет в state - берем из БД; если за это время сброс очистил state (gen сменился), повторяем
+        stored = _stored_vote(user_id, post_id) if current is None else 0
+        final = int(script(keys=keys, args=[user_id, value, stored, int(gen or 0), post_id]))
+    return final or None
+
+
+_CAST_SCRIPT = """
+local current = redis.call('hget', KEYS[1], ARGV[1])
+if not current then
+    if tonumber(redis.call('get', KEYS[4]) or '0') ~= tonumber(ARGV[4]) then return -2 end
+    current = ARGV[3]
+end
+current = tonumber(current)
+local value = tonumber(ARGV[2])
+local final = value
+if current == value then final = 0 end
+if current ~= 0 then redis.call('hincrby', KEYS[3], current == 1 and 'likes_count' or 'dislikes_count', -1) end
+if final ~= 0 then redis.call('hincrby', KEYS[3], final == 1 and 'likes_count' or 'dislikes_count', 1) end
+redis.call('hset', KEYS[1], ARGV[1], final)
+redis.call('sadd', KEYS[2], ARGV[1])
+redis.call('sadd', KEYS[5], ARGV[5])
+return final
+"""
+
+
+# --- Чтение несброшенных изменений ---
+def pending_votes(conn, user_id, post_ids):
+    """{post_id: голос} из state (0 - голос снят); посты, где пользователь не голосовал через буфер, пропускаются."""
+    pipe = conn.pipeline(transaction=False)
+    for post_id in post_ids:
+        pipe.hget(_key(post_id, 'state'), user_id)
+    return {post_id: int(value) for post_id, value in zip(post_ids, pipe.execute()) if value is not None}
+
+
+def pending_counters(conn, post_id):
+    """
+    Несброшенные сдвиги счетчиков поста: (seq, fdelta, delta). seq - номер последнего снятого снимка,
+    fdelta входит в него, delta - в следующий. Читать до счетчиков из БД (см. counters_over).
+    """
+    pipe = conn.pipeline()  # MULTI: delta, fdelta и seq согласованы между собой
+    pipe.get(_key(post_id, 'seq'))
+    pipe.hgetall(_key(post_id, 'fdelta'))
+    pipe.hgetall(_key(post_id, 'delta'))
+    seq, *deltas = pipe.execute()
+    return int(seq or 0), *({field.decode(): int(value) for field, value in delta.items()} for delta in deltas)
+
+
+def counters_over(pending, votes_flushed):
+    """Сдвиг счетчиков из pending_counters поверх БД, где записаны снимки по votes_flushed включительно."""
+    seq, fdelta, delta = pending
+    deltas = {field: 0 for field in COUNTERS}
+    # fdelta - в снимке seq; delta заберет следующий снимок (номер больше seq)
+    for part, flushed in ((fdelta, votes_flushed >= seq), (delta, votes_flushed > seq)):
+        if not flushed:
+            for field, value in part.items():
+                deltas[field] += value
+    return deltas
+
+
+# --- Сброс в БД ---
+def flush(conn, batch_size=BATCH_SIZE):
+    """Переносит пачку постов из буфера в БД (сначала недосброшенные после сбоя); возвращает число постов."""
+    post_ids = [int(pk) for pk in conn.smembers(_flushing_key())]
+    post_ids += [int(pk) for pk in conn.srandmember(_dirty_key(), batch_size) if int(pk) not in post_ids]
+    if not post_ids:
+        return 0
+    claim = conn.register_script(_CLAIM_SCRIPT)
+    snapshots, seqs = {}, {}
+    for post_id in post_ids:
+        seq, *state = claim(keys=_snapshot_keys(post_id), args=[post_id])
+        seqs[post_id] = int(seq)
+        snapshots[post_id] = {int(state[i]): int(state[i + 1]) for i in range(0, len(state), 2)}
+    posts = {post.pk: post for post in Post.objects.filter(pk__in=post_ids).only('pk', 'author_id', 'category_id')}
+    _write(snapshots, seqs, posts)
+    complete = conn.register_script(_COMPLETE_SCRIPT)
+    pipe = conn.pipeline()
+    for post_id in post_ids:
+        complete(keys=_snapshot_keys(post_id), args=[post_id], client=pipe)
+    pipe.execute()
+    for post in posts.values():
+        pagecache.purge_post(post)
+    return len(post_ids)
+
+
+def _snapshot_keys(post_id):
+    return [_key(post_id, name) for name in ('state', 'changed', 'delta', 'fstate', 'fdelta', 'gen')] + [
+        _dirty_key(), _flushing_key(), _key(post_id, 'seq')]
+
+
+def _write(snapshots, seqs, posts):
+    """Upsert/delete голосов из снимков в PostVote и Vote, пересчет счетчиков и номера снимков - одна транзакция."""
+    user_ids = {user_id for state in snapshots.values() for user_id in state}
+    existing_users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+    content_type = ContentType.objects.get_for_model(Post)
+    upserts, deletes = [], {}
+    for post_id, state in snapshots.items():
+        if post_id not in posts:
+            continue  # Пост удален - его голоса удалены каскадом
+        for user_id, value in state.items():
+            if user_id not in existing_users:
+                continue
+            if value:
+                upserts.append((post_id, user_id, value))
+            else:
+                deletes.setdefault(post_id, []).append(user_id)
+    with transaction.atomic():
+        PostVote.objects.bulk_create(
+            [PostVote(post_id=post_id, user_id=user_id, value=value) for post_id, user_id, value in upserts],
+            update_conflicts=True, unique_fields=['user', 'post'], update_fields=['value'], batch_size=BATCH_SIZE,
+        )
+        Vote.objects.bulk_create(
+            [Vote(user_id=user_id, content_type=content_type, object_id=post_id, vote_type=value)
+             for post_id, user_id, value in upserts],
+            update_conflicts=True, unique_fields=['user', 'content_type', 'object_id'], update_fields=['vote_type'],
+            batch_size=BATCH_SIZE,
+        )
+        for post_id, post_user_ids in deletes.items():
+            PostVote.objects.filter(post_id=post_id, user_id__in=post_user_ids).delete()
+            Vote.objects.filter(content_type=content_type, object_id=post_id, user_id__in=post_user_ids).delete()
+        Post.objects.rebuild_vote_counters(list(posts))
+        Post.objects.filter(pk__in=list(posts)).update(votes_flushed=Case(
+            *(When(pk=post_id, then=Value(seqs[post_id])) for post_id in posts), output_field=BigIntegerField()))
+
+
+# KEYS: state, changed, delta, fstate, fdelta, gen, dirty, flushing, seq; ARGV: post_id
+# Возвращает номер снимка и его голоса (user, value, ...); снимок, оставшийся после сбоя, - тот же
+_CLAIM_SCRIPT = """
+if redis.call('sismember', KEYS[8], ARGV[1]) == 0 then
+    local now = redis.call('time')
+    local seq = math.max(tonumber(redis.call('get', KEYS[9]) or '0') + 1, now[1] * 1000000 + now[2])
+    redis.call('set', KEYS[9], string.format('%d', seq))
+    local users = redis.call('smembers', KEYS[2])
+    for _, user in ipairs(users) do
+        redis.call('hset', KEYS[4], user, redis.call('hget', KEYS[1], user))
+    end
+    redis.call('del', KEYS[2])
+    if redis.call('exists', KEYS[3]) == 1 then redis.call('rename', KEYS[3], KEYS[5]) end
+    redis.call('srem', KEYS[7], ARGV[1])
+    redis.call('sadd', KEYS[8], ARGV[1])
+end
+local result = redis.call('hgetall', KEYS[4])
+table.insert(result, 1, redis.call('get', KEYS[9]))
+return result
+"""
+
+# Снимок записан в БД: удаляем его; state без новых голосов больше не нужен - ответы есть в PostVote
+_COMPLETE_SCRIPT = """
+redis.call('del', KEYS[4], KEYS[5])
+redis.call('srem', KEYS[8], ARGV[1])
+if redis.call('exists', KEYS[2]) == 0 then
+    redis.call('del', KEYS[1])
+    redis.call('incr', KEYS[6])
+end
+return 0
+"""
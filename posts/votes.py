@@ -0,0 +1,97 @@
+# posts/votes.py
+"""
+Голоса за посты: чтение и запись через компактную таблицу PostVote (post, user, value).
+
+Голоса зрителя для страницы постов - один запрос по unique-индексу (user, post), счетчики
+(rebuild_counters) - по индексу (post, value). Обобщенная таблица Vote (GenericForeignKey) пишется
+параллельно в той же транзакции: по ней работает админка. Если Vote правили мимо этого модуля
+(админка), PostVote постов приводится к ней функцией resync.
+
+В режиме отложенной записи (posts.votebuffer) голос сначала попадает в Redis, а чтение
+накладывает несброшенные голоса и сдвиги счетчиков поверх БД.
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from . import pagecache, votebuffer
+from .models import Post, PostVote, Vote
+
+BATCH_SIZE = 1000
+
+
+def user_votes(user, post_ids):
+    """{post_id: значение голоса} пользователя для постов post_ids - один запрос."""
+    post_ids = list(post_ids)
+    if not post_ids or not user.is_authenticated:
+        return {}
+    conn = votebuffer.connection()
+    # Буфер читается до БД: очищенный после сброса state означает, что голос уже в PostVote
+    pending = votebuffer.pending_votes(conn, user.pk, post_ids) if conn is not None else {}
+    stored = dict(PostVote.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', 'value'))
+    stored.update(pending)
+    return {post_id: value for post_id, value in stored.items() if value}
+
+
+def user_vote(user, post_id):
+    return user_votes(user, [post_id]).get(post_id)
+
+
+def cast(user, post, value):
+    """
+    Голос value за пост: повторный такой же голос снимает его, противоположный - заменяет.
+    Обновляет PostVote, Vote и счетчики поста (или буфер отложенной записи); возвращает
+    итоговый голос пользователя или None.
+    """
+    conn = votebuffer.connection()
+    if conn is not None:
+        # В БД голос и кеш страниц обновит flush_votes
+        return votebuffer.cast(conn, user.pk, post.pk, value)
+    post_id = post.pk
+    content_type = ContentType.objects.get_for_model(Post)
+    mirror = Vote.objects.filter(user=user, content_type=content_type, object_id=post_id)
+    with transaction.atomic():
+        vote, created = PostVote.objects.select_for_update().get_or_create(
+            user=user, post_id=post_id, defaults={'value': value})
+        deltas, final = {Vote.counter_field(value): 1}, value
+        if not created:
+            deltas = {Vote.counter_field(vote.value): -1}
+            if vote.value == value:
+                vote.delete()
+                mirror.delete()
+                final = None
+            else:
+                PostVote.objects.filter(pk=vote.pk).update(value=value)
+                deltas[Vote.counter_field(value)] = 1
+        if final is not None:
+            Vote.objects.update_or_create(
+                user=user, content_type=content_type, object_id=post_id, defaults={'vote_type': final})
+        Post.objects.adjust_counters(post_id, **deltas)
+        pagecache.purge_post(post)
+    return final
+
+
+def refresh_counters(post):
+    """Перечитывает счетчики поста из БД и добавляет несброшенные голоса из буфера (для ответа голосующему)."""
+    conn = votebuffer.connection()
+    # Буфер читается до БД: снимок, записанный после чтения, БД покажет сама (votes_flushed)
+    pending = votebuffer.pending_counters(conn, post.pk) if conn is not None else None
+    post.refresh_from_db(fields=['likes_count', 'dislikes_count', 'comments_count', 'votes_flushed'])
+    if pending is not None:
+        for field, delta in votebuffer.counters_over(pending, post.votes_flushed).items():
+            setattr(post, field, max(getattr(post, field) + delta, 0))
+    return post
+
+
+def resync(post_ids):
+    """Переписывает PostVote постов post_ids по таблице Vote (после правок Vote в админке)."""
+    post_ids = list(post_ids)
+    content_type = ContentType.objects.get_for_model(Post)
+    with transaction.atomic():
+        PostVote.objects.filter(post_id__in=post_ids).delete()
+        rows = Vote.objects.filter(content_type=content_type, object_id__in=post_ids).values_list(
+            'object_id', 'user_id', 'vote_type')
+        PostVote.objects.bulk_create(
+            [PostVote(post_id=post_id, user_id=user_id, value=value) for post_id, user_id, value in rows],
+            batch_size=BATCH_SIZE,
+        )
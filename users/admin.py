@@ -3,10 +3,11 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Count
 from django.urls import reverse
 from django.utils.html import format_html
 
+from posts.scalable_admin import ScalableAdminMixin
+
 from .models import Profile # Импортируем Profile
 
 # Отменяем регистрацию стандартной UserAdmin, чтобы добавить инлайн
@@ -53,12 +54,11 @@ class UserAdmin(BaseUserAdmin):
         return super().get_inline_instances(request, obj)
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(ScalableAdminMixin, admin.ModelAdmin):
     """Отдельная админка для Профилей."""
     list_display = ('user_link', 'bio_preview', 'following_count_display', 'followers_count_display')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'bio')
     list_select_related = ('user',)
-    filter_horizontal = ('following',)
     readonly_fields = ('following_count_display', 'followers_count_display')
     autocomplete_fields = ['user', 'following']
 
@@ -84,19 +84,10 @@ class ProfileAdmin(admin.ModelAdmin):
             return (obj.bio[:max_len] + '...') if len(obj.bio) > max_len else obj.bio
         return "-"
 
-    @admin.display(description='Подписок', ordering='num_following')
+    @admin.display(description='Подписок', ordering='following_count')
     def following_count_display(self, obj):
-        return getattr(obj, 'num_following', 0) # Используем getattr с дефолтом 0
+        return obj.following_count
 
-    @admin.display(description='Подписчиков', ordering='num_followers')
+    @admin.display(description='Подписчиков', ordering='followers_count')
     def followers_count_display(self, obj):
-        return getattr(obj, 'num_followers', 0) # Используем getattr с дефолтом 0
-
-    def get_queryset(self, request):
-        """Оптимизация: добавляем подсчет подписок."""
-        queryset = super().get_queryset(request).select_related('user')
-        queryset = queryset.annotate(
-            num_following=Count('following', distinct=True),
-            num_followers=Count('followers', distinct=True),
-        )
-        return queryset
\ No newline at end of file
+        return obj.followers_count
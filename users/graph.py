@@ -0,0 +1,253 @@
+# users/graph.py
+"""
+Граф подписок в Redis (кеш django_redis): для каждого профиля два множества - на кого он
+подписан и кто подписан на него. Проверки подписки, пачка статусов для страницы профилей,
+пересечения ("на него подписаны ваши подписки") и счетчики отвечают из Redis без SQL.
+
+Множества заполняются из таблицы подписок при первом обращении (одним запросом на пачку
+профилей) и обновляются при каждой подписке/отписке после коммита (users.signals).
+Метка :loaded отличает пустое множество от незагруженного; множества и метки живут
+FOLLOW_GRAPH_TIMEOUT, так что случайное расхождение с БД исправляется само.
+Каждая запись увеличивает версию множества (:version), даже незагруженного; загрузка следит за
+версиями (WATCH) от чтения из БД до записи в Redis. Если между ними подписка закоммичена и
+записана, загрузка повторяется, а множество без метки не переживает следующего чтения.
+Полная перестройка - команда rebuild_follow_graph.
+
+Если кеш - не django_redis (тесты, локальная разработка), те же функции работают через SQL.
+"""
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Profile
+
+FOLLOWING, FOLLOWERS = 'following', 'followers'
+# Поле таблицы подписок, по которому группируется множество, и поле-член множества
+_COLUMNS = {FOLLOWING: ('from_profile_id', 'to_profile_id'), FOLLOWERS: ('to_profile_id', 'from_profile_id')}
+
+
+def _follow_model():
+    return Profile.following.through
+
+
+def _timeout():
+    return getattr(settings, 'FOLLOW_GRAPH_TIMEOUT', 86400)
+
+
+def redis_connection():
+    """Соединение Redis кеша по умолчанию или None, если кеш не django_redis."""
+    try:
+        from django_redis import get_redis_connection
+        from django_redis.cache import RedisCache
+    except ImportError:
+        return None
+    if not isinstance(caches['default'], RedisCache):
+        return None
+    return get_redis_connection('default')
+
+
+def _key(kind, profile_id):
+    return cache.make_key(f'follow:{profile_id}:{kind}')
+
+
+def _loaded_key(kind, profile_id):
+    return cache.make_key(f'follow:{profile_id}:{kind}:loaded')
+
+
+def _version_key(kind, profile_id):
+    return cache.make_key(f'follow:{profile_id}:{kind}:version')
+
+
+def _ensure(conn, kind, profile_ids):
+    """Загружает из БД множества kind для профилей, которых еще нет в Redis (один запрос на всех)."""
+    profile_ids = list(dict.fromkeys(profile_ids))
+    pipe = conn.pipeline(transaction=False)
+    for profile_id in profile_ids:
+        pipe.exists(_loaded_key(kind, profile_id))
+    missing = [profile_id for profile_id, loaded in zip(profile_ids, pipe.execute()) if not loaded]
+    if missing:
+        _load(conn, kind, missing)
+
+
+def _load(conn, kind, profile_ids, attempts=3):
+    from redis.exceptions import WatchError
+    version_keys = [_version_key(kind, profile_id) for profile_id in profile_ids]
+    with conn.pipeline() as pipe:
+        for _ in range(attempts):
+            # Запись, попавшая между чтением из БД и EXEC, меняет версию - EXEC не выполняется
+            pipe.watch(*version_keys)
+            members = _read_members(kind, profile_ids)
+            pipe.multi()
+            _fill(pipe, kind, members, loaded=True)
+            try:
+                pipe.execute()
+                return
+            except WatchError:
+                continue
+        # Записи не прекращаются: множества - для текущего чтения, без метки (следующее перечитает БД)
+        _fill(pipe, kind, _read_members(kind, profile_ids), loaded=False)
+        pipe.execute()
+
+
+def _read_members(kind, profile_ids):
+    group_by, member = _COLUMNS[kind]
+    members = {profile_id: [] for profile_id in profile_ids}
+    # Только default: подписку, записанную до WATCH, отстающая реплика еще не видит (posts.replicas)
+    rows = _follow_model().objects.using(DEFAULT_DB_ALIAS).filter(**{f'{group_by}__in': profile_ids}).values_list(group_by, member)
+    for owner_id, member_id in rows.iterator():
+        members[owner_id].append(member_id)
+    return members
+
+
+def _fill(pipe, kind, members, loaded):
+    timeout = _timeout()
+    for profile_id, ids in members.items():
+        key = _key(kind, profile_id)
+        pipe.delete(key)
+        if ids:
+            pipe.sadd(key, *ids)
+            pipe.expire(key, timeout)
+        if loaded:
+            pipe.set(_loaded_key(kind, profile_id), 1, ex=timeout)
+        else:
+            pipe.delete(_loaded_key(kind, profile_id))
+
+
+def _ints(members):
+    return {int(member) for member in members}
+
+
+# --- Чтение ---
+def is_following(follower_id, followee_id):
+    """Подписан ли профиль follower_id на профиль followee_id."""
+    conn = redis_connection()
+    if conn is None:
+        return _follow_model().objects.filter(from_profile_id=follower_id, to_profile_id=followee_id).exists()
+    _ensure(conn, FOLLOWING, [follower_id])
+    return bool(conn.sismember(_key(FOLLOWING, follower_id), followee_id))
+
+
+def following_among(follower_id, profile_ids):
+    """Те из profile_ids, на кого подписан follower_id (статусы кнопок для страницы профилей)."""
+    profile_ids = list(profile_ids)
+    if not profile_ids:
+        return set()
+    conn = redis_connection()
+    if conn is None:
+        return set(_follow_model().objects.filter(
+            from_profile_id=follower_id, to_profile_id__in=profile_ids
+        ).values_list('to_profile_id', flat=True))
+    _ensure(conn, FOLLOWING, [follower_id])
+    flags = conn.smismember(_key(FOLLOWING, follower_id), profile_ids)
+    return {profile_id for profile_id, flag in zip(profile_ids, flags) if flag}
+
+
+def following_ids(profile_id):
+    conn = redis_connection()
+    if conn is None:
+        return set(_follow_model().objects.filter(from_profile_id=profile_id).values_list('to_profile_id', flat=True))
+    _ensure(conn, FOLLOWING, [profile_id])
+    return _ints(conn.smembers(_key(FOLLOWING, profile_id)))
+
+
+def follower_ids(profile_id):
+    conn = redis_connection()
+    if conn is None:
+        return set(_follow_model().objects.filter(to_profile_id=profile_id).values_list('from_profile_id', flat=True))
+    _ensure(conn, FOLLOWERS, [profile_id])
+    return _ints(conn.smembers(_key(FOLLOWERS, profile_id)))
+
+
+def followed_by_following(viewer_id, profile_id):
+    """Профили из подписок viewer_id, которые подписаны на profile_id."""
+    conn = redis_connection()
+    if conn is None:
+        Follow = _follow_model()
+        return set(Follow.objects.filter(
+            to_profile_id=profile_id,
+            from_profile_id__in=Follow.objects.filter(from_profile_id=viewer_id).values('to_profile_id'),
+        ).values_list('from_profile_id', flat=True))
+    _ensure(conn, FOLLOWING, [viewer_id])
+    _ensure(conn, FOLLOWERS, [profile_id])
+    return _ints(conn.sinter(_key(FOLLOWING, viewer_id), _key(FOLLOWERS, profile_id)))
+
+
+def following_count(profile_id):
+    conn = redis_connection()
+    if conn is None:
+        return _follow_model().objects.filter(from_profile_id=profile_id).count()
+    _ensure(conn, FOLLOWING, [profile_id])
+    return conn.scard(_key(FOLLOWING, profile_id))
+
+
+def followers_count(profile_id):
+    conn = redis_connection()
+    if conn is None:
+        return _follow_model().objects.filter(to_profile_id=profile_id).count()
+    _ensure(conn, FOLLOWERS, [profile_id])
+    return conn.scard(_key(FOLLOWERS, profile_id))
+
+
+# --- Запись (вызывается после коммита подписки/отписки) ---
+def add(follower_id, followee_ids):
+    _write('sadd', follower_id, followee_ids)
+
+
+def remove(follower_id, followee_ids):
+    _write('srem', follower_id, followee_ids)
+
+
+def _write(command, follower_id, followee_ids):
+    """Правит только загруженные множества: незагруженные подтянутся из БД при чтении."""
+    followee_ids = list(followee_ids)
+    conn = redis_connection()
+    if conn is None or not followee_ids:
+        return
+    # Версия, проверка метки и изменение множества - один Lua-скрипт (атомарно на стороне Redis)
+    script = conn.register_script(_WRITE_SCRIPT)
+    timeout = _timeout()
+    pipe = conn.pipeline()
+    script(keys=[_key(FOLLOWING, follower_id), _loaded_key(FOLLOWING, follower_id),
+                 _version_key(FOLLOWING, follower_id)],
+           args=[timeout, command, *followee_ids], client=pipe)
+    for followee_id in followee_ids:
+        script(keys=[_key(FOLLOWERS, followee_id), _loaded_key(FOLLOWERS, followee_id),
+                     _version_key(FOLLOWERS, followee_id)],
+               args=[timeout, command, follower_id], client=pipe)
+    pipe.execute()
+
+
+# Версия растет и у незагруженного множества: идущая загрузка (WATCH) узнает о записи
+_WRITE_SCRIPT = """
+redis.call('incr', KEYS[3])
+redis.call('expire', KEYS[3], ARGV[1])
+if redis.call('exists', KEYS[2]) == 1 then
+    redis.call(ARGV[2], KEYS[1], unpack(ARGV, 3))
+end
+return 0
+"""
+
+
+def rebuild(profile_ids=None, batch_size=1000):
+    """Перечитывает множества из БД для profile_ids (по умолчанию - всех профилей); возвращает число профилей."""
+    conn = redis_connection()
+    if conn is None:
+        return 0
+    if profile_ids is None:
+        profile_ids = Profile.objects.order_by('pk').values_list('pk', flat=True).iterator()
+    total, batch = 0, []
+    for profile_id in profile_ids:
+        batch.append(profile_id)
+        if len(batch) >= batch_size:
+            total += _rebuild_batch(conn, batch)
+            batch = []
+    if batch:
+        total += _rebuild_batch(conn, batch)
+    return total
+
+
+def _rebuild_batch(conn, profile_ids):
+    for kind in (FOLLOWING, FOLLOWERS):
+        _load(conn, kind, profile_ids)
+    return len(profile_ids)
@@ -0,0 +1,20 @@
+# users/management/commands/rebuild_follow_graph.py
+
+from django.core.management.base import BaseCommand
+
+from users import graph
+
+
+class Command(BaseCommand):
+    help = "Перестраивает граф подписок в Redis (множества подписок и подписчиков) по таблице подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_ids', nargs='*', type=int, help="ID профилей (по умолчанию - все профили).")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Сколько профилей загружать одним запросом.")
+
+    def handle(self, *args, **options):
+        if graph.redis_connection() is None:
+            self.stdout.write(self.style.WARNING("Кеш не django_redis: граф подписок читается из БД, перестраивать нечего."))
+            return
+        total = graph.rebuild(options['profile_ids'] or None, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Граф подписок перестроен для профилей: {total}."))
@@ -0,0 +1,16 @@
+# users/management/commands/rebuild_profile_counters.py
+
+from django.core.management.base import BaseCommand
+
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счетчики профилей (подписчики, подписки) по таблице подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_ids', nargs='*', type=int, help="ID профилей (по умолчанию - все профили).")
+
+    def handle(self, *args, **options):
+        total = Profile.objects.rebuild_follow_counts(options['profile_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Счетчики пересчитаны для профилей: {total}."))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.20 on 2026-10-18 20:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_follow_counts(apps, schema_editor):
+    Profile = apps.get_model('users', 'Profile')
+    Follow = Profile.following.through
+
+    def follow_count(field):
+        return Coalesce(Subquery(
+            Follow.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(c=Count('pk')).values('c')
+        ), 0)
+
+    Profile.objects.update(followers_count=follow_count('to_profile'), following_count=follow_count('from_profile'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписок'),
+        ),
+        migrations.RunPython(backfill_follow_counts, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,9 @@
 # import secrets # Больше не нужен
 # from datetime import timedelta # Больше не нужен
 from django.conf import settings
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.urls import reverse
@@ -12,11 +14,33 @@ from django.utils import timezone
 
 User = settings.AUTH_USER_MODEL
 
+
+class ProfileManager(models.Manager):
+    def rebuild_follow_counts(self, profile_ids=None):
+        """Пересчитывает followers_count / following_count по таблице подписок (для всех профилей или для profile_ids)."""
+        Follow = self.model.following.through
+
+        def follow_count(field):
+            return Coalesce(Subquery(
+                Follow.objects.filter(**{field: OuterRef("pk")}).order_by().values(field).annotate(c=Count("pk")).values("c")
+            ), 0)
+
+        qs = self.get_queryset()
+        if profile_ids is not None:
+            qs = qs.filter(pk__in=list(profile_ids))
+        return qs.update(followers_count=follow_count("to_profile"), following_count=follow_count("from_profile"))
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile", verbose_name="Пользователь")
     bio = models.TextField("О себе", blank=True)
     avatar = models.ImageField("Аватар", upload_to="avatars/", blank=True, null=True, help_text="Загрузите изображение профиля.")
     following = models.ManyToManyField("self", symmetrical=False, related_name="followers", blank=True, verbose_name="Подписки")
+    # Денормализованные счетчики: меняются атомарно в follow()/unfollow(), пересчет - rebuild_profile_counters
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0, editable=False)
+    following_count = models.PositiveIntegerField("Подписок", default=0, editable=False)
+
+    objects = ProfileManager()
 
     class Meta:
         verbose_name = "Профиль"
@@ -30,28 +54,52 @@ class Profile(models.Model):
         """Возвращает URL для просмотра профиля пользователя."""
         return reverse('users:profile_detail', args=[self.user.username])
 
-    # Опционально: методы для управления подписками
+    # Методы для управления подписками: один INSERT/DELETE по таблице подписок + сдвиг счетчиков,
+    # без чтения списков; повторный вызов ничего не меняет и возвращает False
     def follow(self, profile_to_follow):
         """Подписаться на профиль."""
-        if profile_to_follow not in self.following.all():
-            self.following.add(profile_to_follow)
-            return True
-        return False
+        Follow = Profile.following.through
+        try:
+            with transaction.atomic():
+                Follow.objects.create(from_profile_id=self.pk, to_profile_id=profile_to_follow.pk)
+                self._adjust_follow_counts(profile_to_follow, 1)
+        except IntegrityError:  # Уже подписан (уникальная пара в таблице подписок)
+            return False
+        self._follow_changed(profile_to_follow, followed=True)
+        return True
 
     def unfollow(self, profile_to_unfollow):
         """Отписаться от профиля."""
-        if profile_to_unfollow in self.following.all():
-            self.following.remove(profile_to_unfollow)
-            return True
-        return False
+        Follow = Profile.following.through
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(from_profile_id=self.pk, to_profile_id=profile_to_unfollow.pk).delete()
+            if not deleted:
+                return False
+            self._adjust_follow_counts(profile_to_unfollow, -1)
+        self._follow_changed(profile_to_unfollow, followed=False)
+        return True
+
+    def _adjust_follow_counts(self, other, delta):
+        Profile.objects.filter(pk=self.pk).update(following_count=Greatest(F('following_count') + delta, Value(0)))
+        Profile.objects.filter(pk=other.pk).update(followers_count=Greatest(F('followers_count') + delta, Value(0)))
+        self.following_count = max(self.following_count + delta, 0)
+        other.followers_count = max(other.followers_count + delta, 0)
+
+    def _follow_changed(self, other, followed):
+        from .signals import follow_changed
+        transaction.on_commit(
+            lambda: follow_changed.send(sender=Profile, follower=self, followees=[other], followed=followed)
+        )
 
     def is_following(self, profile_to_check):
         """Проверяет, подписан ли текущий профиль на другой."""
-        return self.following.filter(pk=profile_to_check.pk).exists()
+        from . import graph
+        return graph.is_following(self.pk, profile_to_check.pk)
 
     def is_followed_by(self, profile_to_check):
         """Проверяет, подписан ли другой профиль на текущий."""
-        return self.followers.filter(pk=profile_to_check.pk).exists()
+        from . import graph
+        return graph.is_following(profile_to_check.pk, self.pk)
 
 
 # --- МОДЕЛЬ EmailVerificationCode УДАЛЕНА ---
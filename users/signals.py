@@ -0,0 +1,66 @@
+# users/signals.py
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import graph
+from .models import Profile
+
+# Подписка или отписка состоялась. Аргументы: sender=Profile, follower (Profile), followees (список Profile),
+# followed (True - подписка, False - отписка). Отправляется после коммита транзакции.
+follow_changed = Signal()
+
+
+# --- Изменения M2M в обход follow()/unfollow() (админка, .add()/.remove()/.clear()) ---
+@receiver(m2m_changed, sender=Profile.following.through)
+def sync_follow_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """Пересчитывает счетчики затронутых профилей и рассылает follow_changed, как follow()/unfollow()."""
+    if action == 'pre_clear':
+        related = instance.followers if reverse else instance.following
+        instance._cleared_follow_pks = set(related.values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_follow_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    Profile.objects.rebuild_follow_counts([instance.pk, *pk_set])
+    others = list(Profile.objects.filter(pk__in=pk_set))
+    followed = action == 'post_add'
+    if reverse:  # profile.followers.add(...): instance - автор, pk_set - подписчики
+        changes = [(follower, [instance]) for follower in others]
+    else:
+        changes = [(instance, others)]
+
+    def send():
+        for follower, followees in changes:
+            follow_changed.send(sender=Profile, follower=follower, followees=followees, followed=followed)
+    transaction.on_commit(send)
+
+
+@receiver(pre_delete, sender=Profile)
+def forget_deleted_profile_follows(sender, instance, **kwargs):
+    """Строки подписок удаляются каскадом без m2m_changed: сдвигаем чужие счетчики и граф сами."""
+    Follow = Profile.following.through
+    following = list(Follow.objects.filter(from_profile_id=instance.pk).values_list('to_profile_id', flat=True))
+    followers = list(Follow.objects.filter(to_profile_id=instance.pk).values_list('from_profile_id', flat=True))
+    Profile.objects.filter(pk__in=following).update(followers_count=Greatest(F('followers_count') - 1, Value(0)))
+    Profile.objects.filter(pk__in=followers).update(following_count=Greatest(F('following_count') - 1, Value(0)))
+    profile_id = instance.pk  # После удаления instance.pk - None
+
+    def drop():
+        graph.remove(profile_id, following)
+        for follower_id in followers:
+            graph.remove(follower_id, [profile_id])
+    transaction.on_commit(drop)
+
+
+# --- Граф подписок в Redis: write-through после коммита ---
+@receiver(follow_changed)
+def sync_follow_graph(sender, follower, followees, followed, **kwargs):
+    write = graph.add if followed else graph.remove
+    write(follower.pk, [followee.pk for followee in followees])
@@ -0,0 +1,261 @@
+# users/tests.py
+
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import graph
+from .models import Profile
+
+try:
+    import fakeredis
+except ImportError:  # dev-зависимость (dev-requirements.txt)
+    fakeredis = None
+
+User = get_user_model()
+
+# Пул django_redis кешируется по URL на процесс - сервер один на все тесты, между тестами flushall
+FAKE_SERVER = fakeredis.FakeServer() if fakeredis is not None else None
+
+
+def make_user(username):
+    return User.objects.create_user(username=username, password="pass")
+
+
+@unittest.skipIf(fakeredis is None, "нужен fakeredis из dev-requirements")
+class RedisCacheMixin:
+    """Кеш по умолчанию - django_redis поверх fakeredis: включает ветки кода, работающие с Redis."""
+
+    def setUp(self):
+        caches_setting = {
+            "default": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://fakeredis/0",
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                    "CONNECTION_POOL_KWARGS": {"connection_class": fakeredis.FakeRedisConnection, "server": FAKE_SERVER},
+                },
+            }
+        }
+        override = override_settings(CACHES=caches_setting)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.redis = graph.redis_connection()
+        self.redis.flushall()
+        super().setUp()
+
+
+class FollowGraphTestsMixin:
+    """Ответы графа подписок; одинаковы для Redis и для SQL-варианта (кеш не django_redis)."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        users = [make_user(f"u{number}") for number in range(6)]
+        self.users = users
+        self.p = [user.profile for user in users]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p[0].follow(self.p[1])
+            self.p[0].follow(self.p[2])
+            self.p[1].follow(self.p[3])
+            self.p[2].follow(self.p[3])
+            self.p[4].follow(self.p[3])
+
+    def test_reads(self):
+        p = self.p
+        self.assertTrue(graph.is_following(p[0].pk, p[1].pk))
+        self.assertFalse(graph.is_following(p[1].pk, p[0].pk))
+        self.assertEqual(graph.following_among(p[0].pk, [pr.pk for pr in p]), {p[1].pk, p[2].pk})
+        self.assertEqual(graph.followed_by_following(p[0].pk, p[3].pk), {p[1].pk, p[2].pk})
+        self.assertEqual(graph.follower_ids(p[3].pk), {p[1].pk, p[2].pk, p[4].pk})
+        self.assertEqual((graph.followers_count(p[3].pk), graph.following_count(p[0].pk)), (3, 2))
+        self.assertTrue(p[0].is_following(p[1]))
+        self.assertTrue(p[1].is_followed_by(p[0]))
+
+    def test_follow_and_unfollow_update_graph(self):
+        p = self.p
+        graph.follower_ids(p[3].pk)  # Множества загружены до записи
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(p[0].follow(p[3]))
+            self.assertFalse(p[0].follow(p[3]))
+        self.assertTrue(graph.is_following(p[0].pk, p[3].pk))
+        self.assertEqual(graph.followers_count(p[3].pk), 4)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(p[0].unfollow(p[3]))
+            self.assertFalse(p[0].unfollow(p[3]))
+        self.assertFalse(graph.is_following(p[0].pk, p[3].pk))
+        self.assertEqual(graph.followers_count(p[3].pk), 3)
+
+    def test_m2m_changes_and_profile_delete(self):
+        p = self.p
+        graph.follower_ids(p[3].pk)
+        graph.following_ids(p[1].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            p[3].followers.add(p[5])
+        self.assertTrue(graph.is_following(p[5].pk, p[3].pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            p[3].followers.clear()
+        self.assertEqual(graph.follower_ids(p[3].pk), set())
+        self.assertEqual(graph.following_ids(p[1].pk), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.users[2].delete()
+        self.assertEqual(graph.following_ids(p[0].pk), {p[1].pk})
+
+
+class FollowGraphSqlTests(FollowGraphTestsMixin, TestCase):
+    """Кеш не django_redis - граф отвечает запросами к таблице подписок."""
+
+    def test_no_redis(self):
+        self.assertIsNone(graph.redis_connection())
+
+
+class FollowGraphRedisTests(FollowGraphTestsMixin, RedisCacheMixin, TestCase):
+    """Граф в Redis: после загрузки множеств проверки не обращаются к БД."""
+
+    def test_reads_without_sql_once_loaded(self):
+        p = self.p
+        graph.following_ids(p[0].pk)
+        graph.follower_ids(p[3].pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(p[0].pk, p[1].pk))
+            self.assertEqual(graph.following_among(p[0].pk, [p[1].pk, p[3].pk]), {p[1].pk})
+            self.assertEqual(graph.followers_count(p[3].pk), 3)
+        with self.assertNumQueries(1):  # Подгружается только множество подписчиков p[4]
+            graph.followed_by_following(p[0].pk, p[4].pk)
+
+    def test_writes_skip_unloaded_sets(self):
+        p = self.p
+        with self.captureOnCommitCallbacks(execute=True):
+            p[5].follow(p[0])
+        self.assertFalse(self.redis.exists(graph._key(graph.FOLLOWING, p[5].pk)))
+        self.assertTrue(graph.is_following(p[5].pk, p[0].pk))
+
+    def test_write_during_cold_load_is_not_lost(self):
+        p = self.p
+        read_members = graph._read_members
+        Follow = Profile.following.through
+        calls = []
+
+        def racing_read(kind, profile_ids):
+            members = read_members(kind, profile_ids)
+            if not calls:
+                # Подписка коммитится и пишется в граф после чтения из БД, но до записи в Redis
+                calls.append(kind)
+                Follow.objects.create(from_profile_id=p[5].pk, to_profile_id=p[3].pk)
+                graph.add(p[5].pk, [p[3].pk])
+            return members
+
+        with mock.patch.object(graph, "_read_members", side_effect=racing_read) as read:
+            self.assertIn(p[5].pk, graph.follower_ids(p[3].pk))
+        self.assertEqual(read.call_count, 2)  # Первая загрузка отброшена (WATCH), вторая видит подписку
+        self.assertTrue(self.redis.exists(graph._loaded_key(graph.FOLLOWERS, p[3].pk)))
+
+    def test_rebuild_repairs_drift(self):
+        p = self.p
+        graph.following_ids(p[0].pk)
+        self.redis.srem(graph._key(graph.FOLLOWING, p[0].pk), p[1].pk)
+        self.assertFalse(graph.is_following(p[0].pk, p[1].pk))
+        self.assertEqual(graph.rebuild(), len(p))
+        self.assertTrue(graph.is_following(p[0].pk, p[1].pk))
+
+
+class FollowCountersTests(TestCase):
+    """Счетчики followers_count / following_count на Profile."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice").profile
+        self.bob = make_user("bob").profile
+        self.carol = make_user("carol").profile
+
+    def counts(self, profile):
+        profile.refresh_from_db()
+        return profile.followers_count, profile.following_count
+
+    def test_follow_and_unfollow_are_idempotent(self):
+        self.assertTrue(self.alice.follow(self.bob))
+        self.assertFalse(self.alice.follow(self.bob))
+        self.assertEqual((self.counts(self.alice), self.counts(self.bob)), ((0, 1), (1, 0)))
+        self.assertTrue(self.alice.unfollow(self.bob))
+        self.assertFalse(self.alice.unfollow(self.bob))
+        self.assertEqual((self.counts(self.alice), self.counts(self.bob)), ((0, 0), (0, 0)))
+
+    def test_m2m_changes_keep_counters(self):
+        self.alice.following.add(self.bob, self.carol)
+        self.carol.followers.add(self.bob)
+        self.assertEqual([self.counts(p) for p in (self.alice, self.bob, self.carol)], [(0, 2), (1, 1), (2, 0)])
+        self.carol.followers.clear()
+        self.assertEqual([self.counts(p) for p in (self.alice, self.bob, self.carol)], [(0, 1), (1, 0), (0, 0)])
+
+    def test_deleted_profile_releases_counters(self):
+        self.alice.follow(self.bob)
+        self.bob.follow(self.carol)
+        self.bob.user.delete()
+        self.assertEqual((self.counts(self.alice), self.counts(self.carol)), ((0, 0), (0, 0)))
+
+    def test_rebuild_profile_counters(self):
+        self.alice.follow(self.bob)
+        Profile.objects.update(followers_count=9, following_count=9)
+        call_command("rebuild_profile_counters", stdout=StringIO())
+        self.assertEqual([self.counts(p) for p in (self.alice, self.bob, self.carol)], [(0, 1), (1, 0), (0, 0)])
+
+    def toggle_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_toggle_view_returns_new_count(self):
+        self.client.force_login(self.alice.user)
+        response = self.client.post(reverse("users:toggle_follow", args=["bob"]))
+        self.assertIn('id="followers-count-bob">1<', response["HX-Swap-Oob"])
+        self.assertEqual(self.counts(self.alice), (0, 1))
+        self.assertEqual(self.client.post(reverse("users:toggle_follow", args=["alice"])).status_code, 403)
+
+    def test_toggle_view_queries_do_not_depend_on_followers(self):
+        self.client.force_login(self.alice.user)
+        url = reverse("users:toggle_follow", args=["bob"])
+        before = (self.toggle_queries(url), self.toggle_queries(url))
+        for number in range(10):
+            make_user(f"fan{number}").profile.follow(self.bob)
+        self.assertEqual((self.toggle_queries(url), self.toggle_queries(url)), before)
+
+
+class ProfileConditionalGetTests(TestCase):
+    """304 на странице профиля; подписка и правка профиля меняют ETag."""
+
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user("alice").profile
+        self.bob = make_user("bob").profile
+        self.client.force_login(self.alice.user)
+        self.url = reverse("users:profile_detail", args=["bob"])
+        self.client.get(self.url)  # Первый ответ ставит CSRF cookie, ее секрет входит в ETag
+
+    def status_for(self, etag):
+        return self.client.get(self.url, headers={"if_none_match": etag}).status_code
+
+    def test_profile_304_and_invalidation(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.status_for(etag), 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.follow(self.bob)
+        self.assertEqual(self.status_for(etag), 200)
+        etag = self.client.get(self.url)["ETag"]
+        self.bob.bio = "о себе"
+        self.bob.save()
+        self.assertEqual(self.status_for(etag), 200)
+
+    def test_etag_only_and_one_graph_lookup(self):
+        with mock.patch.object(graph, "followed_by_following", wraps=graph.followed_by_following) as lookup:
+            response = self.client.get(self.url)
+        self.assertEqual(lookup.call_count, 1)
+        self.assertNotIn("Last-Modified", response)
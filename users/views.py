@@ -1,5 +1,6 @@
 # users/views.py
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View
 # Добавляем ListView для списков подписчиков/подписок
@@ -9,20 +10,22 @@ from django.urls import reverse, reverse_lazy
 # Добавляем стандартные views для паролей
 from django.contrib.auth import get_user_model, authenticate, login, logout, views as auth_views
 from django.utils.decorators import method_decorator
-from django.views.decorators.http import require_POST, require_http_methods
+from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 # Добавляем Http404 для ProfileDetailView и HttpResponseRedirect для login/register
 from django.http import HttpResponse, HttpResponseForbidden, HttpResponseRedirect, Http404
 from django.template.loader import render_to_string
 from django.contrib import messages
-from django.utils import timezone
 
 # Импорты моделей
+from . import graph
 from .models import Profile
 # Добавляем Category и Prefetch для оптимизации
-from posts.models import Post, Vote, Category, Comment
-from django.db.models import Count, Q, Prefetch # Убедимся, что Prefetch импортирован
-from django.contrib.contenttypes.models import ContentType
+from posts import asynchttp, votes
+from posts.asynchttp import aget_object_or_404
+from posts.conditional import ConditionalGetMixin
+from posts.models import Post, Category, Comment
+from django.db.models import Count, Max, Q, Prefetch # Убедимся, что Prefetch импортирован
 
 # Импортируем наши формы
 from .forms import UserUpdateForm, ProfileUpdateForm, UserLoginForm, UserRegistrationForm
@@ -84,20 +87,56 @@ def user_logout_view(request): # Переименовал для ясности
 
 
 # --- Просмотр профиля (добавим prefetch_related для постов) ---
-class ProfileDetailView(DetailView):
+class ProfileDetailView(ConditionalGetMixin, DetailView):
     model = Profile
     template_name = 'users/profile_detail.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'profile'
     slug_field = 'user__username'
     slug_url_kwarg = 'username'
 
     def get_queryset(self):
-        # Оптимизация: выбираем пользователя и предзагружаем подписки/подписчиков
-        # чтобы избежать N+1 запросов при подсчете в шаблоне или методах модели
-        return Profile.objects.select_related('user').prefetch_related(
-            'following', # Предзагрузка тех, на кого подписан
-            'followers'  # Предзагрузка подписчиков
-        ).all()
+        # Счетчики подписок/подписчиков - колонки профиля, списки загружать не нужно
+        return Profile.objects.select_related('user')
+
+    def get_object(self, queryset=None):
+        # Профиль нужен и валидаторам (get_validators), и самой странице - загружаем один раз
+        if getattr(self, '_profile', None) is None:
+            self._profile = super().get_object(queryset)
+        return self._profile
+
+    def get_mutual_ids(self):
+        """Профили из подписок зрителя, подписанные на этот профиль; None - зритель не может подписаться."""
+        if not hasattr(self, '_mutual_ids'):
+            # Нужны и валидаторам, и контексту - пересечение в Redis считается один раз на запрос
+            profile, viewing_user = self.get_object(), self.request.user
+            viewer_profile = getattr(viewing_user, 'profile', None) if viewing_user.is_authenticated else None
+            self._mutual_ids = None
+            if viewer_profile is not None and viewer_profile.pk != profile.pk:
+                self._mutual_ids = graph.followed_by_following(viewer_profile.pk, profile.pk)
+        return self._mutual_ids
+
+    def get_validators(self):
+        profile = self.get_object()
+        viewing_user = self.request.user
+        # Кнопка подписки и "подписаны из ваших подписок" - из графа в Redis
+        relation = None
+        mutual_ids = self.get_mutual_ids()
+        if mutual_ids is not None:
+            relation = (viewing_user.profile.is_following(profile), sorted(mutual_ids))
+        # Только ETag: Max(updated_at) не сдвигается, когда пост удаляют или скрывают
+        posts = Post.objects.get_visible_posts_for_user(
+            viewing_user, base_queryset=Post.objects.filter(author=profile.user)
+        ).aggregate(
+            count=Count('pk'), published=Count('pk', filter=Q(status=Post.STATUS_PUBLISHED)),
+            updated=Max('updated_at'), counters=Max('counters_updated_at'),
+        )
+        user = profile.user
+        parts = (
+            profile.pk, user.username, user.get_full_name(), profile.bio, str(profile.avatar),
+            profile.followers_count, profile.following_count, relation, posts,
+        )
+        return parts, []
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -117,6 +156,15 @@ class ProfileDetailView(DetailView):
 
         context['is_following'] = is_following
         context['can_follow'] = can_follow
+        # "На него подписаны ваши подписки": пересечение множеств в Redis, профили - одним запросом
+        context['followed_by_following'] = []
+        context['followed_by_following_more'] = 0
+        if can_follow and hasattr(viewing_user, 'profile'):
+            mutual_ids = self.get_mutual_ids()
+            if mutual_ids:
+                names = list(User.objects.filter(profile__pk__in=mutual_ids).order_by('username').values_list('username', flat=True)[:3])
+                context['followed_by_following'] = names
+                context['followed_by_following_more'] = len(mutual_ids) - len(names)
         context['requesting_user'] = viewing_user # Явно передаем для шаблона кнопки
 
         # Загрузка и фильтрация постов
@@ -131,28 +179,17 @@ class ProfileDetailView(DetailView):
             )
         except AttributeError:
              # Если метода нет, возвращаем только публичные посты (упрощенная логика)
-             visible_posts = user_posts_qs.filter(is_published=True, published_at__lte=timezone.now(), visibility=Post.VISIBILITY_PUBLIC)
+             visible_posts = user_posts_qs.filter(status=Post.STATUS_PUBLISHED, visibility=Post.VISIBILITY_PUBLIC)
              messages.warning(self.request, "Ошибка: не найден метод get_visible_posts_for_user. Отображаются только публичные посты.")
 
 
-        posts_with_counts = visible_posts.annotate(
-            likes_count=Count('votes', filter=Q(votes__vote_type=Vote.LIKE), distinct=True),
-            dislikes_count=Count('votes', filter=Q(votes__vote_type=Vote.DISLIKE), distinct=True),
-            comments_count=Count('comments', distinct=True)
-        ).order_by('-published_at', '-created_at')
+        # Счетчики голосов/комментариев - колонки Post, аннотации не нужны
+        posts_with_counts = visible_posts.order_by('-published_at', '-created_at')
 
         context['posts'] = posts_with_counts
 
         # Голоса текущего пользователя
-        user_votes = {}
-        visible_post_ids = [post.id for post in posts_with_counts]
-        if viewing_user.is_authenticated and visible_post_ids:
-            content_type = ContentType.objects.get_for_model(Post)
-            votes = Vote.objects.filter(
-                user=viewing_user, content_type=content_type, object_id__in=visible_post_ids
-            ).values('object_id', 'vote_type')
-            user_votes = {vote['object_id']: vote['vote_type'] for vote in votes}
-        context['user_votes'] = user_votes
+        context['user_votes'] = votes.user_votes(viewing_user, [post.id for post in posts_with_counts])
 
         context['title'] = f'Профиль {profile.user.username}'
         context['category'] = None
@@ -199,15 +236,24 @@ class ProfileUpdateView(View):
 
 
 # --- toggle_follow (УЛУЧШЕНО с OOB) ---
-@login_required
-@require_POST
-def toggle_follow_view(request, username): # Переименовал для ясности
-    user_to_toggle = get_object_or_404(User, username=username)
-    profile_to_toggle = get_object_or_404(Profile, user=user_to_toggle)
+def _toggle_follow(requesting_user_profile, profile_to_toggle):
+    # Статус - из графа подписок (без SQL); follow()/unfollow() идемпотентны, поэтому итоговое
+    # состояние верно, даже если граф отстал от БД
+    if requesting_user_profile.is_following(profile_to_toggle):
+        requesting_user_profile.unfollow(profile_to_toggle)
+        return False
+    requesting_user_profile.follow(profile_to_toggle)
+    return True
+
+
+@asynchttp.login_required
+@asynchttp.require_POST
+async def toggle_follow_view(request, username): # Переименовал для ясности
+    profile_to_toggle = await aget_object_or_404(Profile.objects.select_related('user'), user__username=username)
     requesting_user = request.user
 
     try:
-        requesting_user_profile = requesting_user.profile
+        requesting_user_profile = await Profile.objects.select_related('user').aget(user=requesting_user)
     except Profile.DoesNotExist:
          messages.error(request, "Произошла ошибка: ваш профиль не найден.")
          # Лучше вернуть ошибку для HTMX, чем редирект
@@ -217,15 +263,8 @@ def toggle_follow_view(request, username): # Переименовал для я
         messages.warning(request, "Вы не можете подписаться на самого себя.")
         return HttpResponse("Нельзя подписаться на себя", status=403) # Forbidden
 
-    is_currently_following = requesting_user_profile.is_following(profile_to_toggle)
-    new_following_status = False # Статус после выполнения действия
-
-    if is_currently_following:
-        requesting_user_profile.unfollow(profile_to_toggle)
-        new_following_status = False
-    else:
-        requesting_user_profile.follow(profile_to_toggle)
-        new_following_status = True
+    # Граф и транзакция подписки синхронные - один переход в поток
+    new_following_status = await sync_to_async(_toggle_follow)(requesting_user_profile, profile_to_toggle)
 
     # --- Подготовка контекста для рендеринга фрагментов ---
     button_context = {
@@ -240,15 +279,12 @@ def toggle_follow_view(request, username): # Переименовал для я
         request=request
     )
 
-    # --- Получаем ОБНОВЛЕННЫЕ счетчики ---
-    # Нужен refresh_from_db, чтобы получить актуальные M2M счетчики
-    profile_to_toggle.refresh_from_db()
-    requesting_user_profile.refresh_from_db()
-
+    # --- ОБНОВЛЕННЫЕ счетчики: колонки профиля, одно чтение по PK вместо COUNT ---
+    await profile_to_toggle.arefresh_from_db(fields=['followers_count'])
     # Счетчики профиля, на который/с которого подписались
-    followers_count_html = f'<span id="followers-count-{profile_to_toggle.user.username}">{profile_to_toggle.followers.count()}</span>'
-    # Счетчики профиля, который подписался/отписался
-    following_count_html = f'<span id="following-count-{requesting_user_profile.user.username}">{requesting_user_profile.following.count()}</span>'
+    followers_count_html = f'<span id="followers-count-{profile_to_toggle.user.username}">{profile_to_toggle.followers_count}</span>'
+    # Счетчики профиля, который подписался/отписался (уже сдвинут в памяти в follow()/unfollow())
+    following_count_html = f'<span id="following-count-{requesting_user_profile.user.username}">{requesting_user_profile.following_count}</span>'
 
     # --- Собираем OOB Swap ответ ---
     # Основной ответ - это кнопка (для hx-swap="outerHTML" по умолчанию)
@@ -272,6 +308,7 @@ class FollowingListView(ListView):
     """Отображает список пользователей, на которых подписан указанный пользователь."""
     model = Profile
     template_name = 'users/follow_list.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'profile_list'
     paginate_by = 20
 
@@ -295,15 +332,11 @@ class FollowingListView(ListView):
         following_status = {}
         current_user = self.request.user
         if current_user.is_authenticated and hasattr(current_user, 'profile'):
-            # Получаем PK профилей из текущей страницы пагинации
+            # Узнаем, на кого из профилей текущей страницы подписан пользователь (одна проверка в Redis)
             profile_pks_in_list = [p.pk for p in context['profile_list']]
-            if profile_pks_in_list:
-                # Узнаем, на кого из них подписан текущий пользователь
-                following_pks = current_user.profile.following.filter(
-                    pk__in=profile_pks_in_list
-                ).values_list('pk', flat=True)
-                # Создаем словарь {profile_pk: True} для удобной проверки в шаблоне
-                following_status = {pk: True for pk in following_pks}
+            following_pks = graph.following_among(current_user.profile.pk, profile_pks_in_list)
+            # Создаем словарь {profile_pk: True} для удобной проверки в шаблоне
+            following_status = {pk: True for pk in following_pks}
         context['current_user_following_status'] = following_status
 
         return context
@@ -312,6 +345,7 @@ class FollowersListView(ListView):
     """Отображает список пользователей, которые подписаны на указанного пользователя."""
     model = Profile
     template_name = 'users/follow_list.html'
+    replica_reads = True  # Чтения - с реплики (posts.replicas)
     context_object_name = 'profile_list'
     paginate_by = 20
 
@@ -336,11 +370,8 @@ class FollowersListView(ListView):
         current_user = self.request.user
         if current_user.is_authenticated and hasattr(current_user, 'profile'):
             profile_pks_in_list = [p.pk for p in context['profile_list']]
-            if profile_pks_in_list:
-                following_pks = current_user.profile.following.filter(
-                    pk__in=profile_pks_in_list
-                ).values_list('pk', flat=True)
-                following_status = {pk: True for pk in following_pks}
+            following_pks = graph.following_among(current_user.profile.pk, profile_pks_in_list)
+            following_status = {pk: True for pk in following_pks}
         context['current_user_following_status'] = following_status
 
         return context